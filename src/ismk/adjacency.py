@@ -0,0 +1,347 @@
+__author__ = "Johannes Köster"
+__copyright__ = "Copyright 2022, Johannes Köster"
+__email__ = "johannes.koester@uni-due.de"
+__license__ = "MIT"
+
+from collections.abc import ItemsView, MutableMapping, MutableSet, ValuesView
+from typing import Any, Dict, Iterator, List, Optional
+
+# Sentinel for edges that do not carry any file.
+_EMPTY = ()
+
+# Edges with more files store them in a set instead of a tuple, since adding a
+# file to a tuple copies it.
+MAX_TUPLE_FILES = 8
+
+_COLLECTIONS = (tuple, frozenset, set)
+
+
+def _as_files(value):
+    # Edge files are stored as a single file (the common case), as a tuple of
+    # up to MAX_TUPLE_FILES files, avoiding a set object per edge, or as a set.
+    if type(value) in _COLLECTIONS:
+        return value
+    return (value,)
+
+
+def _is_same(a, b):
+    # Compare by identity, equal paths may still differ in their flags.
+    if a is b:
+        return True
+    if type(a) is tuple and type(b) is tuple and len(a) == len(b):
+        return all(f is g for f, g in zip(a, b))
+    if type(a) is frozenset and type(b) is frozenset and len(a) == len(b):
+        return set(map(id, a)) == set(map(id, b))
+    return False
+
+
+class AdjacencyStore:
+    """Compact storage of the edges between the jobs of the DAG.
+
+    Jobs are mapped to dense integer ids, which are reused once a job is not
+    referenced anymore. For each direction, there is a dict from the ids of
+    its jobs (in insertion order) to a dict from the ids of the neighbors to
+    the files that are carried by the edge. The files of an edge are stored as
+    a single file, a tuple of files or, for edges with many files, a set. They
+    are shared between both directions of the edge unless they are a mutable
+    set. Views of a job must not be used after the job has been deleted.
+
+    The two directions are exposed via the views forward (dependencies) and
+    reverse (depending). They behave like the nested defaultdicts of sets used
+    before, i.e. accessing a missing job or edge creates it.
+
+    The version is incremented whenever a job or an edge is added or removed.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._ids: Dict[Any, int] = dict()
+        self._jobs: List[Any] = []
+        # number of views a job is part of plus number of edges pointing to it
+        self._refs: List[int] = []
+        # ids of jobs that have been forgotten
+        self._free: List[int] = []
+        self.forward = AdjacencyView(self)
+        self.reverse = AdjacencyView(self)
+        self.forward._other = self.reverse
+        self.reverse._other = self.forward
+
+    def _acquire(self, job) -> int:
+        try:
+            return self._ids[job]
+        except KeyError:
+            if self._free:
+                # The views keep their own insertion order, hence ids of
+                # forgotten jobs (e.g. replaced by checkpoints) can be reused.
+                i = self._free.pop()
+                self._jobs[i] = job
+            else:
+                i = len(self._jobs)
+                self._jobs.append(job)
+                self._refs.append(0)
+            self._ids[job] = i
+            return i
+
+    def _release(self, i: int):
+        self._refs[i] -= 1
+        if not self._refs[i]:
+            # not referenced anymore, forget the job
+            del self._ids[self._jobs[i]]
+            self._jobs[i] = None
+            self._free.append(i)
+
+
+class AdjacencyView(MutableMapping):
+    """One direction of the AdjacencyStore, mapping jobs to their neighbors."""
+
+    __slots__ = ("_store", "_adjacency", "_other")
+
+    def __init__(self, store: AdjacencyStore):
+        self._store = store
+        self._adjacency: Dict[int, Dict[int, Any]] = dict()
+        self._other: Optional["AdjacencyView"] = None
+
+    def _id(self, job) -> Optional[int]:
+        i = self._store._ids.get(job)
+        if i is None or i not in self._adjacency:
+            return None
+        return i
+
+    def __getitem__(self, job) -> "NeighborView":
+        i = self._store._acquire(job)
+        if i not in self._adjacency:
+            self._adjacency[i] = dict()
+            self._store._refs[i] += 1
+            self._store.version += 1
+        return NeighborView(self, i)
+
+    def get(self, job, default=None):
+        i = self._id(job)
+        if i is None:
+            return default
+        return NeighborView(self, i)
+
+    def __contains__(self, job) -> bool:
+        return self._id(job) is not None
+
+    def __delitem__(self, job):
+        i = self._id(job)
+        if i is None:
+            raise KeyError(job)
+        release = self._store._release
+        for j in self._adjacency.pop(i):
+            release(j)
+        self._store.version += 1
+        release(i)
+
+    def __setitem__(self, job, neighbors):
+        if job in self:
+            del self[job]
+        adjacent = self[job]
+        for neighbor, files in neighbors.items():
+            adjacent[neighbor].update(files)
+
+    def __iter__(self) -> Iterator:
+        jobs = self._store._jobs
+        for i in self._adjacency:
+            yield jobs[i]
+
+    def __len__(self) -> int:
+        return len(self._adjacency)
+
+
+class NeighborView(MutableMapping):
+    """The neighbors of a job in one direction, mapping them to the files
+    carried by the respective edge."""
+
+    __slots__ = ("_view", "_id")
+
+    def __init__(self, view: AdjacencyView, i: int):
+        self._view = view
+        self._id = i
+
+    @property
+    def _adjacent(self) -> Dict[int, Any]:
+        adjacent = self._view._adjacency.get(self._id)
+        if adjacent is None:
+            # the job has been deleted in the meantime, behave like a detached dict
+            return dict()
+        return adjacent
+
+    def __getitem__(self, job) -> "EdgeFiles":
+        store = self._view._store
+        j = store._acquire(job)
+        adjacent = self._adjacent
+        if j not in adjacent:
+            adjacent[j] = _EMPTY
+            store._refs[j] += 1
+            store.version += 1
+        return EdgeFiles(self._view, self._id, j)
+
+    def get(self, job, default=None):
+        j = self._view._store._ids.get(job)
+        if j is None or j not in self._adjacent:
+            return default
+        return EdgeFiles(self._view, self._id, j)
+
+    def __contains__(self, job) -> bool:
+        j = self._view._store._ids.get(job)
+        return j is not None and j in self._adjacent
+
+    def __delitem__(self, job):
+        j = self._view._store._ids.get(job)
+        if j is None or j not in self._adjacent:
+            raise KeyError(job)
+        del self._adjacent[j]
+        self._view._store.version += 1
+        self._view._store._release(j)
+
+    def __setitem__(self, job, files):
+        edge = self[job]
+        edge.clear()
+        edge.update(files)
+
+    def __iter__(self) -> Iterator:
+        jobs = self._view._store._jobs
+        for j in self._adjacent:
+            yield jobs[j]
+
+    def __len__(self) -> int:
+        return len(self._adjacent)
+
+    def items(self):
+        return _NeighborItems(self)
+
+    def values(self):
+        return _NeighborValues(self)
+
+    def __repr__(self):
+        return repr({job: set(files) for job, files in self.items()})
+
+
+class _NeighborItems(ItemsView):
+    def __iter__(self):
+        neighbors = self._mapping
+        view, i = neighbors._view, neighbors._id
+        jobs = view._store._jobs
+        for j in neighbors._adjacent:
+            yield jobs[j], EdgeFiles(view, i, j)
+
+
+class _NeighborValues(ValuesView):
+    def __iter__(self):
+        neighbors = self._mapping
+        view, i = neighbors._view, neighbors._id
+        for j in neighbors._adjacent:
+            yield EdgeFiles(view, i, j)
+
+
+class EdgeFiles(MutableSet):
+    """The set of files carried by an edge of the AdjacencyStore.
+
+    Both directions of an edge share the same files if they contain the same
+    file objects, which is the case for all edges created via the DAG. Edges
+    with more than MAX_TUPLE_FILES files are stored as a frozenset, which is
+    copied into a set of this direction once it is modified, such that adding
+    files one by one does not copy them each time.
+    """
+
+    __slots__ = ("_view", "_id", "_neighbor")
+
+    def __init__(self, view: AdjacencyView, i: int, neighbor: int):
+        self._view = view
+        self._id = i
+        self._neighbor = neighbor
+
+    @classmethod
+    def _from_iterable(cls, it):
+        return set(it)
+
+    def _get(self):
+        adjacent = self._view._adjacency.get(self._id)
+        if adjacent is None:
+            return _EMPTY
+        return adjacent.get(self._neighbor, _EMPTY)
+
+    def _set(self, value):
+        adjacent = self._view._adjacency.get(self._id)
+        if adjacent is None or self._neighbor not in adjacent:
+            # edge has been deleted in the meantime
+            return
+        other = self._view._other._adjacency.get(self._neighbor)
+        if other is not None and type(value) is not set:
+            other_value = other.get(self._id)
+            if other_value is not None and _is_same(other_value, value):
+                # share the files with the other direction of the edge
+                value = other_value
+        adjacent[self._neighbor] = value
+
+    def __contains__(self, f) -> bool:
+        return f in _as_files(self._get())
+
+    def __iter__(self):
+        files = self._get()
+        if type(files) is set:
+            # the set may be modified while iterating
+            return iter(tuple(files))
+        return iter(_as_files(files))
+
+    def __len__(self) -> int:
+        return len(_as_files(self._get()))
+
+    def add(self, f):
+        files = _as_files(self._get())
+        if f in files:
+            return
+        if type(files) is set:
+            files.add(f)
+        elif len(files) < MAX_TUPLE_FILES:
+            self._set(files + (f,) if files else f)
+        else:
+            files = set(files)
+            files.add(f)
+            self._set(files)
+
+    def discard(self, f):
+        files = _as_files(self._get())
+        if f not in files:
+            return
+        if type(files) is set:
+            files.discard(f)
+            return
+        files = tuple(f_ for f_ in files if f_ != f)
+        self._set(self._pack(files))
+
+    def update(self, *others):
+        files = _as_files(self._get())
+        if type(files) is set:
+            for other in others:
+                files.update(other)
+            return
+        present = set(files)
+        new = list(files)
+        for other in others:
+            for f in other:
+                if f not in present:
+                    present.add(f)
+                    new.append(f)
+        if len(new) != len(files):
+            self._set(self._pack(new))
+
+    @staticmethod
+    def _pack(files):
+        if len(files) == 1:
+            return files[0]
+        if len(files) > MAX_TUPLE_FILES:
+            return frozenset(files)
+        return tuple(files)
+
+    def clear(self):
+        if self._get():
+            self._set(_EMPTY)
+
+    def copy(self):
+        return set(self)
+
+    def __repr__(self):
+        return repr(set(self))
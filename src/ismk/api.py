@@ -733,6 +733,11 @@ class DAGApi(ApiBase):
         """Cleanup the metadata of the workflow."""
         self.workflow_api._workflow.cleanup_metadata(paths)
 
+    @_no_exec
+    def migrate_metadata(self, backend: str):
+        """Move the metadata of the workflow to the given backend."""
+        self.workflow_api._workflow.migrate_metadata(backend)
+
     @_no_exec
     def conda_cleanup_envs(self):
         """Cleanup the conda environments of the workflow."""
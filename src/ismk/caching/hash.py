@@ -11,6 +11,8 @@ from ismk.jobs import Job
 from ismk import script
 from ismk import wrapper
 from ismk.exceptions import WorkflowError
+from ismk.io import checksums
+from ismk.io.checksums import DEFAULT_CHECKSUM_ALGORITHM, get_checksum_algorithm
 from ismk.settings.types import DeploymentMethod
 
 # ATTENTION: increase version number whenever the hashing algorithm below changes!
@@ -106,8 +108,9 @@ class ProvenanceHashMap:
                 )
 
         # Hash input files that are not generated by other jobs (sorted by hash value).
+        checksum_algorithm = job.dag.workflow.dag_settings.checksum_algorithm
         for file_hash in sorted(
-            hash_file(f)
+            hash_file(f, checksum_algorithm)
             for f in job.input
             if not any(f in depfiles for depfiles in job.dag.dependencies[job].values())
         ):
@@ -148,10 +151,9 @@ class ProvenanceHashMap:
         return provenance_hash
 
 
-def hash_file(f):
-    h = hashlib.sha256()
-    with open(f, "rb") as f:
-        # Read and update hash string value in blocks of 4K
-        for byte_block in iter(lambda: f.read(4096), b""):
-            h.update(byte_block)
-    return h.hexdigest()
+def hash_file(f, algorithm=DEFAULT_CHECKSUM_ALGORITHM):
+    file_hash = checksums.hash_file(f, get_checksum_algorithm(algorithm))
+    if algorithm != DEFAULT_CHECKSUM_ALGORITHM:
+        # never equal to the hash of another algorithm
+        file_hash = f"{algorithm}:{file_hash}"
+    return file_hash
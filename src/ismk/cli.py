@@ -73,6 +73,8 @@ from ismk.settings.enums import (
     PrintDag,
 )
 from ismk.target_jobs import parse_target_jobs_cli_args
+from ismk.io.checksums import DEFAULT_CHECKSUM_ALGORITHM
+from ismk.persistence_backends import METADATA_BACKENDS
 from ismk.utils import available_cpu_count, update_config
 from ismk.scheduling.milp import SchedulerSettings as MILPSchedulerSettings
 
@@ -1140,6 +1142,14 @@ def get_argument_parser(profiles=None):
         "of given files. That means that ismk removes any tracked "
         "version info, and any marks that files are incomplete.",
     )
+    group_utils.add_argument(
+        "--migrate-metadata",
+        choices=list(METADATA_BACKENDS),
+        metavar="BACKEND",
+        help="Move the metadata of all output files and the markers of incomplete "
+        "files to the given backend (see --metadata-backend), which is used by "
+        "all later runs in this working directory.",
+    )
     group_utils.add_argument(
         "--cleanup-shadow",
         action="store_true",
@@ -1214,6 +1224,16 @@ def get_argument_parser(profiles=None):
         "Provenance-information based reports (e.g. `--report` and the "
         "`--list_x_changes` functions) will be empty or incomplete.",
     )
+    group_utils.add_argument(
+        "--metadata-journal",
+        action="store_true",
+        help="Write the metadata of finished jobs to an append-only journal "
+        "in the background, from which it is stored with the chosen "
+        "--metadata-backend. This way, finishing many short jobs does not wait "
+        "for writing their metadata. Outputs are marked as incomplete until "
+        "their metadata is durable in the journal, and the journal of an "
+        "interrupted run is applied by the next run. Not supported on Windows.",
+    )
     group_utils.add_argument("--version", "-v", action="version", version=__version__)
 
     group_output = parser.add_argument_group("OUTPUT")
@@ -1274,6 +1294,16 @@ def get_argument_parser(profiles=None):
     group_behavior.add_argument(
         "--nolock", action="store_true", help="Do not lock the working directory"
     )
+    group_behavior.add_argument(
+        "--fine-grained-locks",
+        action="store_true",
+        help="Instead of locking all input and output files of the workflow "
+        "at once, lock the files of each job while it runs. This way, "
+        "multiple SMK processes working on disjoint files can run in the same "
+        "working directory at the same time. Jobs whose files are locked by "
+        "another process wait until they are released. Processes without this "
+        "flag still lock all their files at once. Only supported on Linux.",
+    )
     group_behavior.add_argument(
         "--ignore-incomplete",
         "--ii",
@@ -1291,17 +1321,78 @@ def get_argument_parser(profiles=None):
         "network file systems. Hence, we do not spend more than a given amount of time and fall back "
         "to individual checks for the rest.",
     )
+    group_behavior.add_argument(
+        "--max-expansion-concurrency",
+        type=int,
+        default=1,
+        metavar="N",
+        help="While building the DAG, query the inventory of the input files of a "
+        "job (see --max-inventory-time) and the existence of those input files that "
+        "no rule can produce for up to N files concurrently. This helps if such "
+        "queries block on I/O, e.g. on network file systems or remote storage. "
+        "Producers of input files are still determined (and input functions "
+        "evaluated) one after another. By default, all input files are queried one "
+        "after another.",
+    )
+    group_behavior.add_argument(
+        "--max-stat-threads",
+        type=int,
+        default=8,
+        metavar="N",
+        help="Use up to N threads for obtaining modification times and existence of "
+        "local files when determining which jobs need to be executed. Files are "
+        "grouped by directory, and directories with many requested files are listed "
+        "at once. This helps on network file systems, where every file system query "
+        "has a high latency. The same number of threads is used for loading the "
+        "inventory of previous runs and for reading the metadata records of the "
+        "output files of the jobs.",
+    )
     group_behavior.add_argument(
         "--trust-io-cache",
         action="store_true",
         help=(
-            "Tell SMK to assume that all input and output file existence and modification "
-            "time queries performed in previous dryruns are still valid and therefore don't have to "
-            "be repeated. This can lead to speed-ups, but implies that input and output have not "
-            "been modified manually in between. Non dry-run execution will automatically "
-            "invalidate the cache and lead to redoing the queries."
+            "SMK keeps an inventory of file existence, modification times and sizes of "
+            "previous runs in the .ismk directory. Existence information is reused as long "
+            "as the containing directory has not been modified. With this flag, SMK "
+            "additionally assumes that the recorded modification times and sizes of such "
+            "files are still valid and therefore don't have to be queried again. This can "
+            "lead to speed-ups, but implies that input and output files have not been "
+            "modified in place manually in between."
         ),
     )
+    group_behavior.add_argument(
+        "--watch-io-cache",
+        action="store_true",
+        help="Keep the cache of file existence, modification times and sizes active "
+        "while jobs are running, instead of querying the file system again for "
+        "every file. The directories of the cached files are watched for changes "
+        "with inotify (on Linux) or by polling their modification times. With "
+        "polling (used for non-local executors), only files that are created, "
+        "deleted or replaced are noticed, apart from the declared output, log and "
+        "benchmark files of finished jobs. This can lead to speed-ups for long "
+        "runs with checkpoints, where the DAG is updated repeatedly.",
+    )
+    group_behavior.add_argument(
+        "--dag-snapshot",
+        action="store_true",
+        help="Persist the result of the DAG construction in the .ismk directory "
+        "and reuse it in subsequent invocations with identical workflow sources, "
+        "config and targets. Before reuse, the snapshot is validated against the "
+        "current state of the file system and discarded if anything it depends "
+        "on has changed.",
+    )
+    group_behavior.add_argument(
+        "--pipelined-expansion",
+        action="store_true",
+        help="Start executing jobs while the DAG is still being built. Jobs are "
+        "handed over to the scheduler as soon as their upstream part of the DAG "
+        "has been fully resolved and they are certain to be needed. If the DAG "
+        "cannot be completed, the jobs that have already been started are "
+        "finished before the error is reported. Not supported for dry-runs, "
+        "checkpoints, --until, --omit-from, --batch, --allowed-rules, "
+        "--dag-snapshot and --immediate-submit. In such cases, the DAG is "
+        "built before execution as usual.",
+    )
     group_behavior.add_argument(
         "--max-checksum-file-size",
         default=1000000,
@@ -1313,6 +1404,29 @@ def get_argument_parser(profiles=None):
             "unit, e.g. 1MB, which is also the default). "
         ),
     )
+    group_behavior.add_argument(
+        "--checksum-algorithm",
+        default=DEFAULT_CHECKSUM_ALGORITHM,
+        metavar="sha256|blake2b|xxh3_128",
+        help="Algorithm for the checksums of input files that are recorded in the "
+        "metadata of output files, and for hashing input files for the between "
+        "workflow cache. sha256 is fast on CPUs with SHA extensions, blake2b is "
+        "faster on CPUs without them. xxh3_128 (requires the xxhash package, "
+        "which is installed with the xxhash extra of ismk) is much faster than "
+        "both but not a cryptographic hash. Checksums recorded "
+        "with different algorithms are never compared with each other.",
+    )
+    group_behavior.add_argument(
+        "--metadata-backend",
+        choices=list(METADATA_BACKENDS),
+        help="Where the metadata of output files and the markers of incomplete "
+        "files are stored. files (the default) writes one file per output file "
+        "to .ismk/metadata. sqlite keeps them in a single database "
+        "(.ismk/metadata.sqlite), which is much faster for many output files, "
+        "but requires all ismk processes using the working directory to run on "
+        "the same host. If not given, sqlite is used if its database exists. "
+        "Use --migrate-metadata to move existing metadata to another backend.",
+    )
     group_behavior.add_argument(
         "--latency-wait",
         "--output-wait",
@@ -2117,8 +2231,15 @@ def args_to_api(args, parser):
                             allowed_rules=args.allowed_rules,
                             rerun_triggers=args.rerun_triggers,
                             max_inventory_wait_time=args.max_inventory_time,
+                            max_expansion_concurrency=args.max_expansion_concurrency,
+                            max_stat_threads=args.max_stat_threads,
                             trust_io_cache=args.trust_io_cache,
+                            watch_io_cache=args.watch_io_cache,
+                            dag_snapshot=args.dag_snapshot,
+                            pipelined_expansion=args.pipelined_expansion,
                             max_checksum_file_size=args.max_checksum_file_size,
+                            checksum_algorithm=args.checksum_algorithm,
+                            metadata_backend=args.metadata_backend,
                             strict_evaluation=args.strict_dag_evaluation,
                             print_dag_as=print_dag_as,
                         ),
@@ -2161,6 +2282,8 @@ def args_to_api(args, parser):
                         dag_api.unlock()
                     elif args.cleanup_metadata:
                         dag_api.cleanup_metadata(args.cleanup_metadata)
+                    elif args.migrate_metadata:
+                        dag_api.migrate_metadata(args.migrate_metadata)
                     elif args.conda_cleanup_envs:
                         dag_api.conda_cleanup_envs()
                     elif args.conda_create_envs_only:
@@ -2198,6 +2321,7 @@ def args_to_api(args, parser):
                                 standalone=True,
                                 ignore_ambiguity=args.allow_ambiguity,
                                 lock=not args.nolock,
+                                fine_grained_locks=args.fine_grained_locks,
                                 ignore_incomplete=args.ignore_incomplete,
                                 latency_wait=args.latency_wait,
                                 wait_for_files=wait_for_files,
@@ -2208,6 +2332,7 @@ def args_to_api(args, parser):
                                 shadow_prefix=args.shadow_prefix,
                                 keep_incomplete=args.keep_incomplete,
                                 keep_metadata=not args.drop_metadata,
+                                metadata_journal=args.metadata_journal,
                                 edit_notebook=edit_notebook,
                                 cleanup_scripts=not args.skip_script_cleanup,
                                 queue_input_wait_time=args.queue_input_wait_time,
@@ -42,6 +42,7 @@ from ismk.common import (
     func_true,
     group_into_chunks,
     is_local_file,
+    NOTHING_TO_BE_DONE_MSG,
 )
 from ismk.settings.enums import RerunTrigger, StrictDagEvaluation
 from ismk.deployment import singularity
@@ -70,7 +71,6 @@ from ismk.io import (
     is_callable,
     is_flagged,
     wait_for_files,
-    IOCacheLoadError,
 )
 from ismk.jobs import (
     AbstractJob,
@@ -79,15 +79,31 @@ from ismk.jobs import (
     Job,
     JobFactory,
     Reason,
+    jobfiles,
 )
 from ismk.settings.types import SharedFSUsage
 from ismk.logging import logger
 from ismk.output_index import OutputIndex
+from ismk.adjacency import AdjacencyStore
+from ismk.dag_snapshot import DAGSnapshot, DAGSnapshotRecorder, snapshot_key
+from ismk.io.checksums import CHECKSUM_ALGORITHMS
+from ismk.io.watcher import create_watcher
+from ismk.dag_expansion import (
+    ExpansionLink,
+    MAX_EXPANSION_DEPTH,
+    ExpansionStack,
+    FrameReturn,
+    PipelinedExpansion,
+)
 from ismk.sourcecache import LocalSourceFile, SourceFile
 from ismk.settings.enums import ChangeType
 
 PotentialDependency = namedtuple("PotentialDependency", ["file", "jobs", "known"])
 
+# Maximum time (in seconds) a pipelined expansion is advanced before control is
+# returned to the scheduler (see DAG.advance_expansion).
+PIPELINED_EXPANSION_TIMESLICE = 0.2
+
 
 def toposort(graph):
     from graphlib import TopologicalSorter
@@ -127,10 +143,16 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
     ):
         self._deferred_temp_jobs = []
         self._queue_input_jobs = None
-        self._dependencies: Mapping[Job, Mapping[Job, Set[str]]] = defaultdict(
-            partial(defaultdict, set)
+        # Both directions of the edges between jobs, behaving like nested
+        # defaultdicts of sets.
+        self._adjacency = AdjacencyStore()
+        self._dependencies: Mapping[Job, Mapping[Job, Set[str]]] = (
+            self._adjacency.forward
         )
-        self.depending = defaultdict(partial(defaultdict, set))
+        self.depending = self._adjacency.reverse
+        self._pipe_group_version = 0
+        self._toposorted_cache = dict()
+        self._toposorted_version = None
         self._needrun = set()
         self._checkpoint_jobs = set()
         self._priority = dict()
@@ -165,7 +187,11 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
         self.max_checksum_file_size = self.workflow.dag_settings.max_checksum_file_size
         self._checked_jobs = set()
         self._checked_needrun_jobs = set()
+        # jobs whose needrun status has been determined by update_needrun
+        self._needrun_evaluated = set()
         self._seen_outputs: Dict[str, Union[Job, GroupJob]] = dict()
+        self._snapshot_recorder: Optional[DAGSnapshotRecorder] = None
+        self._expansion: Optional[PipelinedExpansion] = None
 
         self.job_factory = JobFactory()
         self.group_job_factory = GroupJobFactory()
@@ -225,68 +251,263 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
     def batch(self):
         return self.workflow.dag_settings.batch
 
-    async def init(self, progress=False):
-        """Initialise the DAG."""
-        if self.workflow.dag_settings.trust_io_cache:
-            # The user declares that we can trust the iocache,
-            # so we load it from the persisted version.
-            try:
-                self.workflow.persistence.load_iocache()
-            except IOCacheLoadError:
-                logger.info(
-                    "Most recently saved inventory has mismatched version. Removing."
-                )
-                self.workflow.persistence.drop_iocache()
+    async def init(self, progress=False, pipelined=False):
+        """Initialise the DAG.
+
+        If pipelined is True, the expansion is only prepared here. It is then
+        driven via advance_expansion, while the jobs of subgraphs that are
+        already fully resolved can be executed (see --pipelined-expansion).
+        """
+        if self.workflow.is_main_process:
+            # Reuse the inventory of previous runs. If the user declares that we
+            # can trust it, this includes mtimes and sizes.
+            self.workflow.persistence.load_iocache(
+                trust=self.workflow.dag_settings.trust_io_cache,
+                n_threads=self.workflow.dag_settings.max_stat_threads,
+            )
+
+        if pipelined:
+            self._expansion = PipelinedExpansion(
+                self._init_targetjobs_frame(progress=progress)
+            )
+            return
+
+        snapshot_restored = False
+        if self.workflow.dag_settings.dag_snapshot and self.workflow.is_main_process:
+            key = snapshot_key(self)
+            snapshot = self.workflow.persistence.load_dag_snapshot()
+            if snapshot is not None and snapshot.key == key:
+                snapshot_restored = await self.restore_snapshot(snapshot)
+                if snapshot_restored:
+                    logger.info("Restored DAG from snapshot.")
+                else:
+                    logger.info("DAG snapshot is outdated, rebuilding DAG.")
+            if not snapshot_restored:
+                self._snapshot_recorder = DAGSnapshotRecorder(key)
+
+        if not snapshot_restored:
+            await self._init_targetjobs(progress=progress)
+
+        self.cleanup()
+
+        if self._snapshot_recorder is not None:
+            snapshot = self._snapshot_recorder.snapshot(
+                self,
+                forced_targetjobs=[
+                    job
+                    for job in self.targetjobs
+                    if job.output and all(f in self.forcefiles for f in job.output)
+                ],
+            )
+            if snapshot is not None:
+                self.workflow.persistence.save_dag_snapshot(snapshot)
+            else:
+                self.workflow.persistence.drop_dag_snapshot()
+            self._snapshot_recorder = None
+
+        await self.check_incomplete()
+
+        self.update_container_imgs()
+        self.update_conda_envs()
+
+        await self.update_needrun(create_inventory=True)
+        # The iocache is now up-to-date and can be persisted for future runs.
+        # Files changed by jobs are updated afterwards (see Persistence.finished).
+        self.workflow.persistence.save_iocache()
+
+        self.set_until_jobs()
+        self.delete_omitfrom_jobs()
+        self.update_jobids()
 
+        self.check_directory_outputs()
+
+    async def _init_targetjobs(self, progress=False):
+        """Expand the DAG from the target rules, files and jobs."""
+        await self._expand(self._init_targetjobs_frame(progress=progress))
+
+    async def _init_targetjobs_frame(self, progress=False):
+        """Expansion frame adding the target rules, files and jobs to the DAG
+        (see DAG._expand)."""
         for job in [await self.rule2job(rule) for rule in self.targetrules]:
-            job = await self.update([job], progress=progress, create_inventory=True)
+            job = yield self._update_frame(
+                [job], path=set(), progress=progress, create_inventory=True
+            )
             self.targetjobs.add(job)
 
         for file in self.targetfiles:
-            job = await self.update(
+            job = yield self._update_frame(
                 await self.file2jobs(file),
                 file=file,
+                path=set(),
                 progress=progress,
                 create_inventory=True,
             )
             self.targetjobs.add(job)
 
         for spec in self.workflow.dag_settings.target_jobs:
-            job = await self.update(
-                [
-                    await self.new_job(
-                        self.workflow.get_rule(spec.rulename),
-                        wildcards_dict=spec.wildcards_dict,
-                    )
-                ],
-                progress=progress,
-                create_inventory=True,
+            job = await self.new_job(
+                self.workflow.get_rule(spec.rulename),
+                wildcards_dict=spec.wildcards_dict,
             )
-            self.targetjobs.add(job)
+            # Forced before the expansion, such that a pipelined expansion
+            # knows that the job has to be executed.
             self.forcefiles.update(job.output)
+            job = yield self._update_frame(
+                [job], path=set(), progress=progress, create_inventory=True
+            )
+            self.targetjobs.add(job)
 
-        self.cleanup()
+    @property
+    def is_expanding(self):
+        """Whether a pipelined expansion (see init) is still ongoing."""
+        return self._expansion is not None and not self._expansion.failed
+
+    def advance_expansion(self, timeslice=PIPELINED_EXPANSION_TIMESLICE):
+        """Advance the pipelined expansion (see init).
+
+        Control is returned after the given number of seconds, or earlier if
+        jobs are ready while none is running. Once the expansion is complete,
+        the DAG is postprocessed as usual. Exceptions of the expansion are
+        raised. Afterwards, the jobs that have already been committed may still
+        be finished, but no further jobs become ready.
+        """
+        expansion = self._expansion
+        deadline = time.monotonic() + timeslice
 
-        await self.check_incomplete()
+        def pause():
+            return time.monotonic() >= deadline or (
+                self._ready_jobs and not self._running
+            )
+
+        try:
+            expansion.run(self._advance_expansion(expansion, pause))
+        except BaseException:
+            # keep the expansion, such that temp files are still not deleted
+            self._expansion = expansion
+            expansion.failed = True
+            expansion.close()
+            raise
+        if self._expansion is None:
+            expansion.close()
+
+    async def _advance_expansion(self, expansion, pause):
+        await expansion.stack.advance(pause=pause)
+        if expansion.stack.done:
+            expansion.stack.result()
+            self._expansion = None
+            await self._complete_expansion(expansion.committed)
+
+    def release_iocache(self):
+        """From now on, files are modified by running jobs. Hence, deactivate the
+        IOCache such that we always get updated size, existence and mtime
+        information, unless it shall be kept valid by watching the file system
+        (see --watch-io-cache)."""
+        iocache = self.workflow.iocache
+        if self.workflow.dag_settings.watch_io_cache and iocache.active:
+            # inotify does not see modifications made on other hosts
+            iocache.watch(create_watcher(iocache, notify=self.workflow.local_exec))
+        else:
+            iocache.deactivate()
+
+    async def _complete_expansion(self, committed):
+        """Postprocess the DAG after a pipelined expansion (see init), while the
+        committed jobs may already be running or finished."""
+        self.cleanup()
+        uncommitted = [job for job in self.jobs if job not in committed]
+        await self.check_incomplete(uncommitted)
 
         self.update_container_imgs()
         self.update_conda_envs()
 
-        await self.update_needrun(create_inventory=True)
-        if self.workflow.dryrun:
-            # The iocache is now up-to-date and can be persisted for future
-            # non-dry-runs.
-            self.workflow.persistence.save_iocache()
+        await self._update_input_from_committed(uncommitted, committed)
+        await self.update_needrun(
+            create_inventory=self.workflow.iocache.active, jobs=uncommitted
+        )
+        self.workflow.persistence.save_iocache()
+        self.update_jobids()
+        self.check_directory_outputs()
+
+        # From now on, we always want to see updates (see Workflow.execute).
+        if self.workflow.iocache.watcher is None:
+            self.release_iocache()
+        self.workflow.persistence.deactivate_cache()
+
+        await self.postprocess(update_needrun=False, changed_jobs=[])
+        uncommitted = [job for job in self.jobs if job not in committed]
+        self.workflow.persistence.extend_lock(
+            jobfiles(uncommitted, "input"),
+            jobfiles(filter(self.needrun, uncommitted), "output"),
+        )
+        self._queue_input_jobs = None
+
+        deployment_method = self.workflow.deployment_settings.deployment_method
+        if DeploymentMethod.APPTAINER in deployment_method:
+            self.pull_container_imgs()
+        if DeploymentMethod.CONDA in deployment_method:
+            self.create_conda_envs()
+
+        if not self.checkpoint_jobs:
+            for job in self._deferred_temp_jobs:
+                await self.handle_temp(job)
+            self._deferred_temp_jobs.clear()
+
+        self.workflow.log_rulegraph()
+        if len(self):
+            stats_msg, stats_dict = self.stats()
+            logger.info(
+                stats_msg, extra=dict(event=LogEvent.RUN_INFO, stats=stats_dict)
+            )
         else:
-            # The iocache is now up-to-date, but it's not a dry run,
-            # so we shouldn't trust the previously persisted version.
-            self.workflow.persistence.drop_iocache()
+            logger.info(NOTHING_TO_BE_DONE_MSG)
 
-        self.set_until_jobs()
-        self.delete_omitfrom_jobs()
-        self.update_jobids()
+    async def restore_snapshot(self, snapshot: DAGSnapshot) -> bool:
+        """Restore the DAG from the given snapshot (see --dag-snapshot).
 
-        self.check_directory_outputs()
+        All recorded jobs are recreated and validated against the current state of
+        the file system before the DAG is touched. Returns False if the snapshot
+        is no longer valid.
+        """
+        jobs = []
+        for record in snapshot.jobs:
+            try:
+                job = await self.job_factory.new(
+                    self.workflow.get_rule(record.rule),
+                    self,
+                    wildcards_dict=record.wildcards,
+                    targetfile=record.targetfile,
+                )
+            except (WorkflowError, RuleException):
+                return False
+            if list(map(str, job.input)) != record.input:
+                # input functions evaluate differently now
+                return False
+            jobs.append(job)
+
+        for job in jobs:
+            for f in job.input:
+                await f.inventory()
+
+        for f, i, exists in snapshot.probes:
+            job = jobs[i]
+            iofile = next((f_ for f_ in job.input if str(f_) == f), None)
+            if iofile is None or await iofile.exists() != exists:
+                return False
+
+        for i in snapshot.kept:
+            # ensure that jobs without dependencies are part of the DAG as well
+            self._dependencies[jobs[i]]
+        for i, j, files in snapshot.edges:
+            job, dep = jobs[i], jobs[j]
+            files = set(files)
+            files = {f for f in job.input if str(f) in files}
+            self._dependencies[job][dep].update(files)
+            self.depending[dep][job].update(files)
+        for job in jobs:
+            self.cache_job(job)
+        self.targetjobs.update(jobs[i] for i in snapshot.targetjobs)
+        for i in snapshot.forced_targetjobs:
+            self.forcefiles.update(jobs[i].output)
+        return True
 
     def get_unneeded_temp_files(self, job: Union[Job, GroupJob]) -> Iterable[str]:
         def get_files(job, group_job=None):
@@ -321,8 +542,8 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
     def checkpoint_jobs(self):
         return self._checkpoint_jobs
 
-    def update_jobids(self):
-        for job in self.jobs:
+    def update_jobids(self, jobs=None):
+        for job in self.jobs if jobs is None else jobs:
             if job not in self._jobid:
                 self._jobid[job] = len(self._jobid)
 
@@ -367,11 +588,11 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
             except KeyError:
                 pass
 
-    def update_conda_envs(self):
+    def update_conda_envs(self, jobs=None):
         # First deduplicate based on job.conda_env_spec
         env_set = {
             (job.conda_env_spec, job.container_img_url)
-            for job in self.jobs
+            for job in (self.jobs if jobs is None else jobs)
             if job.conda_env_spec
             and (
                 job.is_local
@@ -524,10 +745,18 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
                                 f.remove(remove_non_empty_dir=True, only_local=True)
                             )
 
-    def create_conda_envs(self, dryrun=False, quiet=False):
+    def create_conda_envs(self, dryrun=False, quiet=False, jobs=None):
         dryrun |= self.workflow.dryrun
         touch = self.workflow.touch
-        for env in self.conda_envs.values():
+        if jobs is None:
+            envs = self.conda_envs.values()
+        else:
+            envs = {
+                self.conda_envs[key]
+                for key in {(job.conda_env_spec, job.container_img_url) for job in jobs}
+                if key in self.conda_envs
+            }
+        for env in envs:
             if (
                 not touch
                 and (not dryrun or not quiet)
@@ -535,11 +764,11 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
             ):
                 env.create(self.workflow.dryrun)
 
-    def update_container_imgs(self):
+    def update_container_imgs(self, jobs=None):
         # First deduplicate based on job.conda_env_spec
         img_set = {
             (job.container_img_url, job.is_containerized)
-            for job in self.jobs
+            for job in (self.jobs if jobs is None else jobs)
             if job.container_img_url
         }
 
@@ -548,8 +777,16 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
                 img = singularity.Image(img_url, self, is_containerized)
                 self.container_imgs[img_url] = img
 
-    def pull_container_imgs(self, quiet=False):
-        for img in self.container_imgs.values():
+    def pull_container_imgs(self, quiet=False, jobs=None):
+        if jobs is None:
+            imgs = self.container_imgs.values()
+        else:
+            imgs = {
+                self.container_imgs[job.container_img_url]
+                for job in jobs
+                if job.container_img_url
+            }
+        for img in imgs:
             if not self.workflow.touch and (not self.workflow.dryrun or not quiet):
                 img.pull(self.workflow.dryrun)
 
@@ -557,11 +794,11 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
         """Update the OutputIndex."""
         self.output_index = OutputIndex(self.rules)
 
-    async def check_incomplete(self):
-        """Check if any output files are incomplete. This is done by looking up
-        markers in the persistence module."""
+    async def check_incomplete(self, jobs=None):
+        """Check if any output files (of the given jobs) are incomplete. This is
+        done by looking up markers in the persistence module."""
         if not self.ignore_incomplete:
-            incomplete_files = await self.incomplete_files()
+            incomplete_files = await self.incomplete_files(jobs)
             if any(incomplete_files):
                 if self.workflow.dag_settings.force_incomplete:
                     self.forcefiles.update(incomplete_files)
@@ -657,10 +894,10 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
         """Return the files a job requests."""
         return set(*self.depending[job].values())
 
-    async def incomplete_files(self):
+    async def incomplete_files(self, jobs=None):
         """Yield incomplete files."""
         incomplete = list()
-        for job in filterfalse(self.needrun, self.jobs):
+        for job in filterfalse(self.needrun, self.jobs if jobs is None else jobs):
             incomplete.extend(
                 [
                     job
@@ -1112,16 +1349,81 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
         self,
         jobs,
         file=None,
-        visited=None,
         known_producers=None,
         progress=False,
         create_inventory=False,
     ):
         """Update the DAG by adding given jobs and their dependencies."""
-        if visited is None:
-            visited = set()
+        return await self._expand(
+            self._update_frame(
+                jobs,
+                file=file,
+                path=set(),
+                known_producers=known_producers,
+                progress=progress,
+                create_inventory=create_inventory,
+            )
+        )
+
+    async def update_(
+        self,
+        job,
+        known_producers=None,
+        progress=False,
+        create_inventory=False,
+    ):
+        """Update the DAG by adding the given job and its dependencies."""
+        await self._expand(
+            self._update_job_frame(
+                job,
+                path=set(),
+                known_producers=known_producers,
+                progress=progress,
+                create_inventory=create_inventory,
+            )
+        )
+
+    async def _expand(self, frame):
+        """Drive the given DAG expansion frame and all frames it requests
+        (see ExpansionStack).
+
+        Since frames are kept on an explicit stack instead of being awaited
+        recursively, arbitrarily deep dependency chains do not hit the
+        Python recursion limit.
+        """
+        stack = ExpansionStack(frame)
+        await stack.advance()
+        return stack.result()
+
+    async def _update_frame(
+        self,
+        jobs,
+        file=None,
+        path=None,
+        known_producers=None,
+        progress=False,
+        create_inventory=False,
+    ):
+        """Expansion frame selecting the producer of the given file among the
+        given candidate jobs (see DAG._expand).
+
+        The given path contains all jobs that are currently expanded above this
+        frame. It is shared by all frames of an expansion instead of being
+        copied into each of them.
+        """
         if known_producers is None:
             known_producers = dict()
+        if path is not None and len(path) >= MAX_EXPANSION_DEPTH:
+            raise WorkflowError(
+                f"The dependencies of a job form a chain of more than "
+                f"{MAX_EXPANSION_DEPTH} jobs. This is likely due to a cyclic "
+                "dependency. E.g. you might have a sequence of rules that "
+                "can generate their own input. Try to make "
+                "the output files more specific. "
+                "A common pattern is to have different prefixes "
+                "in the output files of different rules."
+                + (f"\nProblematic file pattern: {file}" if file else "")
+            )
         producers = []
         exceptions = list()
         cycles = list()
@@ -1137,6 +1439,11 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
                 if job is not pivot_job and job not in discarded_jobs
             )
 
+        trace = None
+        if self._expansion is not None:
+            trace = self._expansion.trace
+            link = await self._expansion_link(file, jobs)
+
         for i, job in enumerate(jobs):
             logger.debug(
                 None, extra=dict(event=LogEvent.DEBUG_DAG, status="candidate", job=job)
@@ -1144,14 +1451,16 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
             if file in job.input:
                 cycles.append(job)
                 continue
-            if job in visited:
+            if job in path:
                 cycles.append(job)
                 continue
+            if trace is not None:
+                trace.append(link)
             try:
                 self.check_periodic_wildcards(job)
-                await self.update_(
+                yield self._update_job_frame(
                     job,
-                    visited=set(visited),
+                    path=path,
                     known_producers=known_producers,
                     progress=progress,
                     create_inventory=create_inventory,
@@ -1183,22 +1492,9 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
                     raise ex
                 exceptions.append(ex)
                 discarded_jobs.add(job)
-            except RecursionError as e:
-                raise WorkflowError(
-                    e,
-                    (
-                        "If building the DAG exceeds the recursion limit, "
-                        "this is likely due to a cyclic dependency."
-                        "E.g. you might have a sequence of rules that "
-                        "can generate their own input. Try to make "
-                        "the output files more specific. "
-                        "A common pattern is to have different prefixes "
-                        "in the output files of different rules."
-                        + f"\nProblematic file pattern: {file}"
-                        if file
-                        else ""
-                    ),
-                )
+            finally:
+                if trace is not None:
+                    trace.pop()
         if not producers:
             if cycles:
                 job = cycles[0]
@@ -1239,119 +1535,376 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
                     exception=WorkflowError(*exceptions),
                 ),
             )
-        return producer
+        yield FrameReturn(producer)
 
-    async def update_(
+    async def _update_job_frame(
         self,
         job,
-        visited=None,
+        path=None,
         known_producers=None,
         progress=False,
         create_inventory=False,
     ):
-        """Update the DAG by adding the given job and its dependencies."""
+        """Expansion frame adding the given job and its dependencies to the DAG
+        (see DAG._expand)."""
         if job in self._dependencies:
             return
-        if visited is None:
-            visited = set()
+        if path is None:
+            path = set()
         if known_producers is None:
             known_producers = dict()
-        visited.add(job)
-        dependencies = self._dependencies[job]
-        potential_dependencies = [
-            res
-            async for res in self.collect_potential_dependencies(
-                job, known_producers=known_producers
+        path.add(job)
+        try:
+            dependencies = self._dependencies[job]
+            potential_dependencies = [
+                res
+                async for res in self.collect_potential_dependencies(
+                    job, known_producers=known_producers
+                )
+            ]
+
+            if self.workflow.dag_settings.max_expansion_concurrency > 1:
+                await self.prefetch_dependency_io(
+                    potential_dependencies, create_inventory=create_inventory
+                )
+
+            missing_input = set()
+            producer = dict()
+            for res in potential_dependencies:
+                if create_inventory:
+                    # If possible, obtain inventory information starting from
+                    # given file and store it in the IOCache.
+                    # This should provide faster access to existence and mtime information
+                    # than querying file by file. If the file type does not support inventory
+                    # information, this call is a no-op.
+                    await res.file.inventory()
+
+                if not res.jobs:
+                    # no producing job found
+                    if (
+                        self.workflow.is_main_process
+                        and not await self._expansion_exists(res.file, job)
+                    ):
+                        # file not found, hence missing input
+                        missing_input.add(res.file)
+                    if not is_flagged(res.file, "before_update"):
+                        # record info that there is no known producer, but only
+                        # do that for files that are not flagged as before_update
+                        # otherwise, we would risk a conflict with corresponding files
+                        # that are flagged as 'update'.
+                        known_producers[res.file] = None
+                    # file found, no problem
+                    continue
+
+                if res.known:
+                    producer[res.file] = res.jobs[0]
+                else:
+                    try:
+                        selected_job = yield self._update_frame(
+                            res.jobs,
+                            file=res.file,
+                            path=path,
+                            known_producers=known_producers,
+                            progress=progress,
+                        )
+                        producer[res.file] = selected_job
+                    except (
+                        MissingInputException,
+                        CyclicGraphException,
+                        PeriodicWildcardError,
+                        WorkflowError,
+                    ) as ex:
+                        file_exists = await self._expansion_exists(res.file, job)
+                        if not file_exists:
+                            # delete job from tree
+                            self.delete_job(job, recursive=False)
+                            raise ex
+                        else:
+                            logger.debug(
+                                msg=f"No producers found, but file: {res.file} is present on disk.",
+                                extra=dict(
+                                    event=LogEvent.DEBUG_DAG,
+                                    file=res.file,
+                                    exception=ex,
+                                ),
+                            )
+                            known_producers[res.file] = None
+                        if isinstance(ex, CyclicGraphException) or isinstance(
+                            ex, PeriodicWildcardError
+                        ):
+                            print_exception_warning(ex, self.workflow.linemaps)
+
+            producer_files = defaultdict(list)
+            for file, job_ in producer.items():
+                producer_files[job_].append(file)
+            for job_, files in producer_files.items():
+                dependencies[job_].update(files)
+                self.depending[job_][job].update(files)
+
+            if self.is_batch_rule(job.rule) and self.batch.is_final:
+                # For the final batch, ensure that all input files from
+                # previous batches are present on disk.
+                if any(
+                    [
+                        (f not in producer and not await self._expansion_exists(f, job))
+                        for f in job.input
+                    ]
+                ):
+                    raise WorkflowError(
+                        "Unable to execute batch {} because not all previous batches "
+                        "have been completed before or files have been deleted.".format(
+                            self.batch
+                        )
+                    )
+
+            if missing_input:
+                self.delete_job(job, recursive=False)  # delete job from tree
+                raise MissingInputException(job, missing_input)
+
+            if self._expansion is not None:
+                await self._commit_resolved(job)
+        finally:
+            path.discard(job)
+
+    async def _expansion_exists(self, f, job):
+        """Check whether the given input file of the given job exists, recording
+        the result in case the expansion is snapshotted."""
+        exists = await f.exists()
+        if self._snapshot_recorder is not None:
+            self._snapshot_recorder.add_probe(f, job, exists)
+        return exists
+
+    async def _expansion_link(self, file, jobs):
+        """Return the link of the pipelined expansion for selecting the producer
+        of the given file among the given candidate jobs (see ExpansionLink)."""
+        parent = self._expansion.link
+        if len(jobs) != 1 or (parent is not None and not parent.retained):
+            return ExpansionLink(file, retained=False, needrun=False)
+        if parent is None:
+            # selection of a target job
+            return ExpansionLink(
+                file, retained=True, needrun=await self._is_needrun_target(jobs[0])
             )
-        ]
+        # If the file is present, a failure of its producer is tolerated.
+        missing = not file.is_storage and not await file.exists()
+        return ExpansionLink(file, retained=missing, needrun=missing and parent.needrun)
+
+    async def _is_needrun_target(self, job):
+        """Return whether the given target job has to be executed if an input
+        file that it requests is missing, regardless of the jobs that are added
+        to the DAG later on (see update_needrun)."""
+        if self.is_forced(job):
+            return True
+        if not job.has_products(include_logfiles=False):
+            # either without input or executed because of missing input
+            return True
+        if job.rule in self.targetrules or job.rule.name in self.target_jobs_rules:
+            files = job.products(include_logfiles=False)
+        else:
+            files = [f for f in job.products() if f in self.targetfiles]
+        async for _ in job.missing_output(files):
+            return True
+        return False
 
-        missing_input = set()
-        producer = dict()
-        for res in potential_dependencies:
-            if create_inventory:
-                # If possible, obtain inventory information starting from
-                # given file and store it in the IOCache.
-                # This should provide faster access to existence and mtime information
-                # than querying file by file. If the file type does not support inventory
-                # information, this call is a no-op.
-                await res.file.inventory()
-
-            if not res.jobs:
-                # no producing job found
-                if self.workflow.is_main_process and not await res.file.exists():
-                    # file not found, hence missing input
-                    missing_input.add(res.file)
-                if not is_flagged(res.file, "before_update"):
-                    # record info that there is no known producer, but only
-                    # do that for files that are not flagged as before_update
-                    # otherwise, we would risk a conflict with corresponding files
-                    # that are flagged as 'update'.
-                    known_producers[res.file] = None
-                # file found, no problem
-                continue
+    def _is_pipelineable(self, job):
+        """Return whether the given job may be committed during a pipelined
+        expansion. Jobs that are subject to properties of the entire DAG (groups,
+        pipes, update flags) or require another pass are left to its end."""
+        return (
+            job.group is None
+            and not job.is_checkpoint
+            and not job.incomplete_input_expand
+            and not job.has_queue_input()
+            and not self.is_edit_notebook_job(job)
+            and not any(
+                f.is_storage
+                or is_flagged(f, "pipe")
+                or is_flagged(f, "service")
+                or is_flagged(f, "nodelocal")
+                or is_flagged(f, "update")
+                for f in job.output
+            )
+            and not any(
+                f.is_storage or is_flagged(f, "before_update") for f in job.input
+            )
+        )
 
-            if res.known:
-                producer[res.file] = res.jobs[0]
-            else:
+    async def _commit_resolved(self, job):
+        """Commit the given, fully resolved job and its uncommitted dependencies
+        during a pipelined expansion.
+
+        Jobs are committed if they are certain to remain part of the DAG and
+        their needrun status cannot be changed anymore by jobs that are added
+        later on. Their needrun jobs are then handed over to the scheduler via
+        the ready jobs. Otherwise, they are reconsidered together with the job
+        that requests the output of the given one.
+        """
+        expansion = self._expansion
+        link = expansion.link
+        if len(expansion.trace) < 2 or not link.retained:
+            # Target jobs are committed once the expansion is complete.
+            return
+        jobs = list(
+            self.bfs(self._dependencies, job, stop=expansion.committed.__contains__)
+        )
+        if not all(map(self._is_pipelineable, jobs)):
+            return
+
+        await self.check_incomplete(jobs)
+        self.update_container_imgs(jobs)
+        self.update_conda_envs(jobs)
+        if link.needrun:
+            self.reason(job).missing_output.add(link.file)
+        await self._update_input_from_committed(jobs, expansion.committed)
+        await self.update_needrun(jobs=jobs, closed=True)
+        for job_ in jobs:
+            if not self.needrun(job_) and [
+                f async for f in job_.missing_output(job_.output)
+            ]:
+                # Further requests for the missing output could render the job
+                # and its dependencies needrun.
+                self._reset_needrun(jobs)
+                return
+
+        expansion.committed.update(jobs)
+        # From now on, the files of these jobs are modified by running jobs (see
+        # Workflow.execute), while those of the others remain cached.
+        iocache = self.workflow.iocache
+        if (
+            iocache.active
+            and iocache.watcher is None
+            and self.workflow.dag_settings.watch_io_cache
+        ):
+            self.release_iocache()
+        if iocache.watcher is None:
+            iocache.exclude(
+                chain(
+                    jobfiles(jobs, "output"),
+                    jobfiles(jobs, "log"),
+                    (job_.benchmark for job_ in jobs if job_.benchmark),
+                )
+            )
+        self.workflow.persistence.exclude_from_cache(jobfiles(jobs, "output"))
+
+        needrun = list(filter(self.needrun, jobs))
+        self.update_jobids(jobs)
+        self.update_priority(needrun)
+        await self.check_jobs(jobs)
+        self.workflow.persistence.extend_lock(
+            jobfiles(jobs, "input"), jobfiles(needrun, "output")
+        )
+        deployment_method = self.workflow.deployment_settings.deployment_method
+        if DeploymentMethod.APPTAINER in deployment_method:
+            self.pull_container_imgs(jobs=needrun)
+        if DeploymentMethod.CONDA in deployment_method:
+            self.create_conda_envs(jobs=needrun)
+        self.update_ready(needrun)
+
+    async def _update_input_from_committed(self, jobs, committed):
+        """Mark the given jobs as needrun if they depend on committed jobs that
+        are executed. Their updated input is not yet visible, because these are
+        not part of the update of the needrun jobs (see update_needrun)."""
+        for job in jobs:
+            for dep, files in self._dependencies[job].items():
+                if dep not in committed or not (
+                    self.needrun(dep) or self.finished(dep)
+                ):
+                    continue
+                if all([f.is_ancient and await f.exists() for f in files]):
+                    continue
+                self.reason(job).updated_input_run.update(files)
+
+    def _reset_needrun(self, jobs):
+        """Reset the needrun status of the given jobs, such that they are
+        evaluated again by the next update of the needrun jobs."""
+        for job in jobs:
+            if job in self._needrun:
+                self._needrun.remove(job)
+                self._len -= 1
+            self._needrun_evaluated.discard(job)
+            self._n_until_ready.pop(job, None)
+            self._checkpoint_jobs.discard(job)
+            self._reason.pop(job, None)
+
+    async def prefetch_dependency_io(
+        self, potential_dependencies, create_inventory=False
+    ):
+        """Concurrently obtain the inventory of the files of the given potential
+        dependencies of a job, and the existence of those without producer.
+        Producers are not determined here.
+
+        The information is stored in the IOCache, such that the subsequent
+        sequential pass over the potential dependencies (which determines the
+        producers in input file order) does not have to wait for each query
+        one after another. At most max_expansion_concurrency queries are
+        running at the same time.
+        """
+        cache = self.workflow.iocache
+        if not cache.active:
+            return
+        cache.sync()
+        semaphore = asyncio.Semaphore(
+            self.workflow.dag_settings.max_expansion_concurrency
+        )
+
+        async def prefetch(res):
+            async with semaphore:
                 try:
-                    selected_job = await self.update(
-                        res.jobs,
-                        file=res.file,
-                        visited=visited,
-                        known_producers=known_producers,
-                        progress=progress,
-                    )
-                    producer[res.file] = selected_job
-                except (
-                    MissingInputException,
-                    CyclicGraphException,
-                    PeriodicWildcardError,
-                    WorkflowError,
-                ) as ex:
-                    file_exists = await res.file.exists()
-                    if not file_exists:
-                        self.delete_job(job, recursive=False)  # delete job from tree
-                        raise ex
-                    else:
-                        logger.debug(
-                            msg=f"No producers found, but file: {res.file} is present on disk.",
-                            extra=dict(
-                                event=LogEvent.DEBUG_DAG,
-                                file=res.file,
-                                exception=ex,
-                            ),
+                    if create_inventory:
+                        await res.file.inventory()
+                    if res.jobs or not self.workflow.is_main_process:
+                        # existence is only queried for files without producer
+                        return
+                    if res.file.is_storage:
+                        await res.file.exists()
+                    elif cache.caches(res.file) and res.file not in cache.exists_local:
+                        cache.track(res.file)
+                        # os.path.exists blocks, hence run it in a thread
+                        cache.exists_local[res.file] = await asyncio.to_thread(
+                            os.path.exists, res.file.file
                         )
-                        known_producers[res.file] = None
-                    if isinstance(ex, CyclicGraphException) or isinstance(
-                        ex, PeriodicWildcardError
-                    ):
-                        print_exception_warning(ex, self.workflow.linemaps)
+                except Exception:
+                    # Nothing is cached in this case. The error will be raised
+                    # again (in input file order) by the sequential pass.
+                    pass
 
-        for file, job_ in producer.items():
-            dependencies[job_].add(file)
-            self.depending[job_][job].add(file)
+        async with asyncio.TaskGroup() as tg:
+            for res in potential_dependencies:
+                tg.create_task(prefetch(res))
 
-        if self.is_batch_rule(job.rule) and self.batch.is_final:
-            # For the final batch, ensure that all input files from
-            # previous batches are present on disk.
-            if any([(f not in producer and not await f.exists()) for f in job.input]):
-                raise WorkflowError(
-                    "Unable to execute batch {} because not all previous batches "
-                    "have been completed before or files have been deleted.".format(
-                        self.batch
-                    )
-                )
+    async def update_needrun(self, create_inventory=False, jobs=None, closed=False):
+        """Update the information whether a job needs to be executed.
 
-        if missing_input:
-            self.delete_job(job, recursive=False)  # delete job from tree
-            raise MissingInputException(job, missing_input)
+        If jobs is given, the update is incremental: only the given (changed or
+        replaced) jobs, jobs that have been added to the DAG since the last
+        update, and their downstream closure are re-evaluated. Otherwise, all
+        jobs of the DAG are re-evaluated.
 
-    async def update_needrun(self, create_inventory=False):
-        """Update the information whether a job needs to be executed."""
+        If closed is True, exactly the given jobs are evaluated. Their
+        dependencies have to be contained in them or have been evaluated before.
+        Jobs outside of them are not affected (see DAG._commit_resolved).
+        """
+        dependencies = self._dependencies
+        depending = self.depending
+
+        if jobs is None:
+            region = set(self.jobs)
+        elif closed:
+            region = set(jobs)
+        else:
+            region = set(
+                self.bfs(
+                    depending,
+                    *(job for job in jobs if job in dependencies),
+                    *(job for job in self.jobs if job not in self._needrun_evaluated),
+                )
+            )
 
         if create_inventory and self.workflow.is_main_process:
             # Concurrently collect mtimes of all existing files.
-            await self.workflow.iocache.mtime_inventory(self.jobs)
+            await self.workflow.iocache.mtime_inventory(
+                region, n_workers=self.workflow.dag_settings.max_stat_threads
+            )
 
         output_mintime = dict()
 
@@ -1389,19 +1942,22 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
                         # no checksums recorded, we cannot assume them to be the same
                         is_same = False
                     else:
-                        is_same = await f.is_same_checksum(
-                            checksums.pop(), self.max_checksum_file_size
+                        algorithm, checksum = checksums.pop()
+                        # compare with the algorithm of the record, such that
+                        # checksums of different algorithms are never compared
+                        is_same = (
+                            algorithm in CHECKSUM_ALGORITHMS
+                            and await f.is_same_checksum(
+                                checksum,
+                                self.max_checksum_file_size,
+                                algorithm=CHECKSUM_ALGORITHMS[algorithm],
+                            )
                         )
 
                 is_same_checksum_cache[(f, job)] = is_same
                 return is_same
 
-        def is_forced(job):
-            return (
-                job not in self.omitforce
-                and job.rule in self.forcerules
-                or not self.forcefiles.isdisjoint(job.output)
-            )
+        is_forced = self.is_forced
 
         async def update_needrun(job):
             reason = self.reason(job)
@@ -1521,21 +2077,39 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
 
         reason = self.reason
         _needrun = self._needrun
-        dependencies = self._dependencies
-        depending = self.depending
         _n_until_ready = self._n_until_ready
 
-        _needrun.clear()
-        self._checkpoint_jobs.clear()
-        _n_until_ready.clear()
-        self._ready_jobs.clear()
+        # jobs (outside of the region) whose number of needrun dependencies
+        # has to be recounted
+        recount = set()
+        if jobs is None:
+            _needrun.clear()
+            self._checkpoint_jobs.clear()
+            _n_until_ready.clear()
+            self._ready_jobs.clear()
+            self._needrun_evaluated.clear()
+        else:
+            for job in region:
+                if job in _needrun and not self.finished(job):
+                    _needrun.remove(job)
+                    self._len -= 1
+                self._checkpoint_jobs.discard(job)
+            if not closed:
+                # Finished jobs do not count as needrun dependencies anymore,
+                # as in a full update.
+                for job in [job for job in _needrun if self.finished(job)]:
+                    _needrun.remove(job)
+                    recount.update(depending[job])
+        self._needrun_evaluated.update(region)
 
         candidates = [
             [job for job in level if not self.finished(job)]
-            for level in self.toposorted()
+            for level in self.toposorted(region)
         ]
 
-        is_all_forced = all(
+        # Outside of the region, this shortcut would miss jobs that have to be
+        # rerun because of missing output required by the region.
+        is_all_forced = jobs is None and all(
             is_forced(job)
             for level in candidates
             for job in level
@@ -1549,6 +2123,14 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
                     self.reason(job).forced = True
                     _needrun.add(job)
         else:
+            # Read the metadata records of all candidates at once instead of one
+            # by one when checking them below.
+            await asyncio.to_thread(
+                self.workflow.persistence.preload_metadata,
+                [f for level in candidates for job in level for f in job.output],
+                n_threads=self.workflow.dag_settings.max_stat_threads,
+            )
+
             # Update the output mintime of all jobs.
             # We traverse them in BFS (level order) starting from target jobs.
             # Then, we check output mintime of job itself and all direct descendants,
@@ -1574,20 +2156,37 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
                         continue
                     if await update_needrun(job):
                         queue.append(job)
-                        masked.update(self.bfs(self.depending, job))
+                        self.mask(self.depending, masked, job)
+
+            def is_settled(job):
+                # Jobs outside of the region that are already needrun have been
+                # propagated by a previous update.
+                return job not in region and job in _needrun
 
             # bi-directional BFS to determine further needrun jobs
+            # (unfinished jobs outside of the region can be reached as well)
             visited = set(queue)
-            candidates_set = set(job for level in candidates for job in level)
             while queue:
                 job = queue.popleft()
-                _needrun.add(job)
+                if job not in _needrun:
+                    _needrun.add(job)
+                    if jobs is not None:
+                        self._len += 1
+                        recount.update(depending[job])
+                    if job not in region:
+                        recount.add(job)
 
                 for job_, files in dependencies[job].items():
-                    if job_ in candidates_set:
+                    if closed and job_ not in region:
+                        continue
+                    if not self.finished(job_):
                         missing_output = [f async for f in job_.missing_output(files)]
                         reason(job_).missing_output.update(missing_output)
-                        if missing_output and job_ not in visited:
+                        if (
+                            missing_output
+                            and job_ not in visited
+                            and not is_settled(job_)
+                        ):
                             logger.debug(
                                 f"Need to rerun job {job_} because of missing output required by {job}."
                             )
@@ -1595,8 +2194,10 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
                             queue.append(job_)
 
                 for job_, files in depending[job].items():
-                    if job_ in candidates_set:
-                        if job_ not in visited:
+                    if closed and job_ not in region:
+                        continue
+                    if not self.finished(job_):
+                        if job_ not in visited and not is_settled(job_):
                             if all([f.is_ancient and await f.exists() for f in files]):
                                 # No other reason to run job_.
                                 # Since all files are ancient, we do not trigger it.
@@ -1609,13 +2210,39 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
                         reason(job_).updated_input_run.update(files)
 
         # update _n_until_ready
-        for job in _needrun:
-            _n_until_ready[job] = sum(1 for dep in dependencies[job] if dep in _needrun)
+        if jobs is None:
+            updated = _needrun
+        else:
+            updated = region | recount
+            for job in updated:
+                # readiness is determined again by update_ready
+                self._ready_jobs.discard(job)
+                if job in self._group:
+                    self._ready_jobs.discard(self._group[job])
+                if job not in _needrun:
+                    _n_until_ready.pop(job, None)
+        for job in updated:
+            if job not in _needrun:
+                continue
+            _n_until_ready[job] = sum(
+                1
+                for dep in dependencies[job]
+                if dep in _needrun and not self.finished(dep)
+            )
             if job.is_checkpoint:
                 self._checkpoint_jobs.add(job)
 
-        # update len including finished jobs (because they have already increased the job counter)
-        self._len = len(self._finished | self._needrun)
+        if jobs is None:
+            # update len including finished jobs (because they have already increased the job counter)
+            self._len = len(self._finished | self._needrun)
+
+    def is_forced(self, job):
+        """Return whether the given job is forced to be executed."""
+        return (
+            job not in self.omitforce
+            and job.rule in self.forcerules
+            or not self.forcefiles.isdisjoint(job.output)
+        )
 
     def in_until(self, job):
         """Return whether given job has been specified via --until."""
@@ -1657,19 +2284,21 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
             return
         self.targetjobs = set(self.until_jobs())
 
-    def update_priority(self):
-        """Update job priorities."""
+    def update_priority(self, jobs=None):
+        """Update job priorities (of the given needrun jobs)."""
 
         def prioritized(job):
             return job.rule in self.priorityrules or not self.priorityfiles.isdisjoint(
                 job.output
             )
 
-        for job in self.needrun_jobs():
+        if jobs is None:
+            jobs = list(self.needrun_jobs())
+        for job in jobs:
             self._priority[job] = job.rule.priority
         for job in self.bfs(
             self._dependencies,
-            *filter(prioritized, self.needrun_jobs()),
+            *filter(prioritized, jobs),
             stop=self.noneedrun_finished,
         ):
             self._priority[job] = Job.HIGHEST_PRIORITY
@@ -1679,6 +2308,11 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
         for job in self.needrun_jobs():
             if job.group is None:
                 continue
+            if job in groups:
+                # The job has been reached from another job of the same group,
+                # hence its cone is contained in the cone of that job and
+                # would just be merged into that group.
+                continue
 
             def stop(j):
                 return j.group != job.group
@@ -1719,6 +2353,9 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
         self._check_groups()
 
     def validate_group(self, group: GroupJob) -> None:
+        # The traversal from a dependency only depends on the dependency itself,
+        # hence it is done once for dependencies shared by multiple jobs.
+        traversed = dict()
         for job in group.jobs:
             external_but_returning_rules = set()
             returned_to = set()
@@ -1729,20 +2366,27 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
                 if dep in group.jobs:
                     continue
 
-                dep_external_but_returning_rules = set()
-                dep_returned_to = set()
-
-                def stop_if(job, returned_to=dep_returned_to):
-                    if job in group.jobs:
-                        returned_to.add(job.rule.name)
-                        return True
-                    return False
-
-                dep_external_but_returning_rules.update(
-                    job.rule.name
-                    for job in self.bfs(self._dependencies, dep, stop=stop_if)
-                    if job not in group.jobs
-                )
+                if dep in traversed:
+                    dep_external_but_returning_rules, dep_returned_to = traversed[dep]
+                else:
+                    dep_external_but_returning_rules = set()
+                    dep_returned_to = set()
+
+                    def stop_if(job, returned_to=dep_returned_to):
+                        if job in group.jobs:
+                            returned_to.add(job.rule.name)
+                            return True
+                        return False
+
+                    dep_external_but_returning_rules.update(
+                        job.rule.name
+                        for job in self.bfs(self._dependencies, dep, stop=stop_if)
+                        if job not in group.jobs
+                    )
+                    traversed[dep] = (
+                        dep_external_but_returning_rules,
+                        dep_returned_to,
+                    )
                 if dep_returned_to:
                     external_but_returning_rules.update(
                         dep_external_but_returning_rules
@@ -1810,7 +2454,8 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
                         False,
                     )
 
-        for group in self._group.values():
+        # each group is assigned to all of its jobs, check it only once
+        for group in dict.fromkeys(self._group.values()):
             for job in group:
                 outside_jobs_all = dict()
                 dfs(job, group, set(), [], outside_jobs_all, True)
@@ -1901,9 +2546,14 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
         update_needrun=True,
         update_incomplete_input_expand_jobs=True,
         check_initial=False,
+        changed_jobs=None,
     ):
         """Postprocess the DAG. This has to be invoked after any change to the
-        DAG topology."""
+        DAG topology.
+
+        If changed_jobs is given, only those jobs, newly added jobs and their
+        downstream closure are re-evaluated for needrun (see update_needrun).
+        """
         self.cleanup()
         self.update_jobids()
         if update_needrun:
@@ -1913,7 +2563,7 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
             await self.sanitize_local_storage_copies()
             self.update_container_imgs()
             self.update_conda_envs()
-            await self.update_needrun()
+            await self.update_needrun(jobs=changed_jobs)
         self.update_priority()
         self.handle_pipes_and_services()
         self.handle_update_flags()
@@ -1927,7 +2577,9 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
                 # with potentially new input files that have depended
                 # on group ids.
                 await self.postprocess(
-                    update_needrun=True, update_incomplete_input_expand_jobs=False
+                    update_needrun=True,
+                    update_incomplete_input_expand_jobs=False,
+                    changed_jobs=changed_jobs,
                 )
 
                 return
@@ -1942,16 +2594,19 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
                 "ready for execution."
             )
 
-    async def check_jobs(self):
+    async def check_jobs(self, jobs=None):
+        if jobs is None:
+            jobs = self.jobs
+            needrun_jobs = self.needrun_jobs()
+        else:
+            needrun_jobs = filter(self.needrun, jobs)
         # first we check all **needrun** jobs whether its output can be made
-        for job in filterfalse(
-            self._checked_needrun_jobs.__contains__, self.needrun_jobs()
-        ):
+        for job in filterfalse(self._checked_needrun_jobs.__contains__, needrun_jobs):
             await job.check_protected_output()
             self._checked_needrun_jobs.add(job)
 
         # now we check **all* jobs for validity
-        for job in filterfalse(self._checked_jobs.__contains__, self.jobs):
+        for job in filterfalse(self._checked_jobs.__contains__, jobs):
             job.is_valid()
 
             # here we check if no two rules make the same output
@@ -2076,6 +2731,7 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
                     group = CandidateGroup()  # str(uuid.uuid4())
 
                 # Assign the pipe group to all involved jobs.
+                self._pipe_group_version += 1
                 job.pipe_group = group
                 visited.add(job)
                 for j in all_depending:
@@ -2121,6 +2777,7 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
         updated = False
         if self.has_unfinished_queue_input_jobs():
             logger.info("Updating jobs with queue input...")
+            updated_jobs = []
             for job in self.queue_input_jobs:
                 if (
                     job.has_queue_input()
@@ -2129,11 +2786,12 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
                     newjob = await job.updated()
                     if newjob.input != job.input:
                         await self.replace_job(job, newjob, recursive=False)
+                        updated_jobs.append(newjob)
                         updated = True
                     if updated and not job.has_unfinished_queue_input():
                         self._jobs_with_finished_queue_input.add(job)
             if updated:
-                await self.postprocess_after_update()
+                await self.postprocess_after_update(changed_jobs=updated_jobs)
                 # reset queue_input_jobs such that it is recomputed next time
                 self._queue_input_jobs = None
         return updated
@@ -2178,6 +2836,7 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
         if updated:
             logger.info("Updating checkpoint dependencies.")
 
+        updated_jobs = []
         i = 1
         while job_queue:
             logger.debug(f"Checkpoint dependency update round {i}")
@@ -2195,6 +2854,7 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
                 updated_job = await job.updated()
 
                 await self.replace_job(job, updated_job, recursive=False)
+                updated_jobs.append(updated_job)
 
                 posterior_checkpoint_targets = {
                     infile
@@ -2215,7 +2875,7 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
 
             job_queue = defaultdict(set)
             if candidate_job_queue:
-                await self.update_needrun()
+                await self.update_needrun(jobs=updated_jobs)
                 for job, posterior_checkpoint_deps in candidate_job_queue.items():
                     for checkpoint in posterior_checkpoint_deps:
                         if not self.needrun(checkpoint):
@@ -2225,12 +2885,12 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
         if updated:
             self.set_until_jobs()
             self.delete_omitfrom_jobs()
-            await self.postprocess_after_update()
+            await self.postprocess_after_update(changed_jobs=updated_jobs)
 
         return updated
 
-    async def postprocess_after_update(self):
-        await self.postprocess()
+    async def postprocess_after_update(self, changed_jobs=None):
+        await self.postprocess(changed_jobs=changed_jobs)
         self._derived_targetfiles = None
 
     def register_running(self, jobs: AnySet[AbstractJob]):
@@ -2304,9 +2964,9 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
                 self.create_conda_envs()
             potential_new_ready_jobs = True
 
-        if self.checkpoint_jobs:
-            # While there are still checkpoint jobs, we cannot safely delete
-            # temp files.
+        if self.checkpoint_jobs or self._expansion is not None:
+            # While there are still checkpoint jobs or the DAG is still
+            # expanded, we cannot safely delete temp files.
             # TODO: we maybe could be more accurate and determine whether there is a
             # checkpoint that depends on the temp file.
             self._deferred_temp_jobs.extend(jobs)
@@ -2318,10 +2978,19 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
         return potential_new_ready_jobs
 
     async def new_job(
-        self, rule, targetfile=None, format_wildcards=None, wildcards_dict=None
+        self,
+        rule,
+        targetfile=None,
+        format_wildcards=None,
+        wildcards_dict=None,
+        target_wildcards=None,
     ):
         """Create new job for given rule and (optional) targetfile.
-        This will reuse existing jobs with the same wildcards."""
+        This will reuse existing jobs with the same wildcards.
+
+        target_wildcards may contain the wildcard values obtained by matching the
+        targetfile against the output of the rule (see OutputIndex.match_wildcards).
+        """
         product = rule.get_some_product()
         if targetfile is None and wildcards_dict is not None and product is not None:
             # no targetfile given, but wildcards_dict is given, hence this job seems to contain wildcards
@@ -2337,7 +3006,14 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
         if key in self.job_cache:
             assert targetfile is not None
             return self.job_cache[key]
-        wildcards_dict = rule.get_wildcards(targetfile, wildcards_dict=wildcards_dict)
+        if wildcards_dict is None and target_wildcards is not None:
+            rule.check_wildcards(target_wildcards)
+            # copy, the wildcards are memoized by the output index
+            wildcards_dict = dict(target_wildcards)
+        else:
+            wildcards_dict = rule.get_wildcards(
+                targetfile, wildcards_dict=wildcards_dict
+            )
         job = await self.job_factory.new(
             rule,
             self,
@@ -2345,6 +3021,8 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
             format_wildcards=format_wildcards,
             targetfile=targetfile,
         )
+        if self._snapshot_recorder is not None:
+            self._snapshot_recorder.add_job(job)
         self.cache_job(job)
         return job
 
@@ -2370,11 +3048,12 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
         del self._dependencies[job]
         if job in self._reason:
             del self._reason[job]
-        if job in self._needrun:
+        if job in self._needrun or job in self._finished:
+            # the job is counted in the length of the DAG
             self._len -= 1
-            self._needrun.remove(job)
-        if job in self._finished:
-            self._finished.remove(job)
+        self._needrun.discard(job)
+        self._finished.discard(job)
+        self._needrun_evaluated.discard(job)
         if job in self._ready_jobs:
             self._ready_jobs.remove(job)
         if job in self._n_until_ready:
@@ -2396,9 +3075,11 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
             # jobid is not yet known.
             jobid = None
 
-        depending = list(self.depending[job].items())
+        # copy the files, the edges are removed by delete_job below
+        depending = [(job_, set(files)) for job_, files in self.depending[job].items()]
         if self.finished(job):
             self._finished.add(newjob)
+            self._len += 1
 
         self.delete_job(job, recursive=recursive)
         if jobid is not None:
@@ -2506,10 +3187,16 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
                         # no dependency found
                         yield PotentialDependency(file, None, False)
 
-    def bfs(self, direction, *jobs, stop=lambda job: False):
-        """Perform a breadth-first traversal of the DAG."""
-        queue = deque(jobs)
-        visited = set(queue)
+    def bfs(self, direction, *jobs, stop=lambda job: False, visited=None):
+        """Perform a breadth-first traversal of the DAG.
+
+        If a set of visited jobs is given, jobs contained in it are skipped and
+        all traversed jobs are added to it (see mask).
+        """
+        if visited is None:
+            visited = set()
+        queue = deque(job for job in jobs if job not in visited)
+        visited.update(queue)
         while queue:
             job = queue.popleft()
             if stop(job):
@@ -2521,6 +3208,18 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
                     queue.append(job_)
                     visited.add(job_)
 
+    def mask(self, direction, masked, *jobs):
+        """Add the cones of the given jobs in the given direction to the set of
+        masked jobs.
+
+        The set has to be closed under the direction, i.e. contain the cone of
+        each of its jobs, which is the case if it has only been extended via this
+        method. Then, masked jobs need not be traversed again, such that
+        repeated calls take linear time in total, even if the cones overlap.
+        """
+        for _ in self.bfs(direction, *jobs, visited=masked):
+            pass
+
     def level_bfs(self, direction, *jobs, stop=lambda job: False):
         """Perform a breadth-first traversal of the DAG, but also yield the
         level together with each job."""
@@ -2583,18 +3282,24 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
         return await self.new_job(targetrule)
 
     async def file2jobs(self, targetfile, wildcards_dict=None):
-        rules = self.output_index.match_producers(targetfile)
+        producers = self.output_index.match_wildcards(targetfile)
         jobs = []
         exceptions = list()
-        for rule in rules:
+        for rule, target_wildcards in producers.items():
             try:
                 jobs.append(
                     await self.new_job(
-                        rule, targetfile=targetfile, wildcards_dict=wildcards_dict
+                        rule,
+                        targetfile=targetfile,
+                        wildcards_dict=wildcards_dict,
+                        target_wildcards=target_wildcards,
                     )
                 )
             except InputFunctionException as e:
                 exceptions.append(e)
+                if self._snapshot_recorder is not None:
+                    # the failed job is not recorded, hence it cannot be validated
+                    self._snapshot_recorder.discard()
                 if (
                     StrictDagEvaluation.FUNCTIONS
                     in self.workflow.dag_settings.strict_evaluation
@@ -3214,7 +3919,39 @@ class DAG(DAGExecutorInterface, DAGReportInterface, DAGSchedulerInterface):
         # Return both the message and dictionary
         return message, stats_dict
 
+    @property
+    def topology_version(self):
+        """Version of the DAG topology. It changes whenever jobs or dependencies
+        are added or removed (e.g. via new_job, delete_job or replace_job) or
+        pipe groups are assigned."""
+        return (self._adjacency.version, self._pipe_group_version)
+
     def toposorted(self, jobs=None, inherit_pipe_dependencies=False):
+        """Return the topological levels of the given jobs (by default all jobs).
+
+        The levels of all jobs are cached until the topology version changes.
+        Subsets (e.g. group jobs or regions of the DAG) are sorted directly,
+        since they are rarely requested twice.
+        """
+        if jobs is not None:
+            return self._toposorted(
+                jobs, inherit_pipe_dependencies=inherit_pipe_dependencies
+            )
+        version = self.topology_version
+        if version != self._toposorted_version:
+            self._toposorted_cache.clear()
+            self._toposorted_version = version
+        try:
+            levels = self._toposorted_cache[inherit_pipe_dependencies]
+        except KeyError:
+            levels = list(
+                self._toposorted(inherit_pipe_dependencies=inherit_pipe_dependencies)
+            )
+            self._toposorted_cache[inherit_pipe_dependencies] = levels
+        # copy, such that the cached levels cannot be modified by the caller
+        return (list(level) for level in levels)
+
+    def _toposorted(self, jobs=None, inherit_pipe_dependencies=False):
         if jobs is None:
             jobs = set(self.jobs)
 
@@ -0,0 +1,127 @@
+__author__ = "Johannes Köster"
+__copyright__ = "Copyright 2022, Johannes Köster"
+__email__ = "johannes.koester@uni-due.de"
+__license__ = "MIT"
+
+import asyncio
+from collections import namedtuple
+from typing import TYPE_CHECKING, Callable, List, Optional, Set
+
+if TYPE_CHECKING:
+    from ismk.jobs import Job
+
+FrameReturn = namedtuple("FrameReturn", ["value"])
+
+# Maximum number of jobs on a chain of dependencies. Deeper chains are almost
+# certainly caused by rules that generate their own input, which would
+# otherwise be expanded forever.
+MAX_EXPANSION_DEPTH = 10000
+
+# A link of the chain of producer selections that leads from a target to the
+# job that is currently expanded (see PipelinedExpansion.trace).
+# retained: all selections of the chain have exactly one candidate and all
+# requested files (apart from the target) are missing. Hence, the selected job
+# either becomes part of the DAG or the entire expansion fails.
+# needrun: the selected job is certain to need to be executed, because its
+# requested file is missing and required by a job that needs to be executed.
+ExpansionLink = namedtuple("ExpansionLink", ["file", "retained", "needrun"])
+
+
+class ExpansionStack:
+    """Explicit stack of DAG expansion frames (see DAG._expand).
+
+    A frame requests the expansion of a sub-problem by yielding a new (not yet
+    started) frame. The result of that frame is sent back into the requesting
+    frame, an exception raised by it is thrown into the requesting frame at
+    the yield point. A frame returns its result by yielding a FrameReturn.
+
+    The expansion can be advanced in several steps, such that it can be
+    interleaved with other work (see PipelinedExpansion).
+    """
+
+    def __init__(self, frame):
+        self._frames = [frame]
+        self._value = None
+        self._error = None
+
+    @property
+    def done(self) -> bool:
+        return not self._frames
+
+    def result(self):
+        """Return the result of the initial frame or raise its exception."""
+        assert self.done, "bug: expansion has not been completed"
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    async def advance(self, pause: Optional[Callable[[], bool]] = None):
+        """Drive the frames until the expansion is done or the given pause
+        callback returns True."""
+        stack = self._frames
+        value, error = self._value, self._error
+        while stack:
+            frame = stack[-1]
+            try:
+                if error is not None:
+                    request = await frame.athrow(error)
+                else:
+                    request = await frame.asend(value)
+            except StopAsyncIteration:
+                stack.pop()
+                value, error = None, None
+            except Exception as e:
+                stack.pop()
+                value, error = None, e
+            else:
+                if isinstance(request, FrameReturn):
+                    stack.pop()
+                    await frame.aclose()
+                    value, error = request.value, None
+                else:
+                    stack.append(request)
+                    value, error = None, None
+            if pause is not None and stack and pause():
+                break
+        self._value, self._error = value, error
+
+
+class PipelinedExpansion:
+    """State of a DAG expansion that is interleaved with the execution of jobs
+    (see --pipelined-expansion).
+
+    The expansion runs in its own event loop, since its frames are suspended
+    between the steps while other coroutines are run via async_run.
+
+    Attributes
+    ----------
+    stack
+        The expansion frames.
+    trace
+        The links of the producer selections above the currently expanded job,
+        from the target to the innermost one.
+    committed
+        Jobs that have been handed over to the scheduler. They are closed under
+        dependencies and their needrun status is final.
+    failed
+        Whether the expansion has failed. Jobs that have been committed before
+        are still executed, but nothing else.
+    """
+
+    def __init__(self, frame):
+        self.stack = ExpansionStack(frame)
+        self.trace: List[ExpansionLink] = []
+        self.committed: Set["Job"] = set()
+        self.failed = False
+        self._runner = asyncio.Runner()
+
+    @property
+    def link(self) -> Optional[ExpansionLink]:
+        """The innermost link of the trace."""
+        return self.trace[-1] if self.trace else None
+
+    def run(self, coroutine):
+        return self._runner.run(coroutine)
+
+    def close(self):
+        self._runner.close()
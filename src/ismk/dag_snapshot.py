@@ -0,0 +1,165 @@
+__author__ = "Johannes Köster"
+__copyright__ = "Copyright 2022, Johannes Köster"
+__email__ = "johannes.koester@uni-due.de"
+__license__ = "MIT"
+
+from dataclasses import dataclass, field
+import hashlib
+import json
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from ismk import __version__
+from ismk.sourcecache import StringSourceFile
+
+if TYPE_CHECKING:
+    from ismk.dag import DAG
+    from ismk.jobs import Job
+
+# Increment this when the snapshot layout changes to invalidate previously
+# persisted snapshots.
+DAG_SNAPSHOT_VERSION = 1
+
+
+@dataclass
+class JobRecord:
+    """Plain representation of a job that can be recreated via the JobFactory."""
+
+    rule: str
+    wildcards: Dict[str, str]
+    targetfile: Optional[str]
+    input: List[str]
+
+
+@dataclass
+class DAGSnapshot:
+    """Result of a DAG expansion.
+
+    Attributes
+    ----------
+    key
+        Hash of workflow sources, config and targets (see snapshot_key).
+    jobs
+        All jobs that have been created during the expansion, including
+        candidates that have been discarded (e.g. because of missing input).
+    kept
+        Indices of the jobs that are part of the DAG.
+    edges
+        Triples of job index, dependency index and the files the job
+        obtains from the dependency.
+    probes
+        Existence queries that have been made during the expansion, as triples
+        of file, index of the job that has the file as input and the result.
+    targetjobs
+        Indices of the target jobs.
+    forced_targetjobs
+        Indices of target jobs whose output has to be forced (--target-jobs).
+    """
+
+    key: str
+    jobs: List[JobRecord] = field(default_factory=list)
+    kept: List[int] = field(default_factory=list)
+    edges: List[Tuple[int, int, List[str]]] = field(default_factory=list)
+    probes: List[Tuple[str, int, bool]] = field(default_factory=list)
+    targetjobs: List[int] = field(default_factory=list)
+    forced_targetjobs: List[int] = field(default_factory=list)
+    version: int = DAG_SNAPSHOT_VERSION
+
+
+class DAGSnapshotRecorder:
+    """Records the jobs and existence queries of a DAG expansion."""
+
+    def __init__(self, key: str):
+        self.key = key
+        # use a dict as an insertion ordered set
+        self._jobs: Dict["Job", None] = dict()
+        self._probes = dict()
+        self._eligible = True
+
+    def add_job(self, job: "Job"):
+        self._jobs[job] = None
+
+    def add_probe(self, f, job: "Job", exists: bool):
+        if f.is_storage:
+            # The snapshot is validated against the local file system only.
+            self._eligible = False
+        self._probes[(f, job)] = exists
+
+    def discard(self):
+        """Mark the expansion as not reproducible from the recorded information,
+        e.g. because a candidate job could not be created."""
+        self._eligible = False
+
+    def snapshot(self, dag: "DAG", forced_targetjobs=()) -> Optional[DAGSnapshot]:
+        """Create a snapshot of the given (expanded and cleaned up) DAG.
+
+        Returns None if the DAG is not eligible for being snapshotted.
+        """
+        if not self._eligible or any(
+            f.is_storage for job in dag.jobs for f in job.output
+        ):
+            return None
+        for job in dag.jobs:
+            # jobs that have been created outside of the recorded expansion
+            self.add_job(job)
+
+        index = {job: i for i, job in enumerate(self._jobs)}
+        snapshot = DAGSnapshot(key=self.key)
+        snapshot.jobs = [
+            JobRecord(
+                rule=job.rule.name,
+                wildcards=dict(job.wildcards_dict),
+                targetfile=None if job.targetfile is None else str(job.targetfile),
+                input=list(map(str, job.input)),
+            )
+            for job in self._jobs
+        ]
+        snapshot.kept = [index[job] for job in dag.jobs]
+        snapshot.edges = [
+            (index[job], index[dep], sorted(map(str, files)))
+            for job in dag.jobs
+            for dep, files in dag.dependencies[job].items()
+        ]
+        snapshot.probes = [
+            (str(f), index[job], exists) for (f, job), exists in self._probes.items()
+        ]
+        snapshot.targetjobs = [index[job] for job in dag.targetjobs]
+        snapshot.forced_targetjobs = [index[job] for job in forced_targetjobs]
+        return snapshot
+
+
+def snapshot_key(dag: "DAG") -> str:
+    """Return a hash of everything that determines the result of the DAG
+    expansion apart from the file system: the included sources, the config,
+    the targets and the settings influencing the selection of producers."""
+    workflow = dag.workflow
+    key = hashlib.sha256()
+    key.update(__version__.encode())
+    for sourcefile in workflow.included:
+        if isinstance(sourcefile, StringSourceFile):
+            key.update(sourcefile.name.encode())
+            key.update(sourcefile.content.encode())
+        else:
+            key.update(sourcefile.get_path_or_uri(secret_free=True).encode())
+            with workflow.sourcecache.open(sourcefile) as f:
+                key.update(f.read().encode())
+    dag_settings = workflow.dag_settings
+    key.update(
+        json.dumps(
+            {
+                "config": workflow.config,
+                "rules": sorted(rule.name for rule in dag.rules),
+                "targetrules": sorted(rule.name for rule in dag.targetrules),
+                "targetfiles": sorted(dag.targetfiles),
+                "target_jobs": sorted(
+                    [spec.rulename, sorted(spec.wildcards_dict.items())]
+                    for spec in dag_settings.target_jobs
+                ),
+                "batch": str(dag_settings.batch),
+                "strict_evaluation": sorted(map(str, dag_settings.strict_evaluation)),
+                "ignore_ambiguity": workflow.execution_settings.ignore_ambiguity,
+            },
+            sort_keys=True,
+            default=repr,
+        ).encode()
+    )
+    return key.hexdigest()
@@ -16,12 +16,12 @@ import shutil
 import stat
 import string
 import time
+import weakref
 from contextlib import contextmanager
 from dataclasses import dataclass, field
 from inspect import isfunction, ismethod
 from itertools import chain, product
 from pathlib import Path
-import pickle
 from typing import (
     Any,
     Callable,
@@ -29,7 +29,9 @@ from typing import (
     Iterable,
     List,
     Optional,
+    Sequence,
     Set,
+    Tuple,
     TypeVar,
     Union,
     TYPE_CHECKING,
@@ -52,6 +54,11 @@ from ismk.common import (
     get_input_function_aux_params,
     is_namedtuple_instance,
 )
+from ismk.io.checksums import ChecksumService
+from ismk.io.expansion import Expansion, ExpandedPattern
+from ismk.io.stat_engine import StatEngine, local_mtime
+from ismk.io.walker import DEFAULT_CACHE_PATH, get_listing_cache, walk_pattern
+from ismk.io.watcher import create_notifier
 from ismk.exceptions import (
     InputOpenException,
     MissingOutputException,
@@ -64,6 +71,7 @@ from ismk.logging import logger
 if TYPE_CHECKING:
     import ismk.rules
     import ismk.jobs
+    from ismk.io.watcher import IOCacheWatcher
 
 
 def lutime(file, times):
@@ -97,15 +105,7 @@ class ExistsDict(dict):
             return super().__contains__(path)
 
 
-class IOCacheLoadError(Exception):
-    pass
-
-
 class IOCache(IOCacheStorageInterface):
-    # Increment this when the class interface changes to invalidated previously
-    # persisted versions.
-    IOCACHE_VERSION = 0
-
     def __init__(self, max_wait_time):
         self._mtime = dict()
         self._exists_local = ExistsDict(self)
@@ -114,47 +114,9 @@ class IOCache(IOCacheStorageInterface):
         self.active = True
         self.remaining_wait_time = max_wait_time
         self.max_wait_time = max_wait_time
-
-    def _simple_copy(self):
-        """Identical copy except dictionary keys are downcast to str."""
-        simplified = type(self)(self.max_wait_time)
-
-        # Copy non-dictionary attributes the same.
-        for name in ["remaining_wait_time", "active"]:
-            old_attr = getattr(self, name)
-            setattr(simplified, name, old_attr)
-
-        # Copy dictionary attributes, casting keys to str.
-        for name in ["_mtime", "_exists_local", "_exists_in_storage", "_size"]:
-            old_dict = getattr(self, name)
-            if isinstance(old_dict, ExistsDict):
-                setattr(simplified, name, ExistsDict(simplified))
-            else:
-                setattr(simplified, name, {})
-            new_dict = getattr(simplified, name)
-            for key in old_dict:
-                new_dict[str(key)] = old_dict[key]
-
-        return simplified
-
-    def save(self, handle):
-        """Dump IOCache to file."""
-        simplified = self._simple_copy()
-        pickle.dump(simplified, handle)
-
-    @classmethod
-    def load(cls, handle):
-        """Load an IOCache from file."""
-        loaded = pickle.load(handle)
-        if loaded.IOCACHE_VERSION != cls.IOCACHE_VERSION:
-            raise IOCacheLoadError(
-                (
-                    f"Trying to load IOCache object with a mismatched version: "
-                    f"{loaded.IOCACHE_VERSION} (loaded) != {cls.IOCACHE_VERSION} (current)"
-                )
-            )
-        else:
-            return loaded
+        self.watcher: Optional["IOCacheWatcher"] = None
+        # files that are modified by running jobs (see exclude)
+        self._excluded: Set["_IOFile"] = set()
 
     @property
     def mtime(self):
@@ -175,48 +137,37 @@ class IOCache(IOCacheStorageInterface):
     async def mtime_inventory(
         self, jobs: "collections.abc.Iterable[ismk.jobs.Job]", n_workers=8
     ):
-        queue: asyncio.Queue = asyncio.Queue()
-        stop_item = object()
-
-        async def worker(queue: asyncio.Queue):
-            while True:
-                item = await queue.get()
-                if item is stop_item:
-                    queue.task_done()
-                    return
-                # Avoid superfluously checking mtime as the same file might be
-                # added multiple times to the queue.
-                if item not in self.mtime:
-                    try:
-                        self.mtime[item] = await self.collect_mtime(item)
-                    except Exception as e:
-                        queue.task_done()
-
-                        raise e
-                queue.task_done()
-
-        tasks = [
-            asyncio.get_event_loop().create_task(worker(queue))
-            for _ in range(n_workers)
-        ]
-
+        """Collect existence and mtime of all local input, output and benchmark
+        files of the given jobs, using n_workers threads (see StatEngine)."""
+        # use a dict as an insertion ordered set
+        files: Dict[str, "_IOFile"] = dict()
+        self.sync()
         for job in jobs:
             f: "_IOFile"
-            for f in chain(job.input, job.output):
-                if not f.is_storage and await f.exists():
-                    queue.put_nowait(f)
-            if (
-                job.benchmark
-                and not job.benchmark.is_storage
-                and await job.benchmark.exists()
+            for f in chain(
+                job.input, job.output, (job.benchmark,) if job.benchmark else ()
             ):
-                queue.put_nowait(job.benchmark)
-
-        # Send a stop item to each worker.
-        for _ in range(n_workers):
-            queue.put_nowait(stop_item)
-
-        await asyncio.gather(*tasks)
+                # Avoid superfluously checking mtime as the same file might
+                # occur multiple times.
+                if not f.is_storage and f not in self.mtime and self.caches(f):
+                    files.setdefault(f.file, f)
+
+        unknown, existing = [], []
+        for path, f in files.items():
+            self.track(f)
+            if f not in self.exists_local:
+                unknown.append(path)
+            elif self.exists_local[f]:
+                existing.append(path)
+
+        mtimes = await StatEngine(n_threads=n_workers).collect(
+            unknown, existing=existing
+        )
+        for path, mtime in mtimes.items():
+            f = files[path]
+            self.exists_local[f] = mtime is not None
+            if mtime is not None:
+                self.mtime[f] = Mtime(local=mtime[0], local_target=mtime[1])
 
     async def collect_mtime(self, path: "_IOFile"):
         return await path.mtime_uncached()
@@ -225,13 +176,91 @@ class IOCache(IOCacheStorageInterface):
         self.mtime.clear()
         self.size.clear()
         self.exists_local.clear()
+        self.exists_local.has_inventory.clear()
         self.exists_in_storage.clear()
+        self.exists_in_storage.has_inventory.clear()
         self.remaining_wait_time = self.max_wait_time
 
     def deactivate(self):
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
         self.clear()
+        self._excluded.clear()
         self.active = False
 
+    def watch(self, watcher: "IOCacheWatcher"):
+        """Keep the cache active while files are modified by running jobs, by
+        invalidating the entries of local files that are reported as changed by
+        the given watcher. Storage files are not cached from now on."""
+        self.exists_in_storage.clear()
+        self.exists_in_storage.has_inventory.clear()
+        self.invalidate(
+            [
+                f
+                for f in chain(self.mtime, self.exists_local, self.size)
+                if getattr(f, "is_storage", False)
+            ]
+        )
+        self.watcher = watcher
+        self._excluded.clear()
+        for f in set(chain(self.mtime, self.exists_local, self.size)):
+            self.track(f)
+        for path in list(self.exists_local.has_inventory):
+            self.track(path, directory=True)
+
+    def caches(self, f: "_IOFile") -> bool:
+        """Return whether information about the given file shall be cached."""
+        return (
+            self.active
+            and (self.watcher is None or not f.is_storage)
+            and f not in self._excluded
+        )
+
+    def exclude(self, files: "collections.abc.Iterable[_IOFile]"):
+        """Stop caching information about the given files, e.g. because they
+        are modified by jobs that run while the cache is still used for others
+        (see --pipelined-expansion)."""
+        files = list(files)
+        self.invalidate(files)
+        self._excluded.update(files)
+
+    def track(self, f: str, directory: bool = False):
+        """Watch the given local file for changes (if a watcher is used) before
+        information about it is obtained."""
+        if self.watcher is not None:
+            try:
+                self.watcher.track(
+                    f, directory=directory or getattr(f, "is_directory", False)
+                )
+            except OSError as e:
+                logger.warning(
+                    f"Unable to watch {f} for changes ({e}). Deactivating IO cache."
+                )
+                self.deactivate()
+
+    def sync(self):
+        """Apply the changes reported by the watcher (if any)."""
+        if self.watcher is not None:
+            self.watcher.sync()
+
+    def invalidate(self, files: "collections.abc.Iterable[str]"):
+        """Drop all information about the given files, e.g. because they have
+        been modified."""
+        has_inventory = self.exists_local.has_inventory
+        for f in files:
+            self.mtime.pop(f, None)
+            self.size.pop(f, None)
+            self.exists_local.pop(f, None)
+            self.exists_in_storage.pop(f, None)
+            # f may have been listed, and its listing has changed
+            has_inventory.discard(f)
+            has_inventory.discard(os.path.dirname(f))
+
+
+# used for files without a workflow persistence
+_checksums = ChecksumService()
+
 
 def IOFile(file, rule: Union["ismk.rules.Rule", None] = None):
     f = _IOFile(file, rule=rule)
@@ -242,10 +271,13 @@ def iocache(func: Callable):
     @functools.wraps(func)
     async def wrapper(self: "_IOFile", *args, **kwargs):
         assert self.rule is not None
-        if self.rule.workflow.iocache.active:
-            cache = getattr(self.rule.workflow.iocache, func.__name__)
+        iocache: IOCache = self.rule.workflow.iocache
+        if iocache.caches(self):
+            iocache.sync()
+            cache = getattr(iocache, func.__name__)
             if self in cache:
                 return cache[self]
+            iocache.track(self)
             v = await func(self, *args, **kwargs)
             cache[self] = v
             return v
@@ -260,7 +292,16 @@ class _IOFile(str, AnnotatedStringInterface):
     A file that is either input or output of a rule.
     """
 
-    __slots__ = ["_is_callable", "_file", "rule", "_regex", "_wildcard_constraints"]
+    __slots__ = [
+        "_is_callable",
+        "_file",
+        "rule",
+        "_regex",
+        "_wildcard_constraints",
+        "_interned",
+        "_template",
+        "__weakref__",
+    ]
 
     if TYPE_CHECKING:
 
@@ -270,6 +311,8 @@ class _IOFile(str, AnnotatedStringInterface):
             self.rule: ismk.rules.Rule | None
             self._regex: re.Pattern | None
             self._wildcard_constraints: Dict[str, re.Pattern] | None
+            self._interned: weakref.WeakValueDictionary[str, _IOFile] | bool | None
+            self._template: WildcardTemplate | None
 
     def __new__(
         cls,
@@ -287,7 +330,7 @@ class _IOFile(str, AnnotatedStringInterface):
             if file.endswith("/"):
                 # remove trailing slashes
                 modified = file.rstrip("/")
-            if rule is not None:
+            if rule is not None and "<" in modified:
                 try:
                     modified = rule.pathvars.apply(modified)
                 except UndefinedPathvarException as e:
@@ -302,6 +345,8 @@ class _IOFile(str, AnnotatedStringInterface):
         obj.rule = rule
         obj._regex = None
         obj._wildcard_constraints = None
+        obj._interned = None
+        obj._template = None
 
         if obj.is_storage:
             obj.storage_object._iofile = obj
@@ -313,6 +358,10 @@ class _IOFile(str, AnnotatedStringInterface):
         new._is_callable = self._is_callable
         new._file = self._file
         new.rule = self.rule
+        new._regex = None
+        new._wildcard_constraints = None
+        new._interned = None
+        new._template = None
         if new.is_storage:
             new.storage_object._iofile = new
         return new
@@ -326,7 +375,8 @@ class _IOFile(str, AnnotatedStringInterface):
         """
         assert self.rule is not None
         cache: IOCache = self.rule.workflow.iocache
-        if cache.active:
+        if cache.caches(self):
+            cache.sync()
             tasks = []
             if self.is_storage and self not in cache.exists_in_storage:
                 # info not yet in inventory, let's discover as much as we can
@@ -358,6 +408,7 @@ class _IOFile(str, AnnotatedStringInterface):
             if path in cache.exists_local.has_inventory:
                 # This path was already scanned before, hence we can stop.
                 break
+            cache.track(path, directory=True)
             try:
                 with os.scandir(path) as scan:
                     for entry in scan:
@@ -367,6 +418,7 @@ class _IOFile(str, AnnotatedStringInterface):
             except FileNotFoundError:
                 # Not found, hence, all subfolders cannot be present as well
                 for path in ancestors[i:]:
+                    cache.track(path, directory=True)
                     cache.exists_local[path] = False
                     cache.exists_local.has_inventory.add(path)
                 break
@@ -545,8 +597,9 @@ class _IOFile(str, AnnotatedStringInterface):
 
     async def mtime(self):
         assert self.rule is not None
-        if self.rule.workflow.iocache.active:
-            cache: IOCache = self.rule.workflow.iocache
+        cache: IOCache = self.rule.workflow.iocache
+        if cache.caches(self):
+            cache.sync()
             if self in cache.mtime:
                 mtime = cache.mtime[self]
                 # if inventory is filled by storage plugin, mtime.local() will be None and
@@ -556,6 +609,7 @@ class _IOFile(str, AnnotatedStringInterface):
                     mtime._local_target = mtime_local._local_target
                     mtime._local = mtime_local._local
             else:
+                cache.track(self)
                 cache.mtime[self] = mtime = await self.mtime_uncached()
             return mtime
         else:
@@ -575,51 +629,11 @@ class _IOFile(str, AnnotatedStringInterface):
             else None
         )
 
-        # We first do a normal stat.
         try:
-            _stat = os.stat(self.file, follow_symlinks=False)
-
-            is_symlink = stat.S_ISLNK(_stat.st_mode)
-            is_dir = stat.S_ISDIR(_stat.st_mode)
-            mtime = _stat.st_mtime
-
-            def get_dir_mtime():
-                # Try whether we have a timestamp file for it.
-                return os.stat(
-                    os.path.join(self.file, ".ismk_timestamp"),
-                    follow_symlinks=True,
-                ).st_mtime
-
-            if not is_symlink:
-                if is_dir:
-                    try:
-                        mtime = get_dir_mtime()
-                    except FileNotFoundError:
-                        # No timestamp, hence go on as if it is a file.
-                        pass
-
-                # In the usual case, not a dir, not a symlink.
-                # We need just a single stat call.
-                return Mtime(local=mtime, storage=mtime_in_storage)
-
-            else:
-                # In case of a symlink, we need the stats for the target file/dir.
-                target_stat = os.stat(self.file, follow_symlinks=True)
-                # Further, we need to check again if this is a directory.
-                is_dir = stat.S_ISDIR(target_stat.st_mode)
-                mtime_target = target_stat.st_mtime
-
-                if is_dir:
-                    try:
-                        mtime_target = get_dir_mtime()
-                    except FileNotFoundError:
-                        # No timestamp, hence go on as if it is a file.
-                        pass
-
-                return Mtime(
-                    local=mtime, local_target=mtime_target, storage=mtime_in_storage
-                )
-
+            mtime, mtime_target = local_mtime(self.file)
+            return Mtime(
+                local=mtime, local_target=mtime_target, storage=mtime_in_storage
+            )
         except FileNotFoundError:
             if self.is_storage:
                 return Mtime(storage=mtime_in_storage)
@@ -673,17 +687,9 @@ class _IOFile(str, AnnotatedStringInterface):
         Returns None if file does not exist. If force is True,
         omit eligibility check."""
         if force or await self.is_checksum_eligible(threshold):
-            checksum = algorithm()
-            if await self.size() > 0:
-                # only read if file is bigger than zero
-                # otherwise the checksum is the same as taking hexdigest
-                # from the empty sha256 as initialized above
-                # This helps endless reading in case the input
-                # is a named pipe or a socket or a symlink to a device like
-                # /dev/random.
-                with open(self.file, "rb") as f:
-                    checksum.update(f.read())
-            return checksum.hexdigest()
+            persistence = None if self.rule is None else self.rule.workflow.persistence
+            checksums = _checksums if persistence is None else persistence.checksums
+            return await checksums.checksum(self.file, algorithm=algorithm)
         else:
             return None
 
@@ -781,6 +787,12 @@ class _IOFile(str, AnnotatedStringInterface):
             await remove(
                 self, remove_non_empty_dir=remove_non_empty_dir, only_local=only_local
             )
+        self._invalidate_cache()
+
+    def _invalidate_cache(self):
+        # The watcher of the IOCache (if any) may notice the modification too late.
+        if self.rule is not None:
+            self.rule.workflow.iocache.invalidate([self])
 
     async def touch_storage_and_local(self):
         from ismk.interfaces.storage_plugins.storage_object import (
@@ -811,6 +823,7 @@ class _IOFile(str, AnnotatedStringInterface):
                 lutime(file, times)
             else:
                 lutime(self.file, times)
+            self._invalidate_cache()
         except OSError as e:
             if e.errno == 2:
                 assert self.rule is not None
@@ -840,7 +853,12 @@ class _IOFile(str, AnnotatedStringInterface):
             with open(file, "w"):
                 pass
 
-    def apply_wildcards(self, wildcards):
+    def apply_wildcards(self, wildcards, intern=True):
+        """Return the file with the given wildcards applied.
+
+        If intern is False, the file is not interned (see _intern), e.g. for
+        patterns that are applied only once.
+        """
         f = self._file
 
         if self.is_callable():
@@ -873,17 +891,55 @@ class _IOFile(str, AnnotatedStringInterface):
             )
             file_with_wildcards_applied.clone_flags(self, skip_storage_object=True)
             file_with_wildcards_applied.flags["storage_object"] = storage_object
-        else:
+        elif self.is_callable() or not intern:
             file_with_wildcards_applied = IOFile(
                 apply_wildcards(f, wildcards),
                 rule=self.rule,
             )
             file_with_wildcards_applied.clone_flags(self)
+        else:
+            file_with_wildcards_applied = self._intern(
+                self.wildcard_template().apply(wildcards)
+            )
 
         return file_with_wildcards_applied
 
+    def _intern(self, path: str) -> "_IOFile":
+        """Return the file with the given path, carrying the rule and flags of
+        this pattern.
+
+        If the pattern does not contain all wildcards of the rule (e.g. a
+        reference genome or a per sample file used by per sample and
+        chromosome jobs), the same file occurs in many jobs. Such files are
+        interned as long as they are alive, such that they are a single
+        object among all jobs instead of one per job. Hence, the returned
+        file must not be modified.
+        """
+        if self._interned is None:
+            shared = (
+                self.rule is not None
+                and self.get_wildcard_names() < self.rule.wildcard_names
+            )
+            self._interned = weakref.WeakValueDictionary() if shared else False
+        interned = self._interned
+        if interned is False:
+            f = IOFile(path, rule=self.rule)
+            f.clone_flags(self)
+            return f
+        f = interned.get(path)
+        if f is None:
+            f = IOFile(path, rule=self.rule)
+            f.clone_flags(self)
+            interned[path] = f
+        return f
+
+    def wildcard_template(self) -> "WildcardTemplate":
+        if self._template is None:
+            self._template = WildcardTemplate(self.file)
+        return self._template
+
     def get_wildcard_names(self):
-        return get_wildcard_names(self.file)
+        return set(self.wildcard_template().names)
 
     def regex(self):
         if self._regex is None:
@@ -976,6 +1032,9 @@ MaybeAnnotated = Union[AnnotatedStringInterface, str, Callable]
 
 
 def is_flagged(value: MaybeAnnotated, flag: str) -> bool:
+    if type(value) is AnnotatedString:
+        # fast path, isinstance checks against the abstract interface are costly
+        return bool(value.flags.get(flag))
     if not isinstance(value, AnnotatedStringInterface):
         return False
     return value.is_flagged(flag)
@@ -1026,70 +1085,161 @@ _illegal_wildcard_name_regex = re.compile(
 )
 
 
+# Directories are listed to check the existence of the files in them (see
+# _missing_locally) if they contain at least this number of the files.
+LIST_THRESHOLD = 4
+
+
+def _missing_locally(paths: List[str]) -> List[str]:
+    """Return the given paths that do not exist locally.
+
+    Paths that share a directory with enough others are looked up in a single
+    listing of the directory instead of being checked one by one. Listing a
+    directory also makes NFS clients revalidate their cached view of it, which
+    could otherwise report new files as missing for a while. Paths that are not
+    listed as regular entries (e.g. symlinks) are checked individually.
+    """
+    by_dir: Dict[str, List[str]] = collections.defaultdict(list)
+    single = []
+    for path in paths:
+        parent, name = os.path.split(os.path.normpath(path))
+        if name in ("", ".", ".."):
+            single.append(path)
+        else:
+            by_dir[parent].append(path)
+
+    missing = []
+    for parent, in_dir in by_dir.items():
+        if len(in_dir) < LIST_THRESHOLD:
+            single.extend(in_dir)
+            continue
+        try:
+            with os.scandir(parent or os.curdir) as entries:
+                present = {entry.name for entry in entries if not entry.is_symlink()}
+        except OSError:
+            present = set()
+        missing.extend(
+            path
+            for path in in_dir
+            if os.path.basename(os.path.normpath(path)) not in present
+            and not os.path.exists(path)
+        )
+    missing.extend(path for path in single if not os.path.exists(path))
+    return missing
+
+
 async def wait_for_files(
     files,
     latency_wait=3,
     wait_for_local=False,
     ignore_pipe_or_service=False,
     consider_local: Set[_IOFile] = _CONSIDER_LOCAL_DEFAULT,
+    notify: bool = True,
 ):
-    """Wait for given files to be present in the filesystem."""
+    """Wait for given files to be present in the filesystem.
+
+    The files are checked concurrently and without blocking the event loop,
+    and only the files that are still missing are checked again. If notify is
+    True, the directories of missing local files are watched with inotify (on
+    Linux), such that waiting ends as soon as they appear. Files created on
+    other hosts of a network filesystem are only noticed by checking again
+    periodically.
+    """
 
     from ismk.io.fmt import fmt_iofile
 
-    files = list(files)
+    def in_storage(f):
+        return (
+            isinstance(f, _IOFile)
+            and f not in consider_local
+            and f.is_storage
+            and (not wait_for_local or f.should_not_be_retrieved_from_storage)
+        )
 
-    async def get_missing(list_parent=False):
-        async def eval_file(f):
-            if (
-                is_flagged(f, "pipe") or is_flagged(f, "service")
-            ) and ignore_pipe_or_service:
-                return None
-            if (
-                isinstance(f, _IOFile)
-                and f not in consider_local
-                and f.is_storage
-                and (not wait_for_local or f.should_not_be_retrieved_from_storage)
-            ):
-                if not await f.exists_in_storage():
-                    return f"{f.storage_object.print_query} (missing in storage)"
-            elif not os.path.exists(f):
+    async def get_missing(files):
+        local = [f for f in files if not in_storage(f)]
+        storage = [f for f in files if in_storage(f)]
+        missing_local, exists_in_storage = await asyncio.gather(
+            (
+                asyncio.to_thread(_missing_locally, local)
+                if local
+                else asyncio.sleep(0, [])
+            ),
+            asyncio.gather(*(f.exists_in_storage() for f in storage)),
+        )
+        missing = set(map(id, missing_local))
+        missing.update(
+            id(f) for f, exists in zip(storage, exists_in_storage) if not exists
+        )
+        return [f for f in files if id(f) in missing]
+
+    def fmt_missing(missing, list_parent=False):
+        def fmt(f):
+            if in_storage(f):
+                return f"{f.storage_object.print_query} (missing in storage)"
+            path = fmt_iofile(f) if isinstance(f, _IOFile) else f
+            if list_parent:
                 parent_dir = os.path.dirname(f)
-                if list_parent:
-                    parent_msg = (
-                        f" contents: {', '.join(os.listdir(parent_dir))}"
-                        if os.path.exists(parent_dir)
-                        else " not present"
-                    )
-                    return f"{fmt_iofile(f)} (missing locally, parent dir{parent_msg})"
-                else:
-                    return f"{fmt_iofile(f)} (missing locally)"
-            return None
-
-        return list(filter(None, [await eval_file(f) for f in files]))
+                parent_msg = (
+                    f" contents: {', '.join(os.listdir(parent_dir))}"
+                    if os.path.exists(parent_dir)
+                    else " not present"
+                )
+                return f"{path} (missing locally, parent dir{parent_msg})"
+            return f"{path} (missing locally)"
 
-    missing = await get_missing()
-    if missing:
-        fmt_missing = "\n".join
+        return "\n".join(map(fmt, missing))
 
-        sleep = max(latency_wait / 10, 1)
-        before_time = time.time()
-        logger.info(
-            f"Waiting at most {latency_wait} seconds for missing files:\n{fmt_missing(missing)}"
+    files = [
+        f
+        for f in files
+        if not (
+            ignore_pipe_or_service
+            and (is_flagged(f, "pipe") or is_flagged(f, "service"))
         )
-        while time.time() - before_time < latency_wait:
-            missing = await get_missing()
-            logger.debug("still missing files, waiting...")
+    ]
+    missing = await get_missing(files)
+    if not missing:
+        return
+
+    logger.info(
+        f"Waiting at most {latency_wait} seconds for missing files:\n{fmt_missing(missing)}"
+    )
+    sleep = max(latency_wait / 10, 1)
+    deadline = time.monotonic() + latency_wait
+    notifier = create_notifier() if notify and latency_wait > 0 else None
+    try:
+        while True:
+            if notifier is not None:
+                try:
+                    for f in missing:
+                        if not in_storage(f):
+                            notifier.track(str(f))
+                except OSError as e:
+                    # e.g. too many watches
+                    logger.debug(f"Unable to watch missing files ({e}).")
+                    notifier.close()
+                    notifier = None
+            timeout = min(sleep, deadline - time.monotonic())
+            if timeout <= 0:
+                break
+            if notifier is not None:
+                await notifier.wait(timeout)
+            else:
+                await asyncio.sleep(timeout)
+            missing = await get_missing(missing)
             if not missing:
                 return
-            time.sleep(sleep)
-        missing = fmt_missing(await get_missing(list_parent=True))
-        raise IOError(
-            f"Missing files after {latency_wait} seconds. This might be due to "
-            "filesystem latency. If that is the case, consider to increase the "
-            "wait time with --latency-wait:\n"
-            f"{missing}"
-        )
+            logger.debug("still missing files, waiting...")
+    finally:
+        if notifier is not None:
+            notifier.close()
+    raise IOError(
+        f"Missing files after {latency_wait} seconds. This might be due to "
+        "filesystem latency. If that is the case, consider to increase the "
+        "wait time with --latency-wait:\n"
+        f"{fmt_missing(missing, list_parent=True)}"
+    )
 
 
 def get_wildcard_names(pattern):
@@ -1138,7 +1288,7 @@ def get_wildcard_constraints(pattern):
     return constraints
 
 
-def regex_from_filepattern(filepattern):
+def regex_from_filepattern(filepattern, group_prefix=""):
     f = []
     last = 0
     wildcards = set()
@@ -1151,11 +1301,12 @@ def regex_from_filepattern(filepattern):
                     "Constraint regex must be defined only in the first "
                     "occurrence of the wildcard in a string."
                 )
-            f.append(f"(?P={wildcard})")
+            f.append(f"(?P={group_prefix}{wildcard})")
         else:
             wildcards.add(wildcard)
             f.append(
-                "(?P<{}>{})".format(
+                "(?P<{}{}>{})".format(
+                    group_prefix,
                     wildcard,
                     match.group("constraint") if match.group("constraint") else ".+",
                 )
@@ -1166,16 +1317,45 @@ def regex_from_filepattern(filepattern):
     return "".join(f)
 
 
-def apply_wildcards(pattern, wildcards):
-    def format_match(match):
-        name = match.group("name")
+class WildcardTemplate:
+    """A file pattern, compiled once into a format string with a slot for each
+    wildcard, such that applying wildcards does not have to parse the pattern
+    again (see _IOFile.wildcard_template and apply_wildcards).
+    """
+
+    __slots__ = ["names", "_format"]
+
+    def __init__(self, pattern: str):
+        parts = []
+        names = []
+        last = 0
+        for match in WILDCARD_REGEX.finditer(pattern):
+            parts.append(pattern[last : match.start()].replace("%", "%%"))
+            parts.append("%s")  # converts anything into a str
+            names.append(match.group("name"))
+            last = match.end()
+        parts.append(pattern[last:].replace("%", "%%"))
+        self.names: Tuple[str, ...] = tuple(names)
+        self._format = "".join(parts)
+
+    def apply(self, wildcards) -> str:
         try:
-            value = wildcards[name]
-            return str(value)  # convert anything into a str
+            values = tuple([wildcards[name] for name in self.names])
         except KeyError as ex:
             raise WildcardError(str(ex))
+        return self._format % values
+
+
+@functools.lru_cache(maxsize=10000)
+def _wildcard_template(pattern: str) -> WildcardTemplate:
+    return WildcardTemplate(pattern)
+
 
-    return WILDCARD_REGEX.sub(format_match, pattern)
+def apply_wildcards(pattern, wildcards):
+    if "{" not in pattern:
+        # e.g. paths returned by input functions
+        return str(pattern)
+    return _wildcard_template(pattern).apply(wildcards)
 
 
 def is_callable(value):
@@ -1418,6 +1598,9 @@ def expand(*args, **wildcard_values):
     **wildcard_values -- the wildcards as keyword arguments
         with their values as lists. If allow_missing=True is included
         wildcards in filepattern without values will stay unformatted.
+        If lazy=True is included, a sequence is returned that formats the
+        paths on demand and checks membership without formatting them (see
+        ismk.io.expansion.Expansion).
     """
     from ismk.path_modifier import PATH_MODIFIER_FLAG
 
@@ -1465,6 +1648,11 @@ def expand(*args, **wildcard_values):
                 format_dict = dict
                 break
 
+    lazy = wildcard_values.get("lazy") is True and not any(
+        "lazy" in re.findall(r"{([^}\.[!:]+)", filepattern)
+        for filepattern in filepatterns
+    )
+
     callables = {
         key: value
         for key, value in wildcard_values.items()
@@ -1482,23 +1670,51 @@ def expand(*args, **wildcard_values):
         for filepattern in filepatterns
     }
 
+    # Parse each filepattern once instead of once per combination.
+    # str.format_map does that in C, but unlike string.Formatter, it does not
+    # support positional fields, which are an error anyway in the absence of
+    # positional arguments, but a different one.
+    formatter = string.Formatter()
+
+    def is_positional(field_name, format_spec):
+        return (
+            not field_name
+            or field_name.split(".")[0].split("[")[0].isdigit()
+            or "{" in format_spec
+        )
+
+    def compile_pattern(filepattern):
+        try:
+            fields = list(formatter.parse(filepattern))
+        except ValueError:
+            # invalid pattern, raise upon expansion as before
+            fields = None
+        if fields is None or any(
+            is_positional(field_name, format_spec)
+            for _, field_name, format_spec, _ in fields
+            if field_name is not None
+        ):
+            return functools.partial(formatter.vformat, filepattern, ())
+        return filepattern.format_map
+
+    formats = list(map(compile_pattern, filepatterns))
+
     def do_expand(
         wildcard_values: Dict[
             str, dict[str, Union[str, collections.abc.Iterable[str]]]
         ],
     ):
-        def flatten(
-            wildcard_values: Dict[str, Union[str, collections.abc.Iterable[str]]],
-        ):
-            for wildcard, value in wildcard_values.items():
-                if (
-                    isinstance(value, str)
-                    or not isinstance(value, collections.abc.Iterable)
-                    or is_namedtuple_instance(value)
-                ):
-                    values: collections.abc.Iterable[str] = [value]  # type: ignore[list-item]
-                else:
-                    values = value
+        def as_list(value) -> list:
+            if (
+                isinstance(value, str)
+                or not isinstance(value, collections.abc.Iterable)
+                or is_namedtuple_instance(value)
+            ):
+                return [value]
+            return list(value)
+
+        def flatten(wildcard_values: Dict[str, list]):
+            for wildcard, values in wildcard_values.items():
                 yield [(wildcard, value) for value in values]
 
         # string.Formatter does not fully support AnnotatedString (flags are discarded)
@@ -1509,17 +1725,37 @@ def expand(*args, **wildcard_values):
                 dest_path.flags.update(from_path.flags)
             return dest_path
 
-        formatter = string.Formatter()
-        try:
-            return [
-                copy_flags(filepattern, formatter.vformat(filepattern, (), comb))  # type: ignore[arg-type]
-                for filepattern in filepatterns
-                for comb in map(
-                    format_dict, combinator(*flatten(wildcard_values[filepattern]))
-                )
-            ]
-        except KeyError as e:
-            raise WildcardError(f"No values given for wildcard {e}.")
+        parts: List[Sequence[str]] = []
+        for filepattern, format_pattern in zip(filepatterns, formats):
+            values = {
+                wildcard: as_list(value)
+                for wildcard, value in wildcard_values[filepattern].items()
+            }
+            # plain patterns combined with product or zip are formatted on
+            # demand and in bulk
+            expanded = ExpandedPattern.create(
+                filepattern,
+                values,
+                combinator,
+                allow_missing=format_dict is not dict,
+                wrap=(
+                    functools.partial(copy_flags, filepattern)
+                    if hasattr(filepattern, "flags")
+                    else None
+                ),
+            )
+            if expanded is None:
+                try:
+                    expanded = [
+                        copy_flags(filepattern, format_pattern(comb))  # type: ignore[arg-type]
+                        for comb in map(format_dict, combinator(*flatten(values)))
+                    ]
+                except KeyError as e:
+                    raise WildcardError(f"No values given for wildcard {e}.")
+            parts.append(expanded)
+        if lazy:
+            return Expansion(parts)
+        return list(chain.from_iterable(parts))
 
     if callables:
         # defer expansion and return a function that does the expansion once it is called with
@@ -1615,10 +1851,16 @@ def limit(pattern: Union[str, AnnotatedString], **wildcards):
     )
 
 
-def glob_wildcards(pattern, files=None, followlinks=False):
+def glob_wildcards(pattern, files=None, followlinks=False, cache=False):
     """
     Glob the values of the wildcards by matching the given pattern to the filesystem.
     Returns a named tuple with a list of values for each wildcard.
+
+    Only directories that may contain matching files are visited, and they are
+    listed in parallel. If cache is True (or the path of an sqlite database),
+    the listings of the visited directories are persisted in
+    .ismk/glob_cache.sqlite, and directories whose mtime has not changed since
+    are not listed again.
     """
     if is_flagged(pattern, "storage_object"):
         if files is not None:
@@ -1634,33 +1876,23 @@ def glob_wildcards(pattern, files=None, followlinks=False):
     else:
         pattern = os.path.normpath(pattern)
 
-    first_wildcard = re.search("{[^{]", pattern)
-    dirname = (
-        os.path.dirname(pattern[: first_wildcard.start()])
-        if first_wildcard
-        else os.path.dirname(pattern)
-    )
-    if not dirname:
-        dirname = "."
-
     _names = [match.group("name") for match in WILDCARD_REGEX.finditer(pattern)]
     names: list[str] = sorted(set(_names), key=_names.index)
     Wildcards = collections.namedtuple("Wildcards", names)  # type: ignore[misc]
     wildcards = Wildcards(*[list() for name in names])
 
-    pattern = re.compile(regex_from_filepattern(pattern))
+    regex = re.compile(regex_from_filepattern(pattern))
 
     if files is None:
-        files = (
-            os.path.normpath(os.path.join(dirpath, f))
-            for dirpath, dirnames, filenames in os.walk(
-                dirname, followlinks=followlinks
+        listing_cache = None
+        if cache:
+            listing_cache = get_listing_cache(
+                DEFAULT_CACHE_PATH if cache is True else cache
             )
-            for f in chain(filenames, dirnames)
-        )
+        files = walk_pattern(pattern, followlinks=followlinks, cache=listing_cache)
 
     for f in files:
-        match = re.match(pattern, f)
+        match = regex.match(f)
         if match:
             for name, value in match.groupdict().items():
                 getattr(wildcards, name).append(value)
@@ -0,0 +1,261 @@
+__author__ = "Johannes Köster"
+__copyright__ = "Copyright 2022, Johannes Köster"
+__email__ = "johannes.koester@uni-due.de"
+__license__ = "MIT"
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ismk.exceptions import WorkflowError
+from ismk.logging import logger
+
+# Increment this when the table layout changes to invalidate previously
+# persisted checksums.
+CHECKSUMS_VERSION = 1
+
+# Files are read in chunks of this size.
+CHUNKSIZE = 1024 * 1024
+
+# Constructors of the supported checksum algorithms, by name (see
+# --checksum-algorithm).
+CHECKSUM_ALGORITHMS: Dict[str, Callable] = {
+    "sha256": hashlib.sha256,
+    "blake2b": hashlib.blake2b,
+}
+try:
+    import xxhash
+
+    CHECKSUM_ALGORITHMS["xxh3_128"] = xxhash.xxh3_128
+except ImportError:
+    pass
+
+# Checksums recorded without the name of the algorithm have been computed
+# with this one.
+DEFAULT_CHECKSUM_ALGORITHM = "sha256"
+
+# Checksums of files modified less than this number of seconds before being
+# hashed are not memoized, since a later modification within the timestamp
+# granularity of the file system would not change their mtime.
+RACY_INTERVAL = 1.0
+
+_SCHEMA = f"""
+DROP TABLE IF EXISTS checksums;
+CREATE TABLE checksums (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    algorithm TEXT NOT NULL,
+    checksum TEXT NOT NULL,
+    PRIMARY KEY (dev, ino, algorithm)
+);
+PRAGMA user_version = {CHECKSUMS_VERSION};
+"""
+
+# device, inode, size and mtime of a file, and the name of the algorithm
+Key = Tuple[int, int, int, int, str]
+
+
+def hash_file(
+    path: str, algorithm: Callable = hashlib.sha256, chunksize: int = CHUNKSIZE
+) -> str:
+    """Return the hexdigest of the given file, which is read in chunks."""
+    h = algorithm()
+    buffer = bytearray(chunksize)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while n := f.readinto(buffer):
+            h.update(view[:n])
+    return h.hexdigest()
+
+
+def get_checksum_algorithm(name: str) -> Callable:
+    try:
+        return CHECKSUM_ALGORITHMS[name]
+    except KeyError:
+        if name == "xxh3_128":
+            raise WorkflowError(
+                "The checksum algorithm xxh3_128 requires the xxhash package. "
+                "Install it e.g. via pip install ismk[xxhash]."
+            )
+        raise WorkflowError(
+            f"Unknown checksum algorithm {name}. Supported algorithms: "
+            f"{', '.join(CHECKSUM_ALGORITHMS)}."
+        )
+
+
+def _key(st: os.stat_result, algorithm: str) -> Key:
+    return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, algorithm
+
+
+class ChecksumStore:
+    """Persistent checksums of local files in an sqlite database, by device,
+    inode, size and mtime of the files (see ChecksumService). Only the latest
+    checksum of each file is kept."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._new: Dict[Key, str] = dict()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            try:
+                (version,) = conn.execute("PRAGMA user_version").fetchone()
+                if version != CHECKSUMS_VERSION:
+                    conn.executescript(_SCHEMA)
+            except sqlite3.Error:
+                conn.close()
+                raise
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: Key) -> Optional[str]:
+        if key in self._new:
+            return self._new[key]
+        dev, ino, size, mtime_ns, algorithm = key
+        row = (
+            self._connect()
+            .execute(
+                "SELECT checksum FROM checksums WHERE dev = ? AND ino = ? AND "
+                "algorithm = ? AND size = ? AND mtime_ns = ?",
+                (dev, ino, algorithm, size, mtime_ns),
+            )
+            .fetchone()
+        )
+        return row[0] if row is not None else None
+
+    def put(self, key: Key, checksum: str):
+        self._new[key] = checksum
+        if len(self._new) >= 1000:
+            self.flush()
+
+    def flush(self):
+        if not self._new:
+            return
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO checksums "
+                "(dev, ino, size, mtime_ns, algorithm, checksum) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [key + (checksum,) for key, checksum in self._new.items()],
+            )
+        self._new.clear()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class ChecksumService:
+    """Compute checksums of local files with a pool of threads (hashlib releases
+    the GIL while hashing).
+
+    Checksums are memoized by device, inode, size and mtime of the files, in
+    memory and, if a store is given, persistently across runs. Hence, files
+    that are consumed by many jobs are only hashed once.
+    """
+
+    def __init__(
+        self,
+        n_threads: int = min(8, os.cpu_count() or 1),
+        store: Optional[ChecksumStore] = None,
+        chunksize: int = CHUNKSIZE,
+    ):
+        self.n_threads = max(n_threads, 1)
+        self.store = store
+        self.chunksize = chunksize
+        self._memo: Dict[Key, str] = dict()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    async def checksum(self, path: str, algorithm: Callable = hashlib.sha256) -> str:
+        """Return the hexdigest of the given file. Raises OSError if the file
+        cannot be read."""
+        st = os.stat(path)
+        h = algorithm()
+        if st.st_size == 0:
+            # Do not read at all. This avoids endless reading in case the file
+            # is a named pipe or a socket or a symlink to a device like
+            # /dev/random.
+            return h.hexdigest()
+        name = getattr(h, "name", algorithm.__name__)
+        key = _key(st, name)
+        checksum = self._lookup(key)
+        if checksum is not None:
+            return checksum
+
+        start = time.time_ns()
+        checksum = await asyncio.get_running_loop().run_in_executor(
+            self._get_pool(), hash_file, path, algorithm, self.chunksize
+        )
+        if st.st_mtime_ns < start - RACY_INTERVAL * 1e9 and (
+            _key(os.stat(path), name) == key
+        ):
+            self._memoize(key, checksum)
+        return checksum
+
+    async def checksums(
+        self, paths: List[str], algorithm: Callable = hashlib.sha256
+    ) -> List[str]:
+        """Return the hexdigests of the given files, hashed concurrently."""
+        return await asyncio.gather(
+            *(self.checksum(path, algorithm=algorithm) for path in paths)
+        )
+
+    def close(self):
+        """Persist the newly memoized checksums and stop the threads."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self.store is not None:
+            with self._store_errors():
+                self.store.flush()
+            if self.store is not None:
+                self.store.close()
+                self.store = None
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.n_threads, thread_name_prefix="ismk-checksum"
+                )
+            return self._pool
+
+    def _lookup(self, key: Key) -> Optional[str]:
+        with self._lock:
+            checksum = self._memo.get(key)
+            if checksum is None and self.store is not None:
+                with self._store_errors():
+                    checksum = self.store.get(key)
+                if checksum is not None:
+                    self._memo[key] = checksum
+            return checksum
+
+    def _memoize(self, key: Key, checksum: str):
+        with self._lock:
+            self._memo[key] = checksum
+            if self.store is not None:
+                with self._store_errors():
+                    self.store.put(key, checksum)
+
+    @contextmanager
+    def _store_errors(self):
+        try:
+            yield
+        except sqlite3.Error as e:
+            # persisting checksums is an optimization only
+            logger.debug(f"Disabling checksum store because of error: {e}")
+            self.store.close()
+            self.store = None
@@ -0,0 +1,267 @@
+__author__ = "Johannes Köster"
+__copyright__ = "Copyright 2022, Johannes Köster"
+__email__ = "johannes.koester@uni-due.de"
+__license__ = "MIT"
+
+import collections.abc
+from itertools import chain, product
+import math
+from operator import itemgetter
+import string
+from typing import Callable, Iterator, List, Optional, Sequence
+
+from ismk.exceptions import WildcardError
+
+# Patterns with more combinations than this are formatted with NumPy, if it is
+# available.
+NUMPY_THRESHOLD = 1000000
+
+# Number of paths formatted with NumPy at once. This bounds the memory needed
+# for the fixed width string arrays.
+NUMPY_CHUNKSIZE = 65536
+
+_formatter = string.Formatter()
+
+
+class ExpandedPattern(collections.abc.Sequence):
+    """The paths obtained by formatting a file pattern with each combination
+    of the values of its wildcards (see expand).
+
+    Paths are formatted on demand, membership is checked by splitting the
+    given path at the literal parts of the pattern and looking up the
+    resulting values. Only itertools.product and zip are supported as
+    combinators, and only plain wildcards (without format specifications,
+    conversions, attributes or indexes), see ExpandedPattern.create.
+    """
+
+    def __init__(
+        self,
+        literals: List[str],
+        slots: List[int],
+        values: List[List[str]],
+        combinator: Callable,
+        wrap: Optional[Callable[[str], str]] = None,
+    ):
+        # literals[i] precedes the i-th wildcard occurrence, which is filled
+        # with a value of the wildcard values[slots[i]]
+        self._literals = literals
+        self._slots = slots
+        self._values = values
+        self._combinator = combinator
+        self._wrap = wrap
+        self._template = "%s".join(literal.replace("%", "%%") for literal in literals)
+        # combinations are tuples of values in the order of the wildcards
+        self._reorder = (
+            None if slots == list(range(len(values))) else itemgetter(*slots)
+        )
+        self._value_sets: Optional[List[set]] = None
+        self._combinations: Optional[set] = None
+        if combinator is product:
+            self._len = math.prod(map(len, values))
+        else:
+            self._len = min(map(len, values), default=0)
+
+    @classmethod
+    def create(
+        cls,
+        pattern: str,
+        values: "dict[str, List]",
+        combinator: Callable,
+        allow_missing: bool = False,
+        wrap: Optional[Callable[[str], str]] = None,
+    ) -> Optional["ExpandedPattern"]:
+        """Return the expansion of the given pattern with the given values of
+        its wildcards, or None if the pattern or combinator is not supported.
+        """
+        if combinator is not product and combinator is not zip:
+            return None
+        wildcards = list(values)
+        literals = []
+        slots = []
+        literal = ""
+        missing = None
+        for text, name, format_spec, conversion in _formatter.parse(pattern):
+            literal += text
+            if name is None:
+                continue
+            if not name.isidentifier() or format_spec or conversion:
+                return None
+            if name not in values:
+                if allow_missing:
+                    literal += f"{{{name}}}"
+                    continue
+                missing = missing or name
+            else:
+                literals.append(literal)
+                slots.append(wildcards.index(name))
+                literal = ""
+        literals.append(literal)
+
+        expanded = cls(
+            literals,
+            slots,
+            # format each value once instead of in each combination, as
+            # str.format would
+            [[format(value, "") for value in values[w]] for w in wildcards],
+            combinator,
+            wrap=wrap,
+        )
+        if missing is not None and len(expanded):
+            raise WildcardError(f"No values given for wildcard '{missing}'.")
+        return expanded
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._len))]
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("expansion index out of range")
+        if self._combinator is product:
+            combination = [None] * len(self._values)
+            for w in reversed(range(len(self._values))):
+                index, i = divmod(index, len(self._values[w]))
+                combination[w] = self._values[w][i]
+        else:
+            combination = [values[index] for values in self._values]
+        return self._format(tuple(combination))
+
+    def __iter__(self) -> Iterator[str]:
+        if self._len > NUMPY_THRESHOLD:
+            try:
+                import numpy
+            except ImportError:
+                pass
+            else:
+                paths = self._iter_numpy(numpy)
+                return paths if self._wrap is None else map(self._wrap, paths)
+        combinations = self._combinator(*self._values)
+        if self._reorder is not None:
+            combinations = map(self._reorder, combinations)
+        paths = map(self._template.__mod__, combinations)
+        return paths if self._wrap is None else map(self._wrap, paths)
+
+    def __contains__(self, path) -> bool:
+        if not isinstance(path, str) or not path.startswith(self._literals[0]):
+            return False
+        if self._value_sets is None:
+            self._value_sets = [set(values) for values in self._values]
+        return self._match(str(path), len(self._literals[0]), 0, {})
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} of {self._len} paths>"
+
+    def _format(self, combination: tuple) -> str:
+        if self._reorder is not None:
+            combination = self._reorder(combination)
+        path = self._template % combination
+        return path if self._wrap is None else self._wrap(path)
+
+    def _match(self, path: str, pos: int, slot: int, chosen: dict) -> bool:
+        if slot == len(self._slots):
+            if pos != len(path):
+                return False
+            if self._combinator is product:
+                return True
+            if self._combinations is None:
+                self._combinations = set(zip(*self._values))
+            return tuple(chosen[w] for w in range(len(self._values))) in (
+                self._combinations
+            )
+
+        w = self._slots[slot]
+        literal = self._literals[slot + 1]
+        if slot + 1 == len(self._slots):
+            # the last value is followed by the end of the path
+            end = len(path) - len(literal)
+            ends = [end] if end >= pos and path.endswith(literal) else []
+        elif literal:
+            ends = _find_all(path, literal, pos)
+        else:
+            ends = range(pos, len(path) + 1)
+        for end in ends:
+            value = path[pos:end]
+            if w in chosen:
+                if chosen[w] != value:
+                    continue
+                if self._match(path, end + len(literal), slot + 1, chosen):
+                    return True
+            elif value in self._value_sets[w]:
+                chosen[w] = value
+                if self._match(path, end + len(literal), slot + 1, chosen):
+                    return True
+                del chosen[w]
+        return False
+
+    def _iter_numpy(self, numpy) -> Iterator[str]:
+        arrays = [numpy.array(values, dtype=str) for values in self._values]
+        shape = tuple(map(len, self._values))
+        for start in range(0, self._len, NUMPY_CHUNKSIZE):
+            indexes = numpy.arange(start, min(start + NUMPY_CHUNKSIZE, self._len))
+            if self._combinator is product:
+                indexes = numpy.unravel_index(indexes, shape)
+            else:
+                indexes = [indexes] * len(arrays)
+            # there is at least one wildcard, otherwise there would be at
+            # most one path
+            paths = numpy.char.add(
+                self._literals[0], arrays[self._slots[0]][indexes[self._slots[0]]]
+            )
+            for w, literal in zip(self._slots[1:], self._literals[1:]):
+                if literal:
+                    paths = numpy.char.add(paths, literal)
+                paths = numpy.char.add(paths, arrays[w][indexes[w]])
+            if self._literals[-1]:
+                paths = numpy.char.add(paths, self._literals[-1])
+            yield from paths.tolist()
+
+
+def _find_all(text: str, sub: str, start: int) -> Iterator[int]:
+    i = text.find(sub, start)
+    while i != -1:
+        yield i
+        i = text.find(sub, i + 1)
+
+
+class Expansion(collections.abc.Sequence):
+    """The result of expand(..., lazy=True): the concatenated expansions of
+    the given patterns, which are formatted on demand.
+
+    Patterns that are not supported by ExpandedPattern are expanded eagerly.
+    """
+
+    def __init__(self, parts: List[Sequence[str]]):
+        self._parts = parts
+
+    def __len__(self) -> int:
+        return sum(map(len, self._parts))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index >= 0:
+            for part in self._parts:
+                if index < len(part):
+                    return part[index]
+                index -= len(part)
+        raise IndexError("expansion index out of range")
+
+    def __iter__(self) -> Iterator[str]:
+        return chain.from_iterable(self._parts)
+
+    def __contains__(self, path) -> bool:
+        return any(path in part for part in self._parts)
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} of {len(self)} paths>"
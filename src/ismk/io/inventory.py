@@ -0,0 +1,250 @@
+__author__ = "Johannes Köster"
+__copyright__ = "Copyright 2022, Johannes Köster"
+__email__ = "johannes.koester@uni-due.de"
+__license__ = "MIT"
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sqlite3
+import time
+from collections import defaultdict
+from typing import TYPE_CHECKING, Dict, Iterable, Optional, Set, Tuple
+
+from ismk.interfaces.storage_plugins.io import Mtime
+from ismk.io.stat_engine import local_mtime
+
+if TYPE_CHECKING:
+    from ismk.io import IOCache
+
+# Increment this when the table layout changes to invalidate previously
+# persisted inventories.
+INVENTORY_VERSION = 1
+
+# Directories modified less than this number of seconds before being listed are
+# not recorded, since a later modification within the timestamp granularity of
+# the file system would not change their mtime.
+RACY_INTERVAL = 1.0
+
+_SCHEMA = f"""
+DROP TABLE IF EXISTS directories;
+DROP TABLE IF EXISTS files;
+CREATE TABLE directories (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE files (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    present INTEGER NOT NULL,
+    mtime REAL,
+    size INTEGER
+);
+CREATE INDEX files_directory ON files (directory);
+PRAGMA user_version = {INVENTORY_VERSION};
+"""
+
+# name, mtime and size of a file to be recorded
+Entry = Tuple[str, Optional[float], Optional[int]]
+
+
+def _split(path: str) -> Optional[Tuple[str, str]]:
+    parent, name = os.path.split(path)
+    if name in ("", ".", ".."):
+        return None
+    return parent or os.curdir, name
+
+
+class InventoryStore:
+    """Persistent inventory of local files in an sqlite database (see
+    Persistence.load_iocache).
+
+    For each recorded directory, the store keeps its mtime and, for the
+    recorded files in it, existence, mtime and size. Since creating, deleting
+    or renaming a file changes the mtime of its directory, the existence of
+    the files of a directory remains valid as long as its mtime is unchanged.
+    Modifying a file in place does not change the mtime of its directory,
+    hence recorded mtimes and sizes are only reused on request (see
+    --trust-io-cache). Symlinks are not recorded, since their existence
+    depends on their target as well.
+    """
+
+    def __init__(self, path: str, n_threads: int = 8):
+        self.path = path
+        self.n_threads = max(n_threads, 1)
+        self._conn: Optional[sqlite3.Connection] = None
+        # files that have been modified by finished jobs, with their directory
+        self._pending: Dict[str, str] = dict()
+        # files whose mtime and size have been obtained during this run
+        self._fresh: Set[str] = set()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            try:
+                (version,) = conn.execute("PRAGMA user_version").fetchone()
+                if version != INVENTORY_VERSION:
+                    conn.executescript(_SCHEMA)
+            except sqlite3.Error:
+                conn.close()
+                raise
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def load(self, cache: "IOCache", trust_mtime: bool = False) -> int:
+        """Fill the given cache with the files of all directories that have not
+        been modified since they have been recorded. Returns the number of
+        files that have been loaded."""
+        conn = self._connect()
+        directories = conn.execute("SELECT path, mtime_ns FROM directories").fetchall()
+        if not directories:
+            return 0
+
+        def is_unmodified(item):
+            path, mtime_ns = item
+            try:
+                return os.stat(path).st_mtime_ns == mtime_ns
+            except OSError:
+                return False
+
+        with ThreadPoolExecutor(max_workers=self.n_threads) as pool:
+            unmodified = {
+                path
+                for (path, _), valid in zip(
+                    directories, pool.map(is_unmodified, directories)
+                )
+                if valid
+            }
+
+        n = 0
+        for path, directory, present, mtime, size in conn.execute(
+            "SELECT path, directory, present, mtime, size FROM files"
+        ):
+            if directory not in unmodified:
+                continue
+            cache.exists_local[path] = bool(present)
+            if trust_mtime and present:
+                if mtime is not None:
+                    cache.mtime[path] = Mtime(local=mtime)
+                    self._fresh.add(path)
+                if size is not None:
+                    cache.size[path] = size
+            n += 1
+        return n
+
+    def record(self, cache: "IOCache"):
+        """Record the local files known to the given cache, together with the
+        current state of their directories."""
+        files: Dict[str, Dict[str, Entry]] = defaultdict(dict)
+        for f, present in cache.exists_local.items():
+            if getattr(f, "is_storage", False):
+                continue
+            path = str(f)
+            split = _split(path)
+            if split is None:
+                continue
+            mtime = cache.mtime.get(f) if present else None
+            if mtime is not None and mtime.local() is not None:
+                self._fresh.add(path)
+                files[split[0]][path] = (split[1], mtime.local(), cache.size.get(f))
+            else:
+                files[split[0]][path] = (split[1], None, None)
+        self._record(files)
+
+    def update(self, paths: Iterable[str]):
+        """Remember the given files for being recorded by flush, e.g. after
+        they have been created by a job. Nothing is queried or written here,
+        since this happens for every finished job."""
+        for path in paths:
+            split = _split(path)
+            if split is not None:
+                self._pending[path] = split[0]
+
+    def flush(self):
+        """Record the files that have been updated (see update), together with
+        the other files of their directories."""
+        if not self._pending:
+            return
+        conn = self._connect()
+        files: Dict[str, Dict[str, Entry]] = defaultdict(dict)
+        for directory in set(self._pending.values()):
+            for path, mtime, size in conn.execute(
+                "SELECT path, mtime, size FROM files WHERE directory = ?",
+                (directory,),
+            ):
+                name = _split(path)[1]
+                if path in self._fresh:
+                    files[directory][path] = (name, mtime, size)
+                else:
+                    files[directory][path] = (name, None, None)
+
+        def stat(path):
+            try:
+                mtime, mtime_target = local_mtime(path)
+                return mtime, os.path.getsize(path), mtime_target is not None
+            except OSError:
+                return None, None, False
+
+        with ThreadPoolExecutor(max_workers=self.n_threads) as pool:
+            stats = list(pool.map(stat, self._pending))
+        for (path, directory), (mtime, size, is_symlink) in zip(
+            self._pending.items(), stats
+        ):
+            # existence is determined by listing the directory (see _record)
+            if mtime is not None and not is_symlink:
+                self._fresh.add(path)
+            files[directory][path] = (_split(path)[1], mtime, size)
+        self._pending.clear()
+        self._record(files)
+
+    def _record(self, files: Dict[str, Dict[str, Entry]]):
+        """Record the given files of each directory, with their existence
+        according to a new listing of the directory."""
+
+        def scan(directory):
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+                with os.scandir(directory) as entries:
+                    listing = {entry.name: entry.is_symlink() for entry in entries}
+            except OSError:
+                return None, None
+            if mtime_ns >= time.time_ns() - RACY_INTERVAL * 1e9:
+                return None, None
+            return mtime_ns, listing
+
+        with ThreadPoolExecutor(max_workers=self.n_threads) as pool:
+            scans = list(pool.map(scan, files))
+
+        recorded, unrecorded, rows = [], [], []
+        for (directory, entries), (mtime_ns, listing) in zip(files.items(), scans):
+            if listing is None:
+                unrecorded.append((directory,))
+                continue
+            recorded.append((directory, mtime_ns))
+            for path, (name, mtime, size) in entries.items():
+                if name not in listing:
+                    rows.append((path, directory, False, None, None))
+                elif not listing[name]:
+                    rows.append((path, directory, True, mtime, size))
+
+        conn = self._connect()
+        with conn:
+            conn.executemany("DELETE FROM directories WHERE path = ?", unrecorded)
+            conn.executemany("DELETE FROM files WHERE directory = ?", unrecorded)
+            conn.executemany(
+                "INSERT OR REPLACE INTO directories (path, mtime_ns) VALUES (?, ?)",
+                recorded,
+            )
+            conn.executemany(
+                "DELETE FROM files WHERE directory = ?",
+                [(directory,) for directory, _ in recorded],
+            )
+            conn.executemany(
+                "INSERT INTO files (path, directory, present, mtime, size) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
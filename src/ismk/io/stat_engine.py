@@ -0,0 +1,157 @@
+__author__ = "Johannes Köster"
+__copyright__ = "Copyright 2022, Johannes Köster"
+__email__ = "johannes.koester@uni-due.de"
+__license__ = "MIT"
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import os
+import stat
+import sys
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# On these platforms, file names are usually compared case-insensitively (and
+# normalized), hence a name that is not listed by scandir may still exist.
+CASE_INSENSITIVE_NAMES = sys.platform in ("darwin", "win32")
+
+# Local modification times as obtained by local_mtime.
+LocalMtime = Tuple[float, Optional[float]]
+
+
+def local_mtime(path: str, lstat: Optional[os.stat_result] = None) -> LocalMtime:
+    """Return the modification time of the given path and, in case of a symlink,
+    that of its target. For directories, the modification time of the contained
+    .ismk_timestamp file is used if present.
+
+    Usually, this will be one stat call only. For symlinks and directories
+    it will be two, for symlinked directories it will be three.
+    Raises FileNotFoundError if the path or the target of the symlink does
+    not exist.
+    """
+
+    def dir_mtime(mtime):
+        # Try whether we have a timestamp file for it.
+        try:
+            return os.stat(
+                os.path.join(path, ".ismk_timestamp"), follow_symlinks=True
+            ).st_mtime
+        except FileNotFoundError:
+            # No timestamp, hence go on as if it is a file.
+            return mtime
+
+    if lstat is None:
+        lstat = os.stat(path, follow_symlinks=False)
+    mtime = lstat.st_mtime
+    if not stat.S_ISLNK(lstat.st_mode):
+        if stat.S_ISDIR(lstat.st_mode):
+            mtime = dir_mtime(mtime)
+        # In the usual case, not a dir, not a symlink.
+        return mtime, None
+
+    # In case of a symlink, we need the stats for the target file/dir.
+    target_stat = os.stat(path, follow_symlinks=True)
+    mtime_target = target_stat.st_mtime
+    if stat.S_ISDIR(target_stat.st_mode):
+        mtime_target = dir_mtime(mtime_target)
+    return mtime, mtime_target
+
+
+class StatEngine:
+    """Determine existence and modification times of many local files with a
+    pool of threads (see IOCache.mtime_inventory).
+
+    The files are grouped by their parent directory. Directories with at least
+    min_scandir_files files of unknown existence are listed with a single
+    scandir call, such that missing files do not need any stat call. The stat
+    calls of the remaining files are distributed in chunks over the threads.
+    """
+
+    def __init__(self, n_threads: int = 8, min_scandir_files=8, chunksize=64):
+        self.n_threads = max(n_threads, 1)
+        self.min_scandir_files = min_scandir_files
+        self.chunksize = chunksize
+
+    async def collect(
+        self, paths: Iterable[str], existing: Iterable[str] = ()
+    ) -> Dict[str, Optional[LocalMtime]]:
+        """Collect the modification times of the given paths.
+
+        The returned dict contains None for paths that do not exist (following
+        symlinks, like os.path.exists). Paths whose stat fails for other
+        reasons (e.g. missing permissions) are omitted, such that they can be
+        handled by the usual per-file checks. Paths given as existing are
+        known to exist and are not listed via scandir.
+        """
+        loop = asyncio.get_running_loop()
+        result: Dict[str, Optional[LocalMtime]] = dict()
+        with ThreadPoolExecutor(
+            max_workers=self.n_threads, thread_name_prefix="ismk-stat"
+        ) as pool:
+            to_stat = list(existing)
+            groups = defaultdict(list)
+            for path in paths:
+                parent, name = os.path.split(path)
+                if name in ("", ".", ".."):
+                    to_stat.append(path)
+                else:
+                    groups[parent or os.curdir].append((path, name))
+
+            to_scan = []
+            for parent, files in groups.items():
+                if len(files) >= self.min_scandir_files:
+                    to_scan.append((parent, files))
+                else:
+                    to_stat.extend(path for path, _ in files)
+
+            for missing, present in await asyncio.gather(
+                *(
+                    loop.run_in_executor(pool, self._scan, parent, files)
+                    for parent, files in to_scan
+                )
+            ):
+                result.update(dict.fromkeys(missing))
+                to_stat.extend(present)
+
+            for mtimes in await asyncio.gather(
+                *(
+                    loop.run_in_executor(
+                        pool, self._stat, to_stat[i : i + self.chunksize]
+                    )
+                    for i in range(0, len(to_stat), self.chunksize)
+                )
+            ):
+                result.update(mtimes)
+        return result
+
+    def _scan(
+        self, parent: str, files: List[Tuple[str, str]]
+    ) -> Tuple[List[str], List[str]]:
+        """List the given directory, returning the given files that are missing
+        and those that have to be stat'ed."""
+        try:
+            with os.scandir(parent) as entries:
+                names = {entry.name for entry in entries}
+        except (FileNotFoundError, NotADirectoryError):
+            return [path for path, _ in files], []
+        except OSError:
+            # e.g. not readable, let the individual stat calls decide
+            return [], [path for path, _ in files]
+        missing, present = [], []
+        for path, name in files:
+            if name in names or CASE_INSENSITIVE_NAMES:
+                present.append(path)
+            else:
+                missing.append(path)
+        return missing, present
+
+    def _stat(self, paths: List[str]) -> Dict[str, Optional[LocalMtime]]:
+        mtimes: Dict[str, Optional[LocalMtime]] = dict()
+        for path in paths:
+            try:
+                mtimes[path] = local_mtime(path)
+            except (FileNotFoundError, NotADirectoryError):
+                mtimes[path] = None
+            except OSError:
+                pass
+        return mtimes
@@ -0,0 +1,432 @@
+__author__ = "Johannes Köster"
+__copyright__ = "Copyright 2022, Johannes Köster"
+__email__ = "johannes.koester@uni-due.de"
+__license__ = "MIT"
+
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+import re
+from re import _constants as sre_constants  # type: ignore[attr-defined]
+from re import _parser as sre_parse  # type: ignore[attr-defined]
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from ismk.interfaces.storage_plugins.io import WILDCARD_REGEX
+from ismk.logging import logger
+
+# Increment this when the table layout changes to invalidate previously
+# persisted listings.
+LISTINGS_VERSION = 1
+
+# Directories modified less than this number of seconds before being listed are
+# not cached, since a later modification within the timestamp granularity of
+# the file system would not change their mtime.
+RACY_INTERVAL = 1.0
+
+# Default location of the persistent cache of glob_wildcards(..., cache=True).
+DEFAULT_CACHE_PATH = os.path.join(".ismk", "glob_cache.sqlite")
+
+_SCHEMA = f"""
+DROP TABLE IF EXISTS listings;
+CREATE TABLE listings (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    dirnames TEXT NOT NULL,
+    filenames TEXT NOT NULL
+);
+PRAGMA user_version = {LISTINGS_VERSION};
+"""
+
+# names of the subdirectories and of the other entries of a directory
+Listing = Tuple[List[str], List[str]]
+
+_SLASH = ord("/")
+
+
+class ListingCache:
+    """Listings of directories, optionally persisted in an sqlite database
+    (see walk).
+
+    Since creating, deleting or renaming an entry changes the mtime of its
+    directory, a listing remains valid as long as the mtime of the directory is
+    unchanged. Hence, a cached tree is validated with one stat per directory
+    instead of listing each of them again. Note that the mtime of the root
+    directory alone is not sufficient, since it does not change when deeper
+    directories are modified. Listings with symlinks are not cached, since
+    whether an entry is a directory depends on the target of a symlink as well.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._listings: Dict[str, Tuple[int, Listing]] = dict()
+        self._new: Dict[str, Optional[Tuple[int, Listing]]] = dict()
+        self._loaded = path is None
+
+    def load(self):
+        """Load the persisted listings, if not done yet."""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            conn = self._connect()
+            try:
+                for path, mtime_ns, dirnames, filenames in conn.execute(
+                    "SELECT path, mtime_ns, dirnames, filenames FROM listings"
+                ):
+                    # slashes cannot occur in the names of entries
+                    self._listings[path] = (
+                        mtime_ns,
+                        (_split(dirnames), _split(filenames)),
+                    )
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            self._disable(e)
+
+    def get(self, path: str, mtime_ns: int) -> Optional[Listing]:
+        cached = self._listings.get(path)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1]
+        return None
+
+    def put(self, path: str, mtime_ns: Optional[int], listing: Listing):
+        """Cache the given listing of a directory with the given mtime, or
+        forget the directory if mtime_ns is None."""
+        if mtime_ns is None or mtime_ns >= time.time_ns() - RACY_INTERVAL * 1e9:
+            if self._listings.pop(path, None) is not None:
+                self._new[path] = None
+        else:
+            self._listings[path] = self._new[path] = (mtime_ns, listing)
+
+    def save(self):
+        """Persist the listings that have changed since they have been
+        loaded."""
+        new, self._new = self._new, dict()
+        if self.path is None or not new:
+            return
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        "DELETE FROM listings WHERE path = ?",
+                        [(path,) for path, cached in new.items() if cached is None],
+                    )
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO listings "
+                        "(path, mtime_ns, dirnames, filenames) VALUES (?, ?, ?, ?)",
+                        [
+                            (path, mtime_ns, "/".join(dirnames), "/".join(filenames))
+                            for path, cached in new.items()
+                            if cached is not None
+                            for mtime_ns, (dirnames, filenames) in (cached,)
+                        ],
+                    )
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            self._disable(e)
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path) or os.curdir, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            (version,) = conn.execute("PRAGMA user_version").fetchone()
+            if version != LISTINGS_VERSION:
+                conn.executescript(_SCHEMA)
+        except sqlite3.Error:
+            conn.close()
+            raise
+        return conn
+
+    def _disable(self, e: Exception):
+        # persisting listings is an optimization only
+        logger.debug(f"Disabling persistent directory listings because of error: {e}")
+        self.path = None
+
+
+_caches: Dict[str, ListingCache] = dict()
+
+
+def get_listing_cache(path: str = DEFAULT_CACHE_PATH) -> ListingCache:
+    """Return the cache persisted at the given path, shared by all walks of
+    this process."""
+    path = os.path.abspath(path)
+    if path not in _caches:
+        _caches[path] = ListingCache(path)
+    return _caches[path]
+
+
+def _split(names: str) -> List[str]:
+    return names.split("/") if names else []
+
+
+def _list(
+    path: str, followlinks: bool, cache: Optional[ListingCache]
+) -> Optional[Tuple[List[str], List[str], List[str]]]:
+    """List the given directory like os.walk: return the names of its
+    subdirectories, of its other entries, and of the subdirectories to walk
+    into, or None if it cannot be listed."""
+    mtime_ns = None
+    if cache is not None:
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        cached = cache.get(path, mtime_ns)
+        if cached is not None:
+            return cached[0], cached[1], cached[0]
+
+    dirnames, filenames, walk_dirs = [], [], []
+    symlinks = False
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                try:
+                    is_symlink = entry.is_symlink()
+                except OSError:
+                    is_symlink = False
+                symlinks = symlinks or is_symlink
+                if is_dir:
+                    dirnames.append(entry.name)
+                    if followlinks or not is_symlink:
+                        walk_dirs.append(entry.name)
+                else:
+                    filenames.append(entry.name)
+    except OSError:
+        return None
+
+    if cache is not None:
+        cache.put(path, None if symlinks else mtime_ns, (dirnames, filenames))
+    return dirnames, filenames, walk_dirs
+
+
+def walk(
+    top: str,
+    followlinks: bool = False,
+    descend: Optional[Callable[[str], bool]] = None,
+    cache: Optional[ListingCache] = None,
+    n_threads: int = 8,
+) -> Iterator[Tuple[str, List[str], List[str]]]:
+    """Walk the directory tree under top like os.walk (top-down, ignoring
+    errors), yielding the same triples in the same order.
+
+    Subdirectories are only walked into if descend returns True for their
+    path. Subdirectories are listed with a pool of threads, ahead of being
+    yielded, which hides the latency of network file systems. If a cache is
+    given, directories whose mtime is unchanged are not listed again. The
+    yielded lists must not be modified.
+    """
+    if cache is not None:
+        cache.load()
+    cancelled = threading.Event()
+    pool: Optional[ThreadPoolExecutor] = None
+
+    def submit(path: str) -> Optional[Future]:
+        if pool is None or cancelled.is_set():
+            return None
+        try:
+            return pool.submit(scan_ahead, path)
+        except RuntimeError:
+            # the pool has been shut down because the walk has been aborted
+            return None
+
+    def scan(path: str):
+        listing = _list(path, followlinks, cache)
+        if listing is None:
+            return None
+        dirnames, filenames, walk_dirs = listing
+        subdirs = [os.path.join(path, name) for name in walk_dirs]
+        if descend is not None:
+            subdirs = [subdir for subdir in subdirs if descend(subdir)]
+        return dirnames, filenames, subdirs
+
+    def scan_ahead(path: str):
+        # list the subdirectories before this directory is yielded
+        scanned = scan(path)
+        if scanned is None:
+            return None
+        dirnames, filenames, subdirs = scanned
+        return dirnames, filenames, [(subdir, submit(subdir)) for subdir in subdirs]
+
+    try:
+        scanned = scan(top)
+        if scanned is None:
+            return
+        dirnames, filenames, subdirs = scanned
+        if subdirs and n_threads > 1:
+            # only start threads if there is more than one directory to list
+            pool = ThreadPoolExecutor(
+                max_workers=n_threads, thread_name_prefix="ismk-walk"
+            )
+        stack = [(subdir, submit(subdir)) for subdir in reversed(subdirs)]
+        yield top, dirnames, filenames
+        while stack:
+            path, future = stack.pop()
+            scanned = scan_ahead(path) if future is None else future.result()
+            if scanned is None:
+                continue
+            dirnames, filenames, children = scanned
+            yield path, dirnames, filenames
+            stack.extend(reversed(children))
+    finally:
+        cancelled.set()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        if cache is not None:
+            cache.save()
+
+
+def _consumes_slash(items) -> bool:
+    """Return whether the given parsed regular expression may consume a slash.
+    Unknown constructs are assumed to do so."""
+    c = sre_constants
+    for op, av in items:
+        if op is c.LITERAL:
+            if av == _SLASH:
+                return True
+        elif op is c.NOT_LITERAL:
+            if av != _SLASH:
+                return True
+        elif op is c.ANY:
+            return True
+        elif op is c.IN:
+            if _in_set(av):
+                return True
+        elif op is c.MAX_REPEAT or op is c.MIN_REPEAT:
+            if av[1] != 0 and _consumes_slash(av[2]):
+                return True
+        elif op is c.SUBPATTERN:
+            if _consumes_slash(av[-1]):
+                return True
+        elif op is c.BRANCH:
+            if any(_consumes_slash(branch) for branch in av[1]):
+                return True
+        elif op is c.AT:
+            # anchors do not consume anything
+            continue
+        else:
+            return True
+    return False
+
+
+def _in_set(items) -> bool:
+    c = sre_constants
+    negate = False
+    member = False
+    for op, av in items:
+        if op is c.NEGATE:
+            negate = True
+        elif op is c.LITERAL:
+            member = member or av == _SLASH
+        elif op is c.RANGE:
+            member = member or av[0] <= _SLASH <= av[1]
+        elif op is c.CATEGORY:
+            # a slash is neither a digit, nor whitespace, nor a word character
+            member = member or av in (
+                c.CATEGORY_NOT_DIGIT,
+                c.CATEGORY_NOT_SPACE,
+                c.CATEGORY_NOT_WORD,
+            )
+        else:
+            return True
+    return member != negate
+
+
+def can_match_slash(constraint: Optional[str]) -> bool:
+    """Return whether a wildcard with the given constraint may take values with
+    a slash, i.e. span multiple directories. Wildcards without constraint match
+    anything."""
+    if not constraint:
+        return True
+    try:
+        return _consumes_slash(sre_parse.parse(constraint))
+    except (re.error, RecursionError):
+        return True
+
+
+def descend_regex(pattern: str) -> re.Pattern:
+    """Return a regular expression that matches (with re.match) each directory
+    that may contain paths matching the given file pattern.
+
+    The slash following such a directory in a matching path is either a
+    literal slash of the pattern, or part of the value of a wildcard that may
+    span multiple directories, following a prefix of the path that matches the
+    pattern up to that wildcard.
+    """
+    # imported here to avoid a circular import
+    from ismk.io import regex_from_filepattern
+
+    prefixes = []
+    constraints: Dict[str, Optional[str]] = dict()
+    last = 0
+    for match in WILDCARD_REGEX.finditer(pattern):
+        prefixes.extend((i, True) for i in _find_slashes(pattern, last, match.start()))
+        name = match.group("name")
+        # constraints are only given at the first occurrence of a wildcard
+        constraint = constraints.setdefault(name, match.group("constraint"))
+        if can_match_slash(constraint):
+            prefixes.append((match.start(), False))
+        last = match.end()
+    prefixes.extend((i, True) for i in _find_slashes(pattern, last, len(pattern)))
+
+    alternatives = []
+    for i, (end, complete) in enumerate(prefixes):
+        regex = regex_from_filepattern(pattern[:end], group_prefix=f"p{i}_")
+        # regex_from_filepattern appends $
+        alternatives.append(regex if complete else regex[:-1])
+    if not alternatives:
+        return re.compile(r"(?!)")
+    return re.compile("|".join(f"(?:{regex})" for regex in alternatives))
+
+
+def _find_slashes(pattern: str, start: int, end: int) -> Iterator[int]:
+    i = pattern.find("/", start, end)
+    while i != -1:
+        yield i
+        i = pattern.find("/", i + 1, end)
+
+
+def walk_pattern(
+    pattern: str,
+    followlinks: bool = False,
+    cache: Optional[ListingCache] = None,
+    n_threads: int = 8,
+) -> Iterator[str]:
+    """Yield the normalized paths of the files and directories that may match
+    the given (normalized) file pattern, in the order of os.walk.
+
+    Starting from the directory before the first wildcard, only directories
+    that may contain matching paths are walked into (see descend_regex).
+    """
+    first_wildcard = re.search("{[^{]", pattern)
+    dirname = os.path.dirname(
+        pattern[: first_wildcard.start()] if first_wildcard else pattern
+    )
+    if not dirname:
+        dirname = "."
+    regex = descend_regex(pattern)
+
+    def descend(path):
+        return regex.match(os.path.normpath(path)) is not None
+
+    for dirpath, dirnames, filenames in walk(
+        dirname,
+        followlinks=followlinks,
+        descend=descend,
+        cache=cache,
+        n_threads=n_threads,
+    ):
+        # the names of entries are normalized, hence it suffices to normalize
+        # the directory
+        prefix = os.path.normpath(dirpath)
+        prefix = "" if prefix == "." else os.path.join(prefix, "")
+        for names in (filenames, dirnames):
+            for name in names:
+                yield prefix + name
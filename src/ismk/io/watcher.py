@@ -0,0 +1,434 @@
+__author__ = "Johannes Köster"
+__copyright__ = "Copyright 2022, Johannes Köster"
+__email__ = "johannes.koester@uni-due.de"
+__license__ = "MIT"
+
+from abc import ABC, abstractmethod
+import asyncio
+import ctypes
+import os
+import stat
+import struct
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from ismk.io.inventory import RACY_INTERVAL
+from ismk.logging import logger
+
+if TYPE_CHECKING:
+    from ismk.io import IOCache
+
+# inotify event masks, see inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+_WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+
+# struct inotify_event without the trailing name
+_EVENT = struct.Struct("iIII")
+
+# watch descriptor (or directory identity), mask and name of a change
+Event = Tuple[Hashable, int, str]
+
+# inode and whether it is a directory, by name
+Listing = Dict[str, Tuple[int, bool]]
+
+
+class IOCacheWatcher(ABC):
+    """Keep the entries of an IOCache valid while files are modified by running
+    jobs (see IOCache.watch).
+
+    Before information about a local file is cached, its directory is watched
+    (see track). Whenever a watched directory reports a change of a file, the
+    cache entries of that file and of the directory itself are invalidated, such
+    that they are obtained again on the next query. Files in directories that do
+    not exist yet are remembered until a watched ancestor reports the creation
+    of the directory. Changes that cannot be attributed to individual files
+    (e.g. a watched directory being moved or a lost event) clear the cache.
+
+    Changes are applied to the cache by sync, which the cache calls before each
+    lookup, hence the cache is only modified by the threads querying it.
+    """
+
+    def __init__(self, cache: "IOCache"):
+        self.cache = cache
+        self._lock = threading.Lock()
+        # watched directories and all their spellings in cached paths
+        self._watches: Dict[str, Hashable] = dict()
+        self._spellings: Dict[Hashable, Set[str]] = defaultdict(set)
+        # paths in directories that do not exist (yet), by directory
+        self._missing: Dict[str, Set[str]] = dict()
+
+    def track(self, path: str, directory: bool = False):
+        """Watch for changes of the given local path, which has to happen before
+        its information is obtained. If directory is True, changes of the
+        content of the path are watched as well (e.g. if it has been listed).
+        Raises OSError if watching is not possible (e.g. too many watches)."""
+        parent = os.path.dirname(path)
+        with self._lock:
+            if parent not in self._watches:
+                if parent in self._missing or not self._watch(parent):
+                    self._missing[parent].add(path)
+            if directory and path not in self._watches and path not in self._missing:
+                self._watch(path)
+
+    def sync(self):
+        """Apply all changes that have been reported so far to the cache."""
+        with self._lock:
+            self._handle(self._events())
+
+    def close(self):
+        with self._lock:
+            self._watches.clear()
+            self._spellings.clear()
+            self._missing.clear()
+
+    @abstractmethod
+    def _add_watch(self, directory: str) -> Hashable:
+        """Start watching the given directory, return an id for it.
+        Raises FileNotFoundError or NotADirectoryError if the directory does
+        not exist."""
+        ...
+
+    @abstractmethod
+    def _remove_watch(self, wid: Hashable): ...
+
+    @abstractmethod
+    def _events(self) -> Iterable[Event]:
+        """Return the changes reported since the last call."""
+        ...
+
+    def _watch(self, directory: str) -> bool:
+        """Watch the given directory or, if it does not exist, its nearest
+        existing ancestor. Returns whether the directory exists."""
+        try:
+            wid = self._add_watch(directory or os.curdir)
+        except (FileNotFoundError, NotADirectoryError):
+            ancestor = os.path.dirname(directory)
+            if ancestor == directory:
+                return False
+            self._missing.setdefault(directory, set())
+            if ancestor not in self._watches and ancestor not in self._missing:
+                self._watch(ancestor)
+            if os.path.isdir(directory or os.curdir):
+                # created in between, the ancestor may not have noticed
+                del self._missing[directory]
+                return self._watch(directory)
+            return False
+        self._watches[directory] = wid
+        self._spellings[wid].add(directory)
+        return True
+
+    def _forget(self, wid: Hashable):
+        for directory in self._spellings.pop(wid, ()):
+            del self._watches[directory]
+
+    def _handle(self, events: Iterable[Event]):
+        for wid, mask, name in events:
+            if mask & IN_Q_OVERFLOW:
+                self._reset()
+                continue
+            spellings = self._spellings.get(wid)
+            if spellings is None:
+                # watch has been removed before
+                continue
+            if mask & IN_MOVE_SELF:
+                # all paths below the directory have changed
+                self._reset()
+                continue
+            if mask & IN_IGNORED:
+                self._forget(wid)
+                continue
+            paths = (
+                [os.path.join(directory, name) for directory in spellings]
+                if name
+                else []
+            )
+            # the directory itself has been modified as well
+            self.cache.invalidate(paths)
+            self.cache.invalidate(spellings)
+            if mask & IN_DELETE_SELF:
+                # the directory may be created again
+                self._created(spellings)
+            elif mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self._created(paths)
+
+    def _created(self, directories: Iterable[str]):
+        """Invalidate all remembered paths within the given directories, which
+        have been created or removed."""
+        prefixes = {os.path.normpath(directory) for directory in directories}
+        for missing in list(self._missing):
+            normalized = os.path.normpath(missing)
+            if any(
+                normalized == prefix or normalized.startswith(prefix + os.sep)
+                for prefix in prefixes
+            ):
+                self.cache.invalidate(self._missing.pop(missing))
+                self.cache.invalidate([missing])
+
+    def _reset(self):
+        logger.debug("Clearing IO cache because of an untraceable file system change.")
+        for wid in list(self._spellings):
+            self._remove_watch(wid)
+        self._watches.clear()
+        self._spellings.clear()
+        self._missing.clear()
+        self.cache.clear()
+
+
+class InotifyWatcher(IOCacheWatcher):
+    """Watch directories with inotify (Linux only). Changes made on other
+    hosts of a network file system are not reported."""
+
+    def __init__(self, cache: "IOCache"):
+        super().__init__(cache)
+        libc = ctypes.CDLL(None, use_errno=True)
+        try:
+            self._inotify_add_watch = libc.inotify_add_watch
+            self._inotify_rm_watch = libc.inotify_rm_watch
+            inotify_init1 = libc.inotify_init1
+        except AttributeError:
+            raise OSError("inotify is not supported by the C library")
+        self._inotify_add_watch.argtypes = [
+            ctypes.c_int,
+            ctypes.c_char_p,
+            ctypes.c_uint32,
+        ]
+        self._inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self._fd = inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    def close(self):
+        super().close()
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def fileno(self) -> int:
+        return self._fd
+
+    def _add_watch(self, directory: str) -> Hashable:
+        wd = self._inotify_add_watch(self._fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), directory)
+        return wd
+
+    def _remove_watch(self, wid: Hashable):
+        self._inotify_rm_watch(self._fd, wid)
+
+    def _events(self) -> Iterable[Event]:
+        while self._fd >= 0:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+                offset += length
+                yield wd, mask, name
+
+
+class PollingWatcher(IOCacheWatcher):
+    """Watch directories by listing them again whenever their mtime changes,
+    every interval seconds in a background thread. Only files being created,
+    deleted or replaced are noticed this way, files modified in place are not.
+    """
+
+    def __init__(self, cache: "IOCache", interval: float = 1.0):
+        super().__init__(cache)
+        self.interval = interval
+        # watched directories with their mtime and listing (name -> inode, is
+        # directory) at the last poll
+        self._state: Dict[Hashable, Tuple[str, int, Listing]] = dict()
+        self._pending: List[Event] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="ismk-iocache-poll", daemon=True
+        )
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        super().close()
+        with self._lock:
+            self._state.clear()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+    def poll(self):
+        """Compare all watched directories with their state at the last poll."""
+        with self._lock:
+            watched = list(self._state.items())
+        events: List[Event] = []
+        for wid, (directory, mtime_ns, listing) in watched:
+            try:
+                st = os.stat(directory)
+                if (st.st_dev, st.st_ino) != wid:
+                    events.append((wid, IN_MOVE_SELF, ""))
+                    continue
+                if st.st_mtime_ns == mtime_ns and not self._is_racy(mtime_ns):
+                    continue
+                new_listing = self._list(directory)
+            except (FileNotFoundError, NotADirectoryError):
+                # removed or moved away, together with its content
+                events.extend(
+                    (wid, IN_DELETE | (IN_ISDIR * is_dir), name)
+                    for name, (_, is_dir) in listing.items()
+                )
+                events.append((wid, IN_DELETE_SELF, ""))
+                events.append((wid, IN_IGNORED, ""))
+                continue
+            except OSError:
+                continue
+            changed = False
+            for name, (inode, is_dir) in listing.items():
+                if name not in new_listing:
+                    events.append((wid, IN_DELETE | (IN_ISDIR * is_dir), name))
+                    changed = True
+            for name, (inode, is_dir) in new_listing.items():
+                if name not in listing:
+                    events.append((wid, IN_CREATE | (IN_ISDIR * is_dir), name))
+                    changed = True
+                elif listing[name][0] != inode:
+                    # replaced, e.g. by renaming another file
+                    events.append((wid, IN_MOVED_TO | (IN_ISDIR * is_dir), name))
+                    changed = True
+            if changed:
+                events.append((wid, IN_ATTRIB, ""))
+            with self._lock:
+                if wid in self._state:
+                    self._state[wid] = (directory, st.st_mtime_ns, new_listing)
+        if events:
+            with self._lock:
+                self._pending.extend(events)
+
+    @staticmethod
+    def _is_racy(mtime_ns: int) -> bool:
+        # Further modifications within the timestamp granularity of the file
+        # system would not change the mtime.
+        return mtime_ns >= time.time_ns() - RACY_INTERVAL * 1e9
+
+    @staticmethod
+    def _list(directory: str) -> Listing:
+        with os.scandir(directory) as entries:
+            return {
+                entry.name: (entry.inode(), entry.is_dir(follow_symlinks=False))
+                for entry in entries
+            }
+
+    def _add_watch(self, directory: str) -> Hashable:
+        st = os.stat(directory)
+        if not stat.S_ISDIR(st.st_mode):
+            raise NotADirectoryError(directory)
+        wid = (st.st_dev, st.st_ino)
+        if wid not in self._state:
+            self._state[wid] = (directory, st.st_mtime_ns, self._list(directory))
+        return wid
+
+    def _remove_watch(self, wid: Hashable):
+        self._state.pop(wid, None)
+
+    def _forget(self, wid: Hashable):
+        super()._forget(wid)
+        self._state.pop(wid, None)
+
+    def _events(self) -> Iterable[Event]:
+        events, self._pending = self._pending, []
+        return events
+
+
+class ChangeNotifier:
+    """Wake up an asyncio event loop whenever inotify reports a change of a
+    tracked local path (see wait_for_files). The InotifyWatcher is given the
+    notifier in place of an IOCache."""
+
+    def __init__(self):
+        self._loop = asyncio.get_running_loop()
+        self._changed = asyncio.Event()
+        self._watcher = InotifyWatcher(self)  # type: ignore[arg-type]
+        try:
+            self._loop.add_reader(self._watcher.fileno(), self._watcher.sync)
+        except NotImplementedError:
+            self._watcher.close()
+            raise OSError("event loop does not support watching file descriptors")
+
+    def track(self, path: str):
+        self._watcher.track(path)
+
+    async def wait(self, timeout: float):
+        """Wait until a change is reported, at most timeout seconds."""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._changed.clear()
+
+    def close(self):
+        self._loop.remove_reader(self._watcher.fileno())
+        self._watcher.close()
+
+    def invalidate(self, paths: Iterable[str]):
+        self._changed.set()
+
+    def clear(self):
+        self._changed.set()
+
+
+def create_notifier() -> Optional[ChangeNotifier]:
+    """Return a notifier if inotify is available, and None otherwise."""
+    if sys.platform.startswith("linux"):
+        try:
+            return ChangeNotifier()
+        except OSError as e:
+            logger.debug(f"Unable to use inotify ({e}), polling for files instead.")
+    return None
+
+
+def create_watcher(cache: "IOCache", notify: bool = True) -> IOCacheWatcher:
+    """Watch with inotify if requested and available, and by polling otherwise."""
+    if notify and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(cache)
+        except OSError as e:
+            logger.debug(f"Unable to use inotify ({e}), polling for changes instead.")
+    return PollingWatcher(cache)
@@ -1222,6 +1222,12 @@ class Job(
             self.dag.workflow.persistence.cleanup(self)
             return
 
+        # The job may have modified its files on another host, unnoticed by the
+        # watcher of the IOCache (if any).
+        self.dag.workflow.iocache.invalidate(
+            chain(self.output, self.log, [self.benchmark] if self.benchmark else [])
+        )
+
         skip_cleanup_outputs = set()
 
         shared_input_output = (
@@ -5,25 +5,55 @@ __copyright__ = "Copyright 2022, Johannes Köster"
 __email__ = "johannes.koester@protonmail.com"
 __license__ = "MIT"
 
+from collections import defaultdict
+from functools import lru_cache
+import re
 from typing import TYPE_CHECKING
 
 from ismk.common.prefix_lookup import PrefixLookup
+from ismk.io import regex_from_filepattern
 
 if TYPE_CHECKING:
     from ismk.rules import Rule
 
+# numbered group references would point to the wrong group in a combined pattern
+_NUMBERED_REFERENCE = re.compile(r"\\[1-9]|\(\?\(\d")
+
+# maximum number of target files whose producers are memoized per index
+RESOLUTION_CACHE_SIZE = 2**14
+
 
 class OutputIndex:
     """Look up structure for rules, that can be queried by the output products which they create."""
 
     def __init__(self, rules: list[Rule]) -> None:
-        entries = []
+        suffixes = defaultdict(list)
+        self._products = []
         for rule in rules:
             for product in rule.products():
                 prefix = str(product.constant_prefix())
                 suffix = str(product.constant_suffix())
-                entries.append((prefix, (rule, suffix)))
-        self._lookup = PrefixLookup(entries=entries)
+                # suffixes are looked up via their reverse
+                suffixes[prefix].append((suffix[::-1], (rule, len(self._products))))
+                self._products.append((rule, product))
+        self._lookup = PrefixLookup(
+            entries=[
+                (prefix, PrefixLookup(entries=entries))
+                for prefix, entries in suffixes.items()
+            ]
+        )
+        # combined matchers, by the indices of the candidate products
+        self._matchers = dict()
+        # The same file is usually requested by many consumers. Since the index
+        # is rebuilt whenever rules are added, the memoized producers never
+        # have to be invalidated.
+        self._resolve = lru_cache(maxsize=RESOLUTION_CACHE_SIZE)(self._match_wildcards)
+
+    def _candidates(self, targetfile: str):
+        reverse = targetfile[::-1]
+        for _, suffix_lookup in self._lookup.match_iter(targetfile):
+            for _, candidate in suffix_lookup.match_iter(reverse):
+                yield candidate
 
     def match(self, targetfile: str) -> set[Rule]:
         """Returns all rules that match the given target file, considering only the prefix and suffix up to the
@@ -31,12 +61,87 @@ class OutputIndex:
 
         To further verify the match, the returned rules should be checked with ``Rule.is_producer(targetfile)``.
         """
-        return {
-            rule
-            for prefix, (rule, suffix) in self._lookup.match_iter(targetfile)
-            if targetfile.endswith(suffix)
-        }
+        return {rule for rule, _ in self._candidates(targetfile)}
 
     def match_producers(self, targetfile: str) -> set[Rule]:
         """Returns all rules that match and produce the given target file."""
-        return {rule for rule in self.match(targetfile) if rule.is_producer(targetfile)}
+        return set(self.match_wildcards(targetfile))
+
+    def match_wildcards(self, targetfile: str) -> dict[Rule, dict[str, str] | None]:
+        """Returns all rules that produce the given target file, together with the
+        wildcard values of their best matching product (as ``Rule.get_wildcards``).
+
+        All candidate products are matched in a single pass, using a combined regular
+        expression. If the products cannot be combined (e.g. because of group references
+        in wildcard constraints), the rules are checked via ``Rule.is_producer`` and
+        None is returned as wildcard values. Results are memoized per target file and
+        must not be modified.
+        """
+        return self._resolve(str(targetfile))
+
+    def _match_wildcards(self, targetfile: str) -> dict[Rule, dict[str, str] | None]:
+        candidates = tuple(sorted(i for _, i in self._candidates(targetfile)))
+        if not candidates:
+            return dict()
+        try:
+            matcher = self._matchers[candidates]
+        except KeyError:
+            matcher = self._matchers[candidates] = self._combine(candidates)
+
+        if matcher is None:
+            rules = dict.fromkeys(self._products[i][0] for i in candidates)
+            return {rule: None for rule in rules if rule.is_producer(targetfile)}
+
+        regex, layout = matcher
+        match = regex.match(targetfile)
+        producers = dict()
+        for rule, marker, groups in layout:
+            if match.group(marker) is None:
+                continue
+            wildcards = {wildcard: match.group(group) for group, wildcard in groups}
+            # prefer the product with the shortest wildcard values
+            best = producers.get(rule)
+            if best and _wildcard_len(best) <= _wildcard_len(wildcards):
+                continue
+            producers[rule] = wildcards
+        return producers
+
+    def _combine(self, candidates: tuple[int, ...]):
+        """Combine the regular expressions of the given products into optional
+        lookaheads, each of which marks with an empty group whether it matched."""
+        branches = []
+        for k, i in enumerate(candidates):
+            rule, product = self._products[i]
+            try:
+                pattern = regex_from_filepattern(product.file, group_prefix=f"w{k}_")
+            except ValueError:
+                return None
+            if _NUMBERED_REFERENCE.search(pattern):
+                return None
+            branches.append(f"(?:(?=(?P<m{k}>){pattern}))?")
+        try:
+            regex = re.compile("".join(branches))
+        except re.error:
+            return None
+
+        layout = []
+        known = set()
+        for k, i in enumerate(candidates):
+            rule, _ = self._products[i]
+            prefix = f"w{k}_"
+            groups = [
+                (group, group[len(prefix) :])
+                for group in regex.groupindex
+                if group.startswith(prefix)
+            ]
+            known.add(f"m{k}")
+            known.update(group for group, _ in groups)
+            layout.append((rule, f"m{k}", groups))
+        if not known.issuperset(regex.groupindex):
+            # named groups inside of wildcard constraints
+            return None
+        return regex, layout
+
+
+def _wildcard_len(wildcards: dict[str, str]) -> int:
+    return sum(map(len, wildcards.values()))
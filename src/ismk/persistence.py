@@ -9,11 +9,14 @@ import hashlib
 import os
 import shutil
 import json
+import pickle
+import re
+import sqlite3
 import stat
 import time
-from base64 import urlsafe_b64encode, b64encode
-from functools import lru_cache
-from itertools import count
+from base64 import b64encode
+from functools import cached_property, lru_cache
+from itertools import chain, count
 from pathlib import Path
 from contextlib import contextmanager
 from typing import Any, Optional, Set
@@ -23,15 +26,39 @@ from ismk.interfaces.executor_plugins.persistence import (
 )
 from ismk.interfaces.executor_plugins.settings import ExecMode
 
+from ismk.common import LockFreeWritableFile
 from ismk.common.tbdstring import TBDString
+from ismk.dag_snapshot import DAG_SNAPSHOT_VERSION, DAGSnapshot
 import ismk.exceptions
 from ismk.logging import logger
 from ismk.jobs import jobfiles, Job
-from ismk.utils import listfiles
-from ismk.io import _IOFile, is_flagged, get_flag_value, IOCache
+from ismk.io import _IOFile, is_flagged, get_flag_value
+from ismk.io.checksums import (
+    DEFAULT_CHECKSUM_ALGORITHM,
+    ChecksumService,
+    ChecksumStore,
+    get_checksum_algorithm,
+)
+from ismk.io.inventory import InventoryStore
 from ismk.interfaces.common.exceptions import WorkflowError
 from ismk.settings.types import DeploymentMethod
 from ismk.persistence_encryption import MetadataEncryptor
+from ismk.persistence_locks import (
+    FileLocks,
+    fine_grained_locked,
+    intersects,
+    path_hashes,
+    write_manifest,
+    write_segment,
+)
+from ismk.persistence_backends import (
+    INCOMPLETE,
+    METADATA,
+    MetadataJournal,
+    create_metadata_backend,
+    migrate_metadata,
+    replay_journal,
+)
 
 UNREPRESENTABLE = object()
 RECORD_FORMAT_VERSION = 6
@@ -48,6 +75,7 @@ class Persistence(PersistenceExecutorInterface):
         warn_only=False,
         path: Path | None = None,
         metadata_encryption_key: bytes | None = None,
+        fine_grained_locks: bool = False,
     ):
         import importlib.util
 
@@ -57,8 +85,6 @@ class Persistence(PersistenceExecutorInterface):
             else self._serialize_param_builtin
         )
 
-        self._max_len = None
-
         if path is None:
             self._path = Path(os.path.abspath(".ismk"))
         else:
@@ -68,6 +94,12 @@ class Persistence(PersistenceExecutorInterface):
         self._lockdir = os.path.join(self.path, "locks")
         os.makedirs(self._lockdir, exist_ok=True)
 
+        self._filelocks_path = os.path.join(self.path, "filelocks")
+        # the fine-grained locks while running (see lock_fine_grained)
+        self._filelocks = None
+        # path hashes of the locked input and output files by job
+        self._joblocks = dict()
+
         self.dag = dag
         self._lockfile = dict()
 
@@ -82,6 +114,12 @@ class Persistence(PersistenceExecutorInterface):
         self.source_cache = os.path.join(self.path, "source_cache")
 
         self.iocache_path = os.path.join(self.path, "iocache")
+        self._inventory: Optional[InventoryStore] = None
+        self.checksums = ChecksumService(
+            store=ChecksumStore(os.path.join(self.iocache_path, "checksums.sqlite"))
+        )
+
+        self.dag_snapshot_path = os.path.join(self.path, "dag_snapshot")
 
         if conda_prefix is None:
             self.conda_env_path = os.path.join(self.path, "conda")
@@ -116,6 +154,11 @@ class Persistence(PersistenceExecutorInterface):
             migration_indicator.unlink()
 
         self._incomplete_cache = None
+        # decoded metadata records read by preload_metadata, by key
+        self._preloaded = dict()
+        # keys of files whose records are not cached (see exclude_from_cache)
+        self._uncached = set()
+        self._journal = None
 
         for d in (
             self._metadata_path,
@@ -126,15 +169,21 @@ class Persistence(PersistenceExecutorInterface):
             self.container_img_path,
             self.aux_path,
             self.iocache_path,
+            self.dag_snapshot_path,
         ):
             os.makedirs(d, exist_ok=True)
 
         if nolock:
             self.lock = self.noop
             self.unlock = self.noop
+            self.extend_lock = self.noop
         if warn_only:
             self.lock = self.lock_warn_only
             self.unlock = self.noop
+            self.extend_lock = self.noop
+        elif fine_grained_locks and not nolock:
+            self.lock = self.lock_fine_grained
+            self.extend_lock = self.noop
 
         self._read_record = self._read_record_cached
         self.max_checksum_file_size = (
@@ -148,6 +197,16 @@ class Persistence(PersistenceExecutorInterface):
     def path(self) -> Path:
         return Path(self._path)
 
+    @cached_property
+    def _backend(self):
+        backend = create_metadata_backend(
+            str(self.path), self.dag.workflow.dag_settings.metadata_backend
+        )
+        n = replay_journal(backend, str(self.path))
+        if n:
+            logger.debug(f"Applied {n} entries of the metadata journal.")
+        return backend
+
     @property
     def aux_path(self) -> Path:
         return Path(self._aux_path)
@@ -185,21 +244,23 @@ class Persistence(PersistenceExecutorInterface):
 
     @property
     def locked(self):
-        inputfiles = set(self.all_inputfiles())
-        outputfiles = set(self.all_outputfiles())
+        return self._locked(
+            path_hashes(self.all_inputfiles()), path_hashes(self.all_outputfiles())
+        )
+
+    def _locked(self, inputfiles, outputfiles):
+        """Return whether any of the given files (as path hashes, see
+        persistence_locks) is locked by another process: outputs by its inputs
+        or outputs, and inputs by its outputs."""
+        own = set(self._lockfile.values())
         if os.path.exists(self._lockdir):
             for lockfile in self._locks("input"):
-                with open(lockfile) as lock:
-                    for f in lock:
-                        f = f.strip()
-                        if f in outputfiles:
-                            return True
+                if lockfile not in own and intersects(lockfile, outputfiles):
+                    return True
+            files = inputfiles | outputfiles
             for lockfile in self._locks("output"):
-                with open(lockfile) as lock:
-                    for f in lock:
-                        f = f.strip()
-                        if f in outputfiles or f in inputfiles:
-                            return True
+                if lockfile not in own and intersects(lockfile, files):
+                    return True
         return False
 
     @contextmanager
@@ -214,15 +275,75 @@ class Persistence(PersistenceExecutorInterface):
 
     @contextmanager
     def lock(self):
-        if self.locked:
+        inputfiles = path_hashes(self.all_inputfiles())
+        outputfiles = path_hashes(self.all_outputfiles())
+        if self._locked(inputfiles, outputfiles):
             raise ismk.exceptions.LockException()
         try:
-            self._lock(self.all_inputfiles(), "input")
-            self._lock(self.all_outputfiles(), "output")
+            self._lock(inputfiles, "input")
+            self._lock(outputfiles, "output")
+            # Processes with fine-grained locks check the lock manifests after
+            # locking the files of a job, hence one of both sees the other.
+            if fine_grained_locked(self._filelocks_path, inputfiles, outputfiles):
+                raise ismk.exceptions.LockException()
             yield
         finally:
             self.unlock()
 
+    @contextmanager
+    def lock_fine_grained(self):
+        """Lock the files of each job when it is scheduled (see lock_job)
+        instead of all files of the workflow at once, such that processes
+        working on disjoint files can run at the same time."""
+        if self.locked:
+            raise ismk.exceptions.LockException()
+        self._filelocks = FileLocks(self._filelocks_path)
+        try:
+            self._filelocks.announce()
+            yield
+        finally:
+            self._filelocks.close()
+            self._filelocks = None
+            self._joblocks.clear()
+
+    def lock_job(self, job) -> bool:
+        """Lock the input and output files of the given job (or group job)
+        with fine-grained locks. Return False if any of them is locked by
+        another process, in which case the job has to wait."""
+        if self._filelocks is None:
+            return True
+        jobs = job.jobs if job.is_group() else [job]
+        inputfiles = path_hashes(jobfiles(jobs, "input"))
+        outputfiles = path_hashes(jobfiles(jobs, "output"))
+        if not self._filelocks.acquire(inputfiles, outputfiles):
+            return False
+        if self._locked(inputfiles, outputfiles):
+            # locked by a process with classic locks that started meanwhile
+            self._filelocks.release(inputfiles, outputfiles)
+            return False
+        self._joblocks[job] = (inputfiles, outputfiles)
+        return True
+
+    def unlock_job(self, job):
+        locked = self._joblocks.pop(job, None)
+        if locked is not None:
+            self._filelocks.release(*locked)
+
+    def extend_lock(self, inputfiles, outputfiles):
+        """Add the given files to the locks of this process. This is used if
+        jobs are added to the DAG after it has been locked (see
+        DAG.advance_expansion)."""
+        inputfiles = path_hashes(inputfiles)
+        outputfiles = path_hashes(outputfiles)
+        if self._locked(inputfiles, outputfiles):
+            raise ismk.exceptions.LockException()
+        for files, type in ((inputfiles, "input"), (outputfiles, "output")):
+            if files:
+                with open(self._lockfile[type], "ab") as lock:
+                    write_segment(lock, files)
+        if fine_grained_locked(self._filelocks_path, inputfiles, outputfiles):
+            raise ismk.exceptions.LockException()
+
     def unlock(self):
         logger.debug("unlocking")
         for lockfile in self._lockfile.values():
@@ -238,10 +359,25 @@ class Persistence(PersistenceExecutorInterface):
         shutil.rmtree(self._lockdir)
 
     def cleanup_metadata(self, path):
-        return self._delete_record(self._incomplete_path, path) or self._delete_record(
-            self._metadata_path, path
+        return self._delete_record(INCOMPLETE, path) or self._delete_record(
+            METADATA, path
         )
 
+    def migrate_metadata(self, name: str):
+        """Move all metadata records and incomplete markers to the backend of
+        the given name, which is used by all later runs (see
+        create_metadata_backend)."""
+        if name == self._backend.name:
+            logger.info(f"Metadata is already stored in backend {name}.")
+            return
+        if any(self._locks("input")) or any(self._locks("output")):
+            raise ismk.exceptions.LockException()
+        self._backend, n = migrate_metadata(self._backend, str(self.path), name)
+        self._read_record_lru.cache_clear()
+        self._preloaded.clear()
+        self._incomplete_cache = None
+        logger.info(f"Migrated {n} metadata records to backend {name}.")
+
     def cleanup_shadow(self):
         if os.path.exists(self.shadow_path):
             shutil.rmtree(self.shadow_path)
@@ -343,15 +479,45 @@ class Persistence(PersistenceExecutorInterface):
         backup_path = self._backup_path / path
         return backup_path
 
+    def open_journal(self):
+        """Write the metadata of finished jobs behind their postprocessing
+        (see MetadataJournal)."""
+        try:
+            self._journal = MetadataJournal(self._backend, str(self.path))
+        except BlockingIOError:
+            logger.warning(
+                "The metadata journal is used by another process. Metadata is "
+                "written without journal."
+            )
+
+    def close_journal(self):
+        """Apply all entries of the metadata journal and close it.
+
+        If the entries cannot be applied, the journal is kept and replayed by
+        the next run, instead of raising an error that would replace the one of
+        the scheduler.
+        """
+        if self._journal is not None:
+            journal = self._journal
+            self._journal = None
+            try:
+                journal.close()
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(
+                    f"Failed to apply the metadata journal ({e}). It will be "
+                    "applied by the next run."
+                )
+
     def started(self, job, external_jobid: Optional[str] = None):
         for f in job.output:
-            self._record(self._incomplete_path, {"external_jobid": external_jobid}, f)
+            self._record(INCOMPLETE, {"external_jobid": external_jobid}, f)
 
     def _remove_incomplete_marker(self, job):
         for f in job.output:
-            self._delete_record(self._incomplete_path, f)
+            self._delete_record(INCOMPLETE, f)
 
     async def finished(self, job):
+        self.update_iocache(job)
         if not self.dag.workflow.execution_settings.keep_metadata:
             self._remove_incomplete_marker(job)
             # do not store metadata if not requested
@@ -369,16 +535,29 @@ class Persistence(PersistenceExecutorInterface):
             conda_env = self._conda_env(job)
             software_stack_hash = self._software_stack_hash(job)
             fallback_time = time.time()
-            for f in job.output:
-                rec_path = self._record_path(self._incomplete_path, f)
-                starttime = (
-                    os.path.getmtime(rec_path) if os.path.exists(rec_path) else None
+
+            checksum_algorithm = self.dag.workflow.dag_settings.checksum_algorithm
+            algorithm = get_checksum_algorithm(checksum_algorithm)
+
+            async def input_checksum(infile):
+                return infile, await infile.checksum(
+                    self.max_checksum_file_size, algorithm=algorithm
+                )
+
+            # inputs are hashed concurrently, and only once for all outputs
+            input_checksums = {
+                infile: checksum
+                for infile, checksum in await asyncio.gather(
+                    *map(input_checksum, dict.fromkeys(job.input))
                 )
+                if checksum is not None
+            }
+            records = []
+            for f in job.output:
+                starttime = self._incomplete_mtime(f)
                 # Sometimes finished is called twice, if so, lookup the previous starttime
-                if not os.path.exists(rec_path):
-                    starttime = self._read_record(self._metadata_path, f).get(
-                        "starttime", None
-                    )
+                if starttime is None:
+                    starttime = self._read_record(METADATA, f).get("starttime", None)
 
                 endtime = (
                     (await f.mtime()).local_or_storage()
@@ -386,35 +565,42 @@ class Persistence(PersistenceExecutorInterface):
                     else fallback_time
                 )
 
-                checksums = (
-                    (infile, await infile.checksum(self.max_checksum_file_size))
-                    for infile in job.input
-                )
-                self._record(
-                    self._metadata_path,
-                    {
-                        "record_format_version": RECORD_FORMAT_VERSION,
-                        "code": code,
-                        "rule": job.rule.name,
-                        "input": input,
-                        "log": log,
-                        "params": params,
-                        "shellcmd": shellcmd,
-                        "incomplete": False,
-                        "starttime": starttime,
-                        "endtime": endtime,
-                        "job_hash": hash(job),
-                        "conda_env": conda_env,
-                        "software_stack_hash": software_stack_hash,
-                        "container_img_url": job.container_img_url,
-                        "input_checksums": {
-                            infile: checksum
-                            async for infile, checksum in checksums
-                            if checksum is not None
+                records.append(
+                    (
+                        f,
+                        {
+                            "record_format_version": RECORD_FORMAT_VERSION,
+                            "code": code,
+                            "rule": job.rule.name,
+                            "input": input,
+                            "log": log,
+                            "params": params,
+                            "shellcmd": shellcmd,
+                            "incomplete": False,
+                            "starttime": starttime,
+                            "endtime": endtime,
+                            "job_hash": hash(job),
+                            "conda_env": conda_env,
+                            "software_stack_hash": software_stack_hash,
+                            "container_img_url": job.container_img_url,
+                            "input_checksums": input_checksums,
+                            "input_checksum_algorithm": checksum_algorithm,
                         },
-                    },
-                    f,
+                    )
+                )
+            if self._journal is not None:
+                # the journal removes the incomplete markers once the records
+                # are durable
+                self._journal.append(
+                    [
+                        (self._key(f), self._encode_record(value))
+                        for f, value in records
+                    ],
+                    [self._key(f) for f in job.output],
                 )
+                return
+            for f, value in records:
+                self._record(METADATA, value, f)
         # remove incomplete marker only after creation of metadata record.
         # otherwise the job starttime will be missing.
         self._remove_incomplete_marker(job)
@@ -430,13 +616,15 @@ class Persistence(PersistenceExecutorInterface):
         if self._incomplete_cache is False:  # cache deactivated
 
             def marked_incomplete(f):
-                return self._exists_record(self._incomplete_path, f)
+                return self._exists_record(INCOMPLETE, f)
 
         else:
 
             def marked_incomplete(f):
-                rec_path = self._record_path(self._incomplete_path, f)
-                return rec_path in self._incomplete_cache
+                key = self._key(f)
+                if key in self._uncached:
+                    return self._exists_record(INCOMPLETE, f)
+                return key in self._incomplete_cache
 
         async def is_incomplete(f):
             exists = await f.exists()
@@ -449,16 +637,12 @@ class Persistence(PersistenceExecutorInterface):
         return [task.result() for task in tasks]
 
     def _cache_incomplete_folder(self):
-        self._incomplete_cache = {
-            os.path.join(path, f)
-            for path, dirnames, filenames in os.walk(self._incomplete_path)
-            for f in filenames
-        }
+        self._incomplete_cache = set(self._backend.keys(INCOMPLETE))
 
     def external_jobids(self, job):
         return list(
             set(
-                self._read_record(self._incomplete_path, f).get("external_jobid", None)
+                self._read_record(INCOMPLETE, f).get("external_jobid", None)
                 for f in job.output
             )
         )
@@ -473,7 +657,36 @@ class Persistence(PersistenceExecutorInterface):
         )
 
     def metadata(self, path):
-        return self._read_record(self._metadata_path, path)
+        return self._read_record(METADATA, path)
+
+    def preload_metadata(self, files, n_threads=8):
+        """Read the metadata records of the given files at once, such that
+        checking which jobs need to run does not read them one by one. Records
+        are read with the given number of threads or a batched query,
+        depending on the backend."""
+        if self._incomplete_cache is False:
+            # cache deactivated, records are updated by the running jobs
+            return
+        ids = dict()
+        for f in files:
+            key = self._key(f)
+            if key not in self._preloaded and key not in self._uncached:
+                ids[key] = f
+        if not ids:
+            return
+        records = self._backend.read_many(METADATA, ids, n_threads=n_threads)
+        # records of jobs of the same rule share most of their values (e.g. code)
+        shared = dict()
+        for key, f in ids.items():
+            record = records.get(key)
+            if record is None:
+                self._preloaded[key] = dict()
+                continue
+            record = self._decode_record(METADATA, f, record)
+            for name, value in record.items():
+                if isinstance(value, str):
+                    record[name] = shared.setdefault(value, value)
+            self._preloaded[key] = record
 
     def rule(self, path):
         return self.metadata(path).get("rule")
@@ -504,11 +717,15 @@ class Persistence(PersistenceExecutorInterface):
 
     def input_checksums(self, job, input_path):
         """Return all checksums of the given input file
-        recorded for the output of the given job.
+        recorded for the output of the given job, together with the names of
+        their algorithms.
         """
         return set(
-            self.metadata(output_path).get("input_checksums", {}).get(input_path)
-            for output_path in job.output
+            (
+                metadata.get("input_checksum_algorithm", DEFAULT_CHECKSUM_ALGORITHM),
+                metadata.get("input_checksums", {}).get(input_path),
+            )
+            for metadata in map(self.metadata, job.output)
         )
 
     def code_changed(self, job, file=None):
@@ -604,9 +821,6 @@ class Persistence(PersistenceExecutorInterface):
     def noop(self, *args):
         yield
 
-    def _b64id(self, s):
-        return urlsafe_b64encode(str(s).encode()).decode()
-
     @lru_cache()
     def _code(self, rule):
         # Scripts and notebooks are triggered by changes in the script mtime.
@@ -693,123 +907,117 @@ class Persistence(PersistenceExecutorInterface):
     def _output(self, job):
         return sorted(job.output)
 
-    def _record(
-        self,
-        subject,
-        json_value,
-        id,
-        mode=stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IWGRP,
-    ):
-        recpath = self._record_path(subject, id)
-        try:
-            recpath_stat = os.stat(recpath)
-        except FileNotFoundError:
-            recpath_stat = None
-            recdir = os.path.dirname(recpath)
-            os.makedirs(recdir, exist_ok=True)
-
+    def _encode_record(self, json_value):
         # Encrypt sensitive fields if encryption is enabled
-        encrypted_value = self._encryptor.encrypt_record(json_value)
+        return json.dumps(self._encryptor.encrypt_record(json_value))
 
-        with open(recpath, "w") as recfile:
-            json.dump(encrypted_value, recfile)
-
-        # ensure read and write permissions for user and group if they don't include the required mode
-        if recpath_stat is None:
-            os.chmod(recpath, mode)
-        else:
-            existing = stat.S_IMODE(recpath_stat.st_mode)
-            new_mode = existing | mode
-            if existing != new_mode:
-                os.chmod(recpath, new_mode)
+    def _record(self, subject, json_value, id):
+        key = self._settled_key(subject, id)
+        self._backend.write(subject, key, self._encode_record(json_value))
 
     def _delete_record(self, subject, id):
-        try:
-            recpath = self._record_path(subject, id)
-            os.remove(recpath)
-            recdirs = os.path.relpath(os.path.dirname(recpath), start=subject)
-            if recdirs != ".":
-                os.removedirs(recdirs)
-            return True
-        except OSError as e:
-            if e.errno != 2:
-                # not missing
-                raise e
-            else:
-                # file is missing, report failure
-                return False
+        key = self._settled_key(subject, id)
+        return self._backend.delete(subject, key)
+
+    def _settled_key(self, subject, id):
+        """Return the key of the given file before its record is modified.
+        Entries of the journal for it are applied first."""
+        key = self._key(id)
+        if subject == METADATA:
+            self._preloaded.pop(key, None)
+        if self._journal is not None and self._journal.is_pending(key):
+            self._journal.flush()
+        return key
 
-    @lru_cache()
     def _read_record_cached(self, subject, id):
+        if self._uncached and self._key(id) in self._uncached:
+            return self._read_record_uncached(subject, id)
+        return self._read_record_lru(subject, id)
+
+    @lru_cache()
+    def _read_record_lru(self, subject, id):
         return self._read_record_uncached(subject, id)
 
     def _read_record_uncached(self, subject, id):
-        if not self._exists_record(subject, id):
-            return dict()
-        path = self._record_path(subject, id)
-        with open(path, "r") as f:
+        key = self._key(id)
+        record = None
+        if subject == METADATA:
             try:
-                encrypted_record = json.load(f)
-
-                # Decrypt sensitive fields if encryption is enabled
-                decrypted_record = self._encryptor.decrypt_record(encrypted_record)
-
-                return decrypted_record
-            except json.JSONDecodeError:
-                # Since record writing cannot be reliably made atomic (some network
-                # filesystems, e.g. gluster have issues with writing to a temp file
-                # and then moving) we ignore corrupted or incompletely written records
-                # here.
-                # They can only occur if a ismk process is running and one does a
-                # dry-run (or intentionally disables locking) at the same time.
-                logger.warning(
-                    f"Ignore corrupted or currently written metadata record {path}."
-                )
-                return dict()
+                return self._preloaded[key]
+            except KeyError:
+                pass
+            if self._journal is not None:
+                record = self._journal.record(key)
+        elif self._journal is not None and self._journal.is_done(key):
+            return dict()
+        if record is None:
+            record = self._backend.read(subject, key)
+        if record is None:
+            return dict()
+        return self._decode_record(subject, id, record)
+
+    def _decode_record(self, subject, id, record):
+        try:
+            encrypted_record = json.loads(record)
+
+            # Decrypt sensitive fields if encryption is enabled
+            decrypted_record = self._encryptor.decrypt_record(encrypted_record)
+
+            return decrypted_record
+        except json.JSONDecodeError:
+            # Since record writing cannot be reliably made atomic (some network
+            # filesystems, e.g. gluster have issues with writing to a temp file
+            # and then moving) we ignore corrupted or incompletely written records
+            # here.
+            # They can only occur if a ismk process is running and one does a
+            # dry-run (or intentionally disables locking) at the same time.
+            logger.warning(
+                f"Ignore corrupted or currently written {subject} record of {id}."
+            )
+            return dict()
 
     def _exists_record(self, subject, id):
-        return os.path.exists(self._record_path(subject, id))
+        key = self._key(id)
+        if self._journal is not None:
+            if subject == METADATA and self._journal.record(key) is not None:
+                return True
+            if subject == INCOMPLETE and self._journal.is_done(key):
+                return False
+        return self._backend.exists(subject, key)
+
+    def _incomplete_mtime(self, id):
+        key = self._key(id)
+        if self._journal is not None and self._journal.is_done(key):
+            return None
+        return self._backend.mtime(INCOMPLETE, key)
+
+    def _key(self, id: _IOFile) -> str:
+        assert isinstance(id, _IOFile)
+        return id.storage_object.query if id.is_storage else str(id)
 
     def _locks(self, type):
-        return (
-            f
-            for f, _ in listfiles(
-                os.path.join(self._lockdir, f"{{n,[0-9]+}}.{type}.lock")
-            )
-            if not os.path.isdir(f)
-        )
+        regex = re.compile(rf"[0-9]+\.{type}\.lock")
+        try:
+            with os.scandir(self._lockdir) as entries:
+                return [
+                    entry.path
+                    for entry in entries
+                    if regex.fullmatch(entry.name) and not entry.is_dir()
+                ]
+        except FileNotFoundError:
+            return []
 
     def _lock(self, files, type):
         for i in count(0):
             lockfile = os.path.join(self._lockdir, f"{i}.{type}.lock")
-            if not os.path.exists(lockfile):
-                self._lockfile[type] = lockfile
-                with open(lockfile, "w") as lock:
-                    print(*files, sep="\n", file=lock)
-                return
-
-    def _fetch_max_len(self, subject):
-        if self._max_len is None:
-            self._max_len = os.pathconf(subject, "PC_NAME_MAX")
-        return self._max_len
-
-    def _record_path(self, subject, id: _IOFile):
-        assert isinstance(id, _IOFile)
-        id = id.storage_object.query if id.is_storage else id
-
-        max_len = (
-            self._fetch_max_len(subject) if os.name == "posix" else 255
-        )  # maximum NTFS and FAT32 filename length
-        if max_len == 0:
-            max_len = 255
-
-        b64id = self._b64id(id)
-        # split into chunks of proper length
-        b64id = [b64id[i : i + max_len - 1] for i in range(0, len(b64id), max_len - 1)]
-        # prepend dirs with @ (does not occur in b64) to avoid conflict with b64-named files in the same dir
-        b64id = ["@" + s for s in b64id[:-1]] + [b64id[-1]]
-        path = os.path.join(subject, *b64id)
-        return path
+            try:
+                lock = open(lockfile, "xb")
+            except FileExistsError:
+                continue
+            self._lockfile[type] = lockfile
+            with lock:
+                write_manifest(lock, files)
+            return
 
     def all_outputfiles(self):
         # we only look at output files that will be updated
@@ -820,28 +1028,107 @@ class Persistence(PersistenceExecutorInterface):
         return jobfiles(self.dag.jobs, "input")
 
     def deactivate_cache(self):
-        self._read_record_cached.cache_clear()
+        self._read_record_lru.cache_clear()
         self._read_record = self._read_record_uncached
         self._incomplete_cache = False
+        self._preloaded.clear()
+        self._uncached.clear()
+
+    def exclude_from_cache(self, files):
+        """Stop caching the records of the given files, because they are
+        modified by running jobs while the cache is still used for others (see
+        --pipelined-expansion)."""
+        if self._incomplete_cache is False:
+            # cache deactivated
+            return
+        for f in files:
+            key = self._key(f)
+            self._uncached.add(key)
+            self._preloaded.pop(key, None)
 
     @property
     def _iocache_filename(self):
-        return os.path.join(self.iocache_path, "latest.pkl")
+        return os.path.join(self.iocache_path, "inventory.sqlite")
+
+    def load_iocache(self, trust=False, n_threads=8):
+        """Fill the IOCache with the files of previous runs whose directories
+        are unchanged (see InventoryStore). If trust is True, their mtimes
+        and sizes are reused as well."""
+        # inventory of older versions
+        legacy = os.path.join(self.iocache_path, "latest.pkl")
+        if os.path.exists(legacy):
+            os.remove(legacy)
+        self._inventory = InventoryStore(self._iocache_filename, n_threads=n_threads)
+        with self._inventory_errors():
+            n = self._inventory.load(self.dag.workflow.iocache, trust_mtime=trust)
+            if n:
+                logger.debug(f"Loaded {n} files from inventory of previous runs.")
 
     def save_iocache(self):
-        filepath = self._iocache_filename
-        with open(filepath, "wb") as handle:
-            self.dag.workflow.iocache.save(handle)
+        """Record the current content of the IOCache in the inventory."""
+        if self._inventory is not None and self.dag.workflow.iocache.active:
+            with self._inventory_errors():
+                self._inventory.record(self.dag.workflow.iocache)
+
+    def update_iocache(self, job):
+        """Record the output files of the given (finished) job in the inventory
+        once it is flushed (see close_iocache)."""
+        if self._inventory is not None:
+            files = chain(job.output, job.log, [job.benchmark] if job.benchmark else [])
+            with self._inventory_errors():
+                self._inventory.update(f.file for f in files if not f.is_storage)
+
+    def close_iocache(self):
+        """Record the directories modified since the inventory has been saved,
+        and the checksums computed in this run."""
+        self.checksums.close()
+        if self._inventory is not None:
+            with self._inventory_errors():
+                self._inventory.flush()
+            if self._inventory is not None:
+                self._inventory.close()
+                self._inventory = None
 
-    def load_iocache(self):
-        filepath = self._iocache_filename
-        if os.path.exists(filepath):
-            logger.info("Loading trusted IOCache from latest dry-run.")
+    @contextmanager
+    def _inventory_errors(self):
+        try:
+            yield
+        except sqlite3.Error as e:
+            # the inventory is an optimization only
+            logger.debug(f"Disabling inventory because of error: {e}")
+            self._inventory.close()
+            self._inventory = None
+
+    @property
+    def _dag_snapshot_filename(self):
+        return os.path.join(self.dag_snapshot_path, "latest.pkl")
+
+    def save_dag_snapshot(self, snapshot: DAGSnapshot):
+        filepath = self._dag_snapshot_filename
+        # write atomically, concurrent instances might read the snapshot
+        with LockFreeWritableFile(Path(filepath), binary=True) as handle:
+            pickle.dump(snapshot, handle)
+
+    def load_dag_snapshot(self) -> Optional[DAGSnapshot]:
+        filepath = self._dag_snapshot_filename
+        if not os.path.exists(filepath):
+            return None
+        try:
             with open(filepath, "rb") as handle:
-                self.dag.workflow.iocache = IOCache.load(handle)
+                snapshot = pickle.load(handle)
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            logger.info("Ignoring unreadable DAG snapshot.")
+            return None
+        if (
+            not isinstance(snapshot, DAGSnapshot)
+            or snapshot.version != DAG_SNAPSHOT_VERSION
+        ):
+            logger.info("Ignoring DAG snapshot with mismatched version.")
+            return None
+        return snapshot
 
-    def drop_iocache(self):
-        filepath = self._iocache_filename
+    def drop_dag_snapshot(self):
+        filepath = self._dag_snapshot_filename
         if os.path.exists(filepath):
             os.remove(filepath)
 
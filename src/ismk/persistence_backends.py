@@ -0,0 +1,750 @@
+__author__ = "Johannes Köster"
+__copyright__ = "Copyright 2022, Johannes Köster"
+__email__ = "johannes.koester@uni-due.de"
+__license__ = "MIT"
+
+from abc import ABC, abstractmethod
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+import os
+import shutil
+import sqlite3
+import stat
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ismk.exceptions import WorkflowError
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows, where the journal is not supported
+    fcntl = None
+
+# subjects of records
+METADATA = "metadata"
+INCOMPLETE = "incomplete"
+SUBJECTS = (METADATA, INCOMPLETE)
+
+# key, record and (optionally) the time the record has been written
+Item = Tuple[str, str, Optional[float]]
+
+
+class MetadataBackend(ABC):
+    """Storage of the records that Persistence keeps for output files: their
+    metadata and the markers of incomplete files (see METADATA and
+    INCOMPLETE). Records are JSON strings, keyed by the path (or storage
+    query) of the file. Reading has to be thread-safe.
+    """
+
+    name: str
+
+    @abstractmethod
+    def read(self, subject: str, key: str) -> Optional[str]:
+        """Return the record of the given key, or None if there is none."""
+        ...
+
+    def read_many(
+        self, subject: str, keys: Iterable[str], n_threads: int = 1
+    ) -> Dict[str, str]:
+        """Return the records of those of the given keys that have one. Unless
+        overridden with a batched query, the records are read one by one, with
+        the given number of threads."""
+        keys = list(keys)
+        if n_threads > 1 and len(keys) > 1:
+            with ThreadPoolExecutor(max_workers=n_threads) as pool:
+                records = pool.map(partial(self.read, subject), keys)
+                return {
+                    key: record
+                    for key, record in zip(keys, records)
+                    if record is not None
+                }
+        records = dict()
+        for key in keys:
+            record = self.read(subject, key)
+            if record is not None:
+                records[key] = record
+        return records
+
+    @abstractmethod
+    def write(self, subject: str, key: str, record: str, mtime: Optional[float] = None):
+        """Store the record of the given key. The time of writing is recorded
+        as well, or the given mtime instead."""
+        ...
+
+    def write_many(self, subject: str, items: Iterable[Item], durable: bool = False):
+        """Store the given records. If durable is True, they are synced to disk
+        before returning, such that they survive a crash of the host."""
+        items = list(items)
+        for key, record, mtime in items:
+            self.write(subject, key, record, mtime=mtime)
+        if durable:
+            self.sync(subject, (key for key, _, _ in items))
+
+    @abstractmethod
+    def delete(self, subject: str, key: str) -> bool:
+        """Delete the record of the given key, return whether there was one."""
+        ...
+
+    def delete_many(self, subject: str, keys: Iterable[str], durable: bool = False):
+        """Delete the records of the given keys. If durable is True, the
+        deletion is synced to disk before returning."""
+        keys = list(keys)
+        for key in keys:
+            self.delete(subject, key)
+        if durable:
+            self.sync(subject, keys)
+
+    @abstractmethod
+    def sync(self, subject: str, keys: Iterable[str]):
+        """Sync the current state of the records of the given keys to disk
+        (see write_many and delete_many)."""
+        ...
+
+    @abstractmethod
+    def exists(self, subject: str, key: str) -> bool: ...
+
+    @abstractmethod
+    def mtime(self, subject: str, key: str) -> Optional[float]:
+        """Return the time the record of the given key has been written."""
+        ...
+
+    @abstractmethod
+    def keys(self, subject: str) -> Iterator[str]: ...
+
+    @abstractmethod
+    def clear(self):
+        """Delete all records."""
+        ...
+
+    def close(self):
+        pass
+
+
+class FileBackend(MetadataBackend):
+    """One JSON file per record, named by the base64 encoded key, in a
+    directory per subject. Names that are too long for the file system are
+    split into nested directories, prefixed with @ (which does not occur in
+    base64)."""
+
+    name = "files"
+
+    # read and write permissions for user and group
+    MODE = stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IWGRP
+
+    def __init__(self, path: str):
+        self.path = path
+        self._max_len: Optional[int] = None
+        for subject in SUBJECTS:
+            os.makedirs(os.path.join(self.path, subject), exist_ok=True)
+
+    def read(self, subject: str, key: str) -> Optional[str]:
+        try:
+            with open(self.record_path(subject, key), "r") as f:
+                return f.read()
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+    def write(self, subject: str, key: str, record: str, mtime: Optional[float] = None):
+        recpath = self.record_path(subject, key)
+        try:
+            recpath_stat = os.stat(recpath)
+        except FileNotFoundError:
+            recpath_stat = None
+            recdir = os.path.dirname(recpath)
+            os.makedirs(recdir, exist_ok=True)
+
+        with open(recpath, "w") as recfile:
+            recfile.write(record)
+
+        # ensure read and write permissions for user and group if they don't include the required mode
+        if recpath_stat is None:
+            os.chmod(recpath, self.MODE)
+        else:
+            existing = stat.S_IMODE(recpath_stat.st_mode)
+            new_mode = existing | self.MODE
+            if existing != new_mode:
+                os.chmod(recpath, new_mode)
+        if mtime is not None:
+            os.utime(recpath, (mtime, mtime))
+
+    def delete(self, subject: str, key: str) -> bool:
+        recpath = self.record_path(subject, key)
+        try:
+            os.remove(recpath)
+        except OSError as e:
+            if e.errno != 2:
+                # not missing
+                raise e
+            else:
+                # file is missing, report failure
+                return False
+        # remove the directories of long names if they are empty now
+        root = os.path.join(self.path, subject)
+        recdir = os.path.dirname(recpath)
+        while recdir != root:
+            try:
+                os.rmdir(recdir)
+            except OSError:
+                break
+            recdir = os.path.dirname(recdir)
+        return True
+
+    def exists(self, subject: str, key: str) -> bool:
+        return os.path.exists(self.record_path(subject, key))
+
+    def mtime(self, subject: str, key: str) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.record_path(subject, key))
+        except OSError:
+            return None
+
+    def keys(self, subject: str) -> Iterator[str]:
+        root = os.path.join(self.path, subject)
+        for dirpath, _, filenames in os.walk(root):
+            relpath = os.path.relpath(dirpath, root)
+            prefix = (
+                ""
+                if relpath == "."
+                else "".join(part[1:] for part in relpath.split(os.sep))
+            )
+            for filename in filenames:
+                try:
+                    yield urlsafe_b64decode(prefix + filename).decode()
+                except (binascii.Error, UnicodeDecodeError, ValueError):
+                    # not a record, e.g. the marker of an ongoing migration
+                    continue
+
+    def clear(self):
+        for subject in SUBJECTS:
+            shutil.rmtree(os.path.join(self.path, subject))
+            os.makedirs(os.path.join(self.path, subject))
+
+    def sync(self, subject: str, keys: Iterable[str]):
+        keys = list(keys)
+        if not keys:
+            return
+        root = os.path.join(self.path, subject)
+        directories = set()
+        for key in keys:
+            recpath = self.record_path(subject, key)
+            try:
+                _fsync(recpath)
+            except (FileNotFoundError, NotADirectoryError):
+                # deleted
+                pass
+            # the directories of long names may have been created or removed
+            recdir = os.path.dirname(recpath)
+            while recdir != root:
+                directories.add(recdir)
+                recdir = os.path.dirname(recdir)
+        for recdir in directories:
+            try:
+                _fsync(recdir)
+            except (FileNotFoundError, NotADirectoryError):
+                pass
+        _fsync(root)
+
+    def record_path(self, subject: str, key: str) -> str:
+        root = os.path.join(self.path, subject)
+        if self._max_len is None:
+            self._max_len = (
+                os.pathconf(root, "PC_NAME_MAX") if os.name == "posix" else 255
+            )  # maximum NTFS and FAT32 filename length
+            if self._max_len == 0:
+                self._max_len = 255
+        max_len = self._max_len
+
+        b64id = urlsafe_b64encode(key.encode()).decode()
+        # split into chunks of proper length
+        b64id = [b64id[i : i + max_len - 1] for i in range(0, len(b64id), max_len - 1)]
+        # prepend dirs with @ (does not occur in b64) to avoid conflict with b64-named files in the same dir
+        b64id = ["@" + s for s in b64id[:-1]] + [b64id[-1]]
+        return os.path.join(root, *b64id)
+
+
+def _fsync(path: str):
+    """Sync the given file or directory to disk."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# Increment this when the table layout changes. Older databases have to be
+# migrated, since metadata cannot be recomputed.
+SQLITE_VERSION = 1
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS records (
+    subject TEXT NOT NULL,
+    key TEXT NOT NULL,
+    record TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    PRIMARY KEY (subject, key)
+) WITHOUT ROWID;
+PRAGMA user_version = {SQLITE_VERSION};
+"""
+
+# maximum number of keys per query, below the limit of host parameters of
+# older sqlite versions
+_BATCHSIZE = 500
+
+
+class SqliteBackend(MetadataBackend):
+    """All records in a single sqlite database in write-ahead-log mode, such
+    that reading and writing many records does not need a file per record.
+
+    Write-ahead logging requires shared memory between all processes that
+    access the database. Hence, all processes using the same .ismk directory
+    have to run on the same host, which rules out e.g. cluster jobs that
+    update metadata on a network file system.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            (version,) = conn.execute("PRAGMA user_version").fetchone()
+            if version == 0:
+                conn.executescript(_SCHEMA)
+            elif version != SQLITE_VERSION:
+                raise WorkflowError(
+                    f"Metadata database {path} has version {version}, but this "
+                    f"version of ismk only supports version {SQLITE_VERSION}."
+                )
+        except (sqlite3.Error, WorkflowError):
+            conn.close()
+            raise
+        self._conn: Optional[sqlite3.Connection] = conn
+
+    def read(self, subject: str, key: str) -> Optional[str]:
+        with self._lock:
+            row = (
+                self._connect()
+                .execute(
+                    "SELECT record FROM records WHERE subject = ? AND key = ?",
+                    (subject, key),
+                )
+                .fetchone()
+            )
+        return row[0] if row is not None else None
+
+    def read_many(
+        self, subject: str, keys: Iterable[str], n_threads: int = 1
+    ) -> Dict[str, str]:
+        keys = list(keys)
+        records = dict()
+        with self._lock:
+            conn = self._connect()
+            for i in range(0, len(keys), _BATCHSIZE):
+                batch = keys[i : i + _BATCHSIZE]
+                records.update(
+                    conn.execute(
+                        "SELECT key, record FROM records WHERE subject = ? AND key "
+                        f"IN ({', '.join('?' * len(batch))})",
+                        (subject, *batch),
+                    )
+                )
+        return records
+
+    def write(self, subject: str, key: str, record: str, mtime: Optional[float] = None):
+        self.write_many(subject, [(key, record, mtime)])
+
+    def write_many(self, subject: str, items: Iterable[Item], durable: bool = False):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            with self._synchronous(conn, durable), conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO records (subject, key, record, mtime) "
+                    "VALUES (?, ?, ?, ?)",
+                    (
+                        (subject, key, record, now if mtime is None else mtime)
+                        for key, record, mtime in items
+                    ),
+                )
+
+    def delete(self, subject: str, key: str) -> bool:
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                cursor = conn.execute(
+                    "DELETE FROM records WHERE subject = ? AND key = ?",
+                    (subject, key),
+                )
+        return cursor.rowcount > 0
+
+    def delete_many(self, subject: str, keys: Iterable[str], durable: bool = False):
+        with self._lock:
+            conn = self._connect()
+            with self._synchronous(conn, durable), conn:
+                conn.executemany(
+                    "DELETE FROM records WHERE subject = ? AND key = ?",
+                    ((subject, key) for key in keys),
+                )
+
+    def exists(self, subject: str, key: str) -> bool:
+        return self.mtime(subject, key) is not None
+
+    def mtime(self, subject: str, key: str) -> Optional[float]:
+        with self._lock:
+            row = (
+                self._connect()
+                .execute(
+                    "SELECT mtime FROM records WHERE subject = ? AND key = ?",
+                    (subject, key),
+                )
+                .fetchone()
+            )
+        return row[0] if row is not None else None
+
+    def keys(self, subject: str) -> Iterator[str]:
+        with self._lock:
+            rows = (
+                self._connect()
+                .execute("SELECT key FROM records WHERE subject = ?", (subject,))
+                .fetchall()
+            )
+        return (key for (key,) in rows)
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM records")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def sync(self, subject: str, keys: Iterable[str]):
+        with self._lock:
+            # syncs the write-ahead log and the database
+            self._connect().execute("PRAGMA wal_checkpoint(FULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            raise WorkflowError(f"Metadata database {self.path} has been closed.")
+        return self._conn
+
+    @contextmanager
+    def _synchronous(self, conn: sqlite3.Connection, durable: bool):
+        """With synchronous = NORMAL, committed transactions are only synced to
+        disk by the next checkpoint of the write-ahead log. Durable transactions
+        sync it when they are committed."""
+        if not durable:
+            yield
+            return
+        conn.execute("PRAGMA synchronous = FULL")
+        try:
+            yield
+        finally:
+            conn.execute("PRAGMA synchronous = NORMAL")
+
+
+METADATA_BACKENDS = {backend.name: backend for backend in (FileBackend, SqliteBackend)}
+
+# name of the database of the sqlite backend within the .ismk directory
+SQLITE_FILENAME = "metadata.sqlite"
+
+
+def create_metadata_backend(path: str, name: Optional[str] = None) -> MetadataBackend:
+    """Return the backend of the given name for the given .ismk directory.
+    Without name, the sqlite backend is used if its database exists (e.g. after
+    a migration, see Persistence.migrate_metadata), and files otherwise."""
+    sqlite_path = os.path.join(path, SQLITE_FILENAME)
+    if name is None:
+        name = SqliteBackend.name if os.path.exists(sqlite_path) else FileBackend.name
+    if name == FileBackend.name:
+        return FileBackend(path)
+    if name == SqliteBackend.name:
+        return SqliteBackend(sqlite_path)
+    raise WorkflowError(
+        f"Unknown metadata backend {name}. "
+        f"Supported: {', '.join(METADATA_BACKENDS)}."
+    )
+
+
+def migrate_metadata(
+    source: MetadataBackend, path: str, name: str
+) -> Tuple[MetadataBackend, int]:
+    """Copy all records of the given backend into the backend of the given
+    name for the given .ismk directory, and delete them from the given backend
+    afterwards. Returns the new backend and the number of copied records.
+
+    The sqlite database is built under a temporary name and renamed when
+    complete, such that an interrupted migration leaves the given backend in
+    use (see create_metadata_backend).
+    """
+    sqlite_path = os.path.join(path, SQLITE_FILENAME)
+    if name == SqliteBackend.name:
+        tmp_path = sqlite_path + ".migrating"
+        _remove_database(tmp_path)
+        target: MetadataBackend = SqliteBackend(tmp_path)
+    else:
+        target = create_metadata_backend(path, name)
+
+    n = 0
+    for subject in SUBJECTS:
+        keys = list(source.keys(subject))
+        for i in range(0, len(keys), _BATCHSIZE):
+            records = source.read_many(subject, keys[i : i + _BATCHSIZE])
+            target.write_many(
+                subject,
+                [
+                    (key, record, source.mtime(subject, key))
+                    for key, record in records.items()
+                ],
+            )
+            n += len(records)
+
+    if name == SqliteBackend.name:
+        # closing the last connection checkpoints and removes the log
+        target.close()
+        os.replace(tmp_path, sqlite_path)
+        target = SqliteBackend(sqlite_path)
+    source.clear()
+    source.close()
+    if isinstance(source, SqliteBackend):
+        _remove_database(source.path)
+    return target, n
+
+
+def _remove_database(path: str):
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+# name of the journal of MetadataJournal within the .ismk directory
+JOURNAL_FILENAME = "metadata.journal"
+
+
+class MetadataJournal:
+    """Append-only journal of the metadata records of finished jobs, such
+    that finishing a job does not wait for writing its records (see
+    --metadata-journal).
+
+    A background thread writes the entries that have been appended in the
+    meantime to the journal at once, and syncs them to disk (group commit).
+    Afterwards, it applies them to the backend: the records are stored and
+    the incomplete markers of their files are deleted. Hence, the markers are
+    only deleted once the records are durable. Then, the journal is
+    truncated. If the process is killed, the journal is applied when the
+    .ismk directory is used the next time (see replay_journal), while files of
+    entries that have not been synced remain marked as incomplete.
+
+    Until they are applied, appended entries are visible with record() and
+    is_done(). The journal is locked while it is open, such that other
+    processes do not replay it.
+    """
+
+    # number of synced entries that are applied at once at most, even if more
+    # entries have been appended in the meantime
+    MAX_APPLY = 1000
+
+    def __init__(self, backend: MetadataBackend, path: str):
+        if fcntl is None:
+            raise WorkflowError("The metadata journal is not supported on Windows.")
+        self.backend = backend
+        self.path = os.path.join(path, JOURNAL_FILENAME)
+        self._file = open(self.path, "a+")
+        try:
+            # fails if the journal is open in another process
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # entries of a killed process that have not been replayed yet
+            _apply_entries(backend, _read_entries(self._file))
+            self._truncate()
+        except OSError as e:
+            self._file.close()
+            raise e
+
+        self._cond = threading.Condition()
+        self._seq = 0
+        # appended entries that have not been written yet
+        self._queue: List[tuple] = []
+        # number of appended entries that have not been applied yet
+        self._pending = 0
+        # key -> (seq, record) and key -> seq of entries that have not been
+        # applied yet
+        self._records: Dict[str, Tuple[int, str]] = dict()
+        self._done: Dict[str, int] = dict()
+        self._closing = False
+        self._error: Optional[Exception] = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def append(self, records: Iterable[Tuple[str, str]], done: Iterable[str]):
+        """Append an entry that stores the given records (key and JSON string)
+        of metadata, and deletes the incomplete markers of the given keys."""
+        records = list(records)
+        done = list(done)
+        with self._cond:
+            self._raise_error()
+            self._seq += 1
+            for key, record in records:
+                self._records[key] = (self._seq, record)
+            for key in done:
+                self._done[key] = self._seq
+            self._queue.append((self._seq, records, done))
+            self._pending += 1
+            self._cond.notify_all()
+
+    def record(self, key: str) -> Optional[str]:
+        """Return the metadata record of the given key if it has not been
+        applied yet."""
+        with self._cond:
+            entry = self._records.get(key)
+        return entry[1] if entry is not None else None
+
+    def is_done(self, key: str) -> bool:
+        """Return whether the incomplete marker of the given key is deleted by
+        an entry that has not been applied yet."""
+        with self._cond:
+            return key in self._done
+
+    def is_pending(self, key: str) -> bool:
+        with self._cond:
+            return key in self._records or key in self._done
+
+    def flush(self):
+        """Wait until all appended entries have been applied."""
+        with self._cond:
+            while self._pending and self._error is None:
+                self._cond.wait()
+            self._raise_error()
+
+    def close(self):
+        """Apply all appended entries and remove the journal."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join()
+        try:
+            if self._error is None:
+                os.remove(self.path)
+        finally:
+            self._file.close()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        synced: List[tuple] = []
+        while True:
+            with self._cond:
+                while not self._queue and not synced and not self._closing:
+                    self._cond.wait()
+                if not self._queue and not synced:
+                    return
+                queue, self._queue = self._queue, []
+            try:
+                if queue:
+                    self._write(queue)
+                    synced.extend(queue)
+                with self._cond:
+                    if self._queue and len(synced) < self.MAX_APPLY:
+                        # sync the entries appended in the meantime first
+                        continue
+                _apply_entries(
+                    self.backend,
+                    (
+                        {"metadata": records, "done": done}
+                        for _, records, done in synced
+                    ),
+                )
+                self._truncate()
+                self._applied(synced)
+                synced = []
+            except (OSError, sqlite3.Error) as e:
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                return
+
+    def _write(self, entries):
+        for _, records, done in entries:
+            self._file.write(json.dumps({"metadata": records, "done": done}))
+            self._file.write("\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _truncate(self):
+        self._file.truncate(0)
+        os.fsync(self._file.fileno())
+
+    def _applied(self, entries):
+        with self._cond:
+            for seq, records, done in entries:
+                for key, _ in records:
+                    if self._records[key][0] == seq:
+                        del self._records[key]
+                for key in done:
+                    if self._done[key] == seq:
+                        del self._done[key]
+            self._pending -= len(entries)
+            self._cond.notify_all()
+
+
+def replay_journal(backend: MetadataBackend, path: str) -> int:
+    """Apply the journal left by a killed process (see MetadataJournal) to the
+    given backend, unless it is still open in another process. Returns the
+    number of applied entries."""
+    journal_path = os.path.join(path, JOURNAL_FILENAME)
+    if fcntl is None or not os.path.exists(journal_path):
+        return 0
+    try:
+        with open(journal_path, "r+") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # written by another process
+                return 0
+            entries = list(_read_entries(f))
+            _apply_entries(backend, entries)
+            os.remove(journal_path)
+    except FileNotFoundError:
+        # closed by another process in the meantime
+        return 0
+    return len(entries)
+
+
+def _read_entries(f) -> Iterator[dict]:
+    f.seek(0)
+    for line in f:
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            # the last entry has not been written completely, hence it has
+            # not been synced and its files are still marked as incomplete
+            return
+
+
+def _apply_entries(backend: MetadataBackend, entries: Iterable[dict]):
+    records: List[Item] = []
+    done: List[str] = []
+    for entry in entries:
+        records.extend((key, record, None) for key, record in entry["metadata"])
+        done.extend(entry["done"])
+    # Records of later entries replace those of earlier ones. The journal is
+    # truncated or removed afterwards, hence the changes have to be on disk.
+    backend.write_many(METADATA, records, durable=True)
+    backend.delete_many(INCOMPLETE, done, durable=True)
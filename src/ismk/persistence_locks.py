@@ -0,0 +1,307 @@
+__author__ = "Johannes Köster"
+__copyright__ = "Copyright 2022, Johannes Köster"
+__email__ = "johannes.koester@uni-due.de"
+__license__ = "MIT"
+
+from array import array
+import errno
+from hashlib import blake2b
+import os
+import struct
+import sys
+from typing import BinaryIO, Dict, Iterable, List, Set, Tuple
+
+from ismk.exceptions import WorkflowError
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows, where fine-grained locks are not supported
+    fcntl = None
+
+# Lock manifests start with this, lock files of older versions contain one
+# path per line instead.
+MAGIC = b"ISMKLCK1\n"
+
+# A manifest consists of segments (one per call of write_segment), each with a
+# header of the number of hashes and the size of its Bloom filter in bytes,
+# followed by the Bloom filter and the 64 bit hashes of the paths. They are not
+# sorted, since they are intersected as a whole (which is done in C).
+_SEGMENT = struct.Struct("<QQ")
+
+# Segments with fewer hashes have no Bloom filter, reading all of them is
+# about as fast.
+BLOOM_MIN = 4096
+# With two probes per hash, this yields a false positive rate of about 1.4%.
+BLOOM_BITS_PER_HASH = 16
+# Looking up a hash in a Bloom filter is about as expensive as intersecting
+# this many hashes of a segment (which is done in C).
+_BLOOM_LOOKUP_COST = 16
+
+
+def path_hash(path: str) -> int:
+    """Return the 64 bit hash of the given path that is stored in manifests.
+    Unlike hash(), it is the same in all processes."""
+    return int.from_bytes(blake2b(path.encode(), digest_size=8).digest(), "little")
+
+
+def path_hashes(paths: Iterable[str]) -> Set[int]:
+    from_bytes = int.from_bytes
+    return {
+        from_bytes(blake2b(str(path).encode(), digest_size=8).digest(), "little")
+        for path in paths
+    }
+
+
+def write_segment(f: BinaryIO, hashes: Iterable[int]):
+    """Append a segment with the given hashes to the manifest opened as f."""
+    hashes = list(hashes)
+    bloom = _bloom(hashes) if len(hashes) >= BLOOM_MIN else b""
+    values = array("Q", hashes)
+    if sys.byteorder == "big":
+        values.byteswap()
+    f.write(_SEGMENT.pack(len(hashes), len(bloom)))
+    f.write(bloom)
+    f.write(values.tobytes())
+
+
+def write_manifest(f: BinaryIO, hashes: Iterable[int]):
+    f.write(MAGIC)
+    write_segment(f, hashes)
+
+
+def intersects(path: str, hashes: Set[int]) -> bool:
+    """Return whether the manifest (or lock file of an older version) at the
+    given path contains any of the given hashes.
+
+    If there are much fewer given hashes than hashes in a segment, they are
+    looked up in the Bloom filter of the segment first, and the segment is
+    only read if any of them might be contained in it. The hashes of the
+    segment are intersected with the given ones (or those that passed the
+    Bloom filter) as a whole.
+    """
+    if not hashes:
+        return False
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            f.seek(0)
+            return any(
+                path_hash(line.decode().strip()) in hashes for line in f if line.strip()
+            )
+        while True:
+            header = f.read(_SEGMENT.size)
+            if len(header) < _SEGMENT.size:
+                # end of the manifest (or a segment that is written right now)
+                return False
+            n, bloom_size = _SEGMENT.unpack(header)
+            candidates = hashes
+            if bloom_size and len(hashes) * _BLOOM_LOOKUP_COST < n:
+                bloom = f.read(bloom_size)
+                if len(bloom) < bloom_size:
+                    return False
+                candidates = {h for h in hashes if _in_bloom(bloom, h)}
+                if not candidates:
+                    f.seek(8 * n, 1)
+                    continue
+            else:
+                f.seek(bloom_size, 1)
+            if not candidates.isdisjoint(_read_values(f, n)):
+                return True
+
+
+def _read_values(f: BinaryIO, n: int) -> array:
+    data = f.read(8 * n)
+    values = array("Q")
+    # ignore incompletely written hashes
+    values.frombytes(data[: len(data) - len(data) % 8])
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _bloom(hashes: List[int]) -> bytes:
+    # a power of two, such that probes can be masked
+    nbits = 1 << max(3, (len(hashes) * BLOOM_BITS_PER_HASH - 1).bit_length())
+    mask = nbits - 1
+    bits = bytearray(nbits // 8)
+    for h in hashes:
+        p = h & mask
+        bits[p >> 3] |= 1 << (p & 7)
+        p = (h >> 32) & mask
+        bits[p >> 3] |= 1 << (p & 7)
+    return bytes(bits)
+
+
+def _in_bloom(bloom: bytes, h: int) -> bool:
+    mask = len(bloom) * 8 - 1
+    return all(bloom[p >> 3] & (1 << (p & 7)) for p in (h & mask, (h >> 32) & mask))
+
+
+# Files are represented by a byte in one of this many bucket files, such that
+# the locks (which the kernel keeps in a list per file) are spread.
+NBUCKETS = 64
+_SLOT_BITS = 40
+# Held (shared) by processes with fine-grained locks, beyond the bytes of
+# files.
+_ACTIVE = (0, 1 << _SLOT_BITS)
+
+# Open file description locks belong to the open file instead of the process.
+# POSIX record locks would be shared by all workflows of a process, and
+# released whenever any descriptor of the bucket file is closed. Hence,
+# fine-grained locks are only supported where open file description locks are
+# available (Linux, with a 64 bit off_t as in _FLOCK).
+_OFD = fcntl is not None and hasattr(fcntl, "F_OFD_SETLK") and sys.maxsize > 2**32
+# struct flock: l_type, l_whence, l_start, l_len, l_pid (and padding)
+_FLOCK = struct.Struct("hhqqi4x")
+
+
+class FileLocks:
+    """Advisory locks of single files, that are taken and released as jobs are
+    scheduled and finished (see --fine-grained-locks). Inputs are locked
+    shared, such that any number of jobs can read them, and outputs
+    exclusively.
+
+    Each file is represented by a byte of a bucket file, both chosen by its
+    path hash, which is locked with an open file description lock. The OS
+    releases such locks when the process ends, hence they never go stale.
+    Since a lock is held once per instance, the locks of each byte are counted
+    here, such that e.g. two jobs reading the same input can finish
+    independently.
+    """
+
+    def __init__(self, path: str):
+        if not _OFD:
+            raise WorkflowError(
+                "Fine-grained locks (--fine-grained-locks) are only supported on "
+                "Linux, since they require open file description locks."
+            )
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        # opened on first use and kept open until closing
+        self._fds: Dict[int, int] = dict()
+        # number of shared and exclusive locks of each locked byte
+        self._held: Dict[Tuple[int, int], Tuple[int, int]] = dict()
+
+    def acquire(self, reads: Set[int], writes: Set[int]) -> bool:
+        """Lock the files of the given path hashes (see path_hashes) for
+        reading and writing. Return False, without locking any of them, if
+        one of them is locked by another process."""
+        taken = []
+        try:
+            for h in reads - writes:
+                self._add(_slot(h), False)
+                taken.append((_slot(h), False))
+            for h in writes:
+                self._add(_slot(h), True)
+                taken.append((_slot(h), True))
+        except OSError as e:
+            if e.errno not in (errno.EACCES, errno.EAGAIN):
+                raise
+            for slot, exclusive in reversed(taken):
+                self._remove(slot, exclusive)
+            return False
+        return True
+
+    def release(self, reads: Set[int], writes: Set[int]):
+        """Release the locks taken by acquire with the same arguments."""
+        for h in reads - writes:
+            self._remove(_slot(h), False)
+        for h in writes:
+            self._remove(_slot(h), True)
+
+    def conflicts(self, reads: Set[int], writes: Set[int]) -> bool:
+        """Return whether any of the given files cannot be locked as with
+        acquire, without locking them. This is much faster than acquire for
+        many files, since the kernel keeps the locks of a file in a list."""
+        return any(
+            self._conflicts(_slot(h), fcntl.F_RDLCK) for h in reads - writes
+        ) or any(self._conflicts(_slot(h), fcntl.F_WRLCK) for h in writes)
+
+    def announce(self):
+        """Signal processes with classic locks that this process holds
+        fine-grained locks (see others_active), until closing."""
+        self._setlk(_ACTIVE, fcntl.F_RDLCK)
+
+    def others_active(self) -> bool:
+        """Return whether any other process (or instance) holds fine-grained
+        locks."""
+        return self._conflicts(_ACTIVE, fcntl.F_WRLCK)
+
+    def close(self):
+        """Release all locks."""
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
+        self._held.clear()
+
+    def _add(self, slot, exclusive):
+        shared, excl = counts = self._held.get(slot, (0, 0))
+        new = (shared + (not exclusive), excl + exclusive)
+        if _mode(new) != _mode(counts):
+            self._setlk(slot, _mode(new))
+        self._held[slot] = new
+
+    def _remove(self, slot, exclusive):
+        shared, excl = counts = self._held[slot]
+        new = (shared - (not exclusive), excl - exclusive)
+        if _mode(new) != _mode(counts):
+            # downgrading or releasing a lock never fails
+            self._setlk(slot, _mode(new))
+        if new == (0, 0):
+            del self._held[slot]
+        else:
+            self._held[slot] = new
+
+    def _fd(self, bucket):
+        fd = self._fds.get(bucket)
+        if fd is None:
+            fd = os.open(
+                os.path.join(self.path, f"{bucket}.lock"), os.O_RDWR | os.O_CREAT
+            )
+            self._fds[bucket] = fd
+        return fd
+
+    def _setlk(self, slot, l_type):
+        """Set the lock of the given type on the given slot, which never
+        blocks. Raises OSError if it is locked by another instance."""
+        bucket, offset = slot
+        fcntl.fcntl(
+            self._fd(bucket),
+            fcntl.F_OFD_SETLK,
+            _FLOCK.pack(l_type, os.SEEK_SET, offset, 1, 0),
+        )
+
+    def _conflicts(self, slot, l_type) -> bool:
+        """Return whether another instance holds a lock on the given slot that
+        conflicts with a lock of the given type."""
+        bucket, offset = slot
+        result = fcntl.fcntl(
+            self._fd(bucket),
+            fcntl.F_OFD_GETLK,
+            _FLOCK.pack(l_type, os.SEEK_SET, offset, 1, 0),
+        )
+        return _FLOCK.unpack(result)[0] != fcntl.F_UNLCK
+
+
+def _slot(h: int) -> Tuple[int, int]:
+    return h % NBUCKETS, (h >> 8) & ((1 << _SLOT_BITS) - 1)
+
+
+def _mode(counts: Tuple[int, int]) -> int:
+    shared, exclusive = counts
+    if exclusive:
+        return fcntl.F_WRLCK
+    return fcntl.F_RDLCK if shared else fcntl.F_UNLCK
+
+
+def fine_grained_locked(path: str, reads: Set[int], writes: Set[int]) -> bool:
+    """Return whether any of the files of the given path hashes is locked by a
+    process with fine-grained locks (see FileLocks) at the given path."""
+    if not _OFD or not os.path.exists(path):
+        # no process of this host can hold fine-grained locks
+        return False
+    locks = FileLocks(path)
+    try:
+        return locks.others_active() and locks.conflicts(reads, writes)
+    finally:
+        locks.close()
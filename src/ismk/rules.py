@@ -870,7 +870,9 @@ class Rule(RuleInterface):
             if from_callable is not None:
                 if isinstance(f, Path):
                     f = str(f.as_posix())
-                iofile = IOFile(f, rule=self).apply_wildcards(wildcards)
+                # the pattern is used only once and its flags are modified
+                # below, hence it is not interned
+                iofile = IOFile(f, rule=self).apply_wildcards(wildcards, intern=False)
 
                 # inherit flags from callable
                 if hasattr(from_callable, "flags"):
@@ -1298,7 +1300,11 @@ class Rule(RuleInterface):
                 }
                 for o in self.products():
                     try:
-                        applied = o.apply_wildcards(wildcards_dict)
+                        if o.is_storage:
+                            applied = o.apply_wildcards(wildcards_dict)
+                        else:
+                            # compare without creating a file
+                            applied = o.wildcard_template().apply(wildcards_dict)
                         # if the output formatted with the wildcards matches the requested output,
                         if applied == requested_output:
                             # we check whether the wildcards satisfy the constraints
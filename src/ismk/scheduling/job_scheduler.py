@@ -44,6 +44,10 @@ _ERROR_MSG_FINAL = (
     "Exiting because a job execution failed. Look below for error messages"
 )
 
+# seconds after which jobs whose files are locked by another process are
+# reconsidered (see --fine-grained-locks)
+_LOCKED_FILES_WAIT_TIME = 5
+
 _ERROR_MSG_ISSUE_823 = (
     "BUG: Out of jobs ready to be started, but not all files built yet."
     " Please check https://github.com/ismk/ismk/issues/823 for more information."
@@ -114,6 +118,7 @@ class JobScheduler(JobSchedulerExecutorInterface):
 
         self._errors = False
         self._executor_error = None
+        self._expansion_error = None
         self._finished = False
         self._job_queue = None
         self._last_job_selection_empty = False
@@ -122,6 +127,7 @@ class JobScheduler(JobSchedulerExecutorInterface):
         self.finish_callback = self._proceed
         self._run_performed = None
         self._input_sizes = {}
+        self._blocked_jobs = set()
 
         if workflow.remote_execution_settings.immediate_submit:
             self.submit_callback = self._proceed
@@ -215,10 +221,15 @@ class JobScheduler(JobSchedulerExecutorInterface):
             while True:
                 if self.workflow.dag.queue_input_jobs:
                     self.update_queue_input_jobs()
-                # work around so that the wait does not prevent keyboard interrupts
-                # while not self._open_jobs.acquire(False):
-                #    time.sleep(1)
-                self._open_jobs.acquire()
+                if self.workflow.dag.is_expanding:
+                    # Continue building the DAG instead of waiting for jobs.
+                    self._open_jobs.acquire(blocking=False)
+                    self.advance_expansion()
+                else:
+                    # work around so that the wait does not prevent keyboard interrupts
+                    # while not self._open_jobs.acquire(False):
+                    #    time.sleep(1)
+                    self._open_jobs.acquire()
 
                 # obtain needrun and running jobs in a thread-safe way
                 with self._lock:
@@ -228,10 +239,16 @@ class JobScheduler(JobSchedulerExecutorInterface):
                     running = list(self.running)
                     errors = self._errors
                     executor_error = self._executor_error
+                    expansion_error = self._expansion_error
                     user_kill = self._user_kill
 
                 # handle errors
-                if user_kill or (not self.keepgoing and errors) or executor_error:
+                if (
+                    user_kill
+                    or (not self.keepgoing and errors)
+                    or executor_error
+                    or expansion_error
+                ):
                     if user_kill == "graceful":
                         logger.info(
                             "Will exit after finishing currently running jobs (scheduler)."
@@ -243,6 +260,9 @@ class JobScheduler(JobSchedulerExecutorInterface):
                     if executor_error or not running:
                         logger.info("Shutting down, this might take some time.")
                         self._executor.shutdown()
+                        if expansion_error:
+                            # jobs started before the error have been finished
+                            raise expansion_error
                         if not user_kill:
                             logger.error(_ERROR_MSG_FINAL)
                             for job in self.failed:
@@ -258,6 +278,7 @@ class JobScheduler(JobSchedulerExecutorInterface):
                         or self.workflow.remote_execution_settings.immediate_submit
                     )
                     and not self.workflow.dag.has_unfinished_queue_input_jobs()
+                    and not self.workflow.dag.is_expanding
                 ):
                     self._executor.shutdown()
                     if errors:
@@ -314,7 +335,7 @@ class JobScheduler(JobSchedulerExecutorInterface):
 
                     if not self._last_job_selection_empty:
                         logger.info("Select jobs to execute...")
-                    run = self.job_selector(needrun)
+                    run = self._lock_jobs(self.job_selector(needrun))
                     self._last_job_selection_empty = not run
 
                     logger.debug(f"Selected jobs: {len(run)}")
@@ -399,6 +420,39 @@ class JobScheduler(JobSchedulerExecutorInterface):
             self._executor.cancel()
             raise e
 
+    def advance_expansion(self):
+        """Advance the pipelined expansion of the DAG (see --pipelined-expansion).
+        Errors are raised once all running jobs have been finished."""
+        try:
+            self.workflow.dag.advance_expansion()
+        except Exception as e:
+            with self._lock:
+                self._expansion_error = e
+
+    def _lock_jobs(self, jobs):
+        """Lock the files of the given selected jobs (see
+        Persistence.lock_job) and return those that can run. The others stay
+        ready and are reconsidered later, since their files are locked by
+        another process."""
+        selected, blocked = [], set()
+        for job in jobs:
+            if self.workflow.persistence.lock_job(job):
+                selected.append(job)
+            else:
+                blocked.add(job)
+        if blocked:
+            with self._lock:
+                for job in blocked:
+                    self._free_resources(job)
+            if not blocked <= self._blocked_jobs:
+                logger.info(
+                    f"Waiting for {len(blocked)} jobs whose files are locked by "
+                    "another process."
+                )
+            self._schedule_reevalutation(_LOCKED_FILES_WAIT_TIME)
+        self._blocked_jobs = blocked
+        return selected
+
     def _schedule_reevalutation(self, delay: int) -> None:
         threading.Timer(
             delay,
@@ -453,6 +507,7 @@ class JobScheduler(JobSchedulerExecutorInterface):
                         )
                         self._handle_error(job, postprocess_job=False)
                         continue
+                    self.workflow.persistence.unlock_job(job)
 
                 if self.handle_job_success:
                     self.get_executor(job).handle_job_success(job)
@@ -553,6 +608,7 @@ class JobScheduler(JobSchedulerExecutorInterface):
                     error=True,
                 )
             )
+        self.workflow.persistence.unlock_job(job)
         self.get_executor(job).handle_job_error(job)
         self.running.remove(job)
         self._free_resources(job)
@@ -583,12 +639,13 @@ class JobScheduler(JobSchedulerExecutorInterface):
                 if self.resources["_cores"] == 0:
                     return []
                 if len(jobs) == 1:
-                    return self.job_selector_greedy(
+                    selected = self.job_selector_greedy(
+                        jobs, self.remaining_jobs, self.resources, self._input_sizes
+                    )
+                else:
+                    selected = job_selector(
                         jobs, self.remaining_jobs, self.resources, self._input_sizes
                     )
-                selected = job_selector(
-                    jobs, self.remaining_jobs, self.resources, self._input_sizes
-                )
                 if selected is None:
                     selected = self.job_selector_greedy(
                         jobs, self.remaining_jobs, self.resources, self._input_sizes
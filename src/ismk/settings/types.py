@@ -33,6 +33,8 @@ from ismk.common.configfile import load_configfile
 from ismk.resources import DefaultResources
 from ismk.utils import update_config
 from ismk.exceptions import WorkflowError
+from ismk.io.checksums import get_checksum_algorithm
+from ismk.persistence_backends import METADATA_BACKENDS
 from ismk.settings.enums import (
     RerunTrigger,
     CondaCleanupPkgs,
@@ -110,6 +112,7 @@ class ExecutionSettings(SettingsBase, ExecutionSettingsExecutorInterface):
     standalone: bool = False
     ignore_ambiguity: bool = False
     lock: bool = True
+    fine_grained_locks: bool = False
     ignore_incomplete: bool = False
     wait_for_files: Sequence[str] = tuple()
     no_hooks: bool = False
@@ -119,6 +122,7 @@ class ExecutionSettings(SettingsBase, ExecutionSettingsExecutorInterface):
     shadow_prefix: Optional[Path] = None
     keep_incomplete: bool = False
     keep_metadata: bool = True
+    metadata_journal: bool = False
     edit_notebook: Optional[NotebookEditMode] = None
     cleanup_scripts: bool = True
     queue_input_wait_time: int = 10
@@ -208,8 +212,15 @@ class DAGSettings(SettingsBase):
     allowed_rules: AnySet[str] = frozenset()
     rerun_triggers: AnySet[RerunTrigger] = RerunTrigger.all()
     max_inventory_wait_time: int = 20
+    max_expansion_concurrency: int = 1
+    max_stat_threads: int = 8
     trust_io_cache: bool = False
+    watch_io_cache: bool = False
+    dag_snapshot: bool = False
+    pipelined_expansion: bool = False
     max_checksum_file_size: int = 1000000
+    checksum_algorithm: str = "sha256"
+    metadata_backend: Optional[str] = None
     strict_evaluation: AnySet[StrictDagEvaluation] = frozenset()
     print_dag_as: PrintDag = PrintDag.DOT
     # strict_functions_evaluation: bool = False
@@ -222,6 +233,20 @@ class DAGSettings(SettingsBase):
                 "--batch may not be combined with --forceall, because recomputed upstream "
                 "jobs in subsequent batches may render already obtained results outdated."
             )
+        if self.max_expansion_concurrency < 1:
+            raise WorkflowError(
+                "--max-expansion-concurrency must be a positive integer."
+            )
+        # raises a WorkflowError for unknown or unavailable algorithms
+        get_checksum_algorithm(self.checksum_algorithm)
+        if (
+            self.metadata_backend is not None
+            and self.metadata_backend not in METADATA_BACKENDS
+        ):
+            raise WorkflowError(
+                f"Unknown metadata backend {self.metadata_backend}. "
+                f"Supported: {', '.join(METADATA_BACKENDS)}."
+            )
 
 
 @dataclass
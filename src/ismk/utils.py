@@ -8,7 +8,6 @@ import json
 import re
 import inspect
 import textwrap
-from itertools import chain
 import collections
 import multiprocessing
 import string
@@ -21,6 +20,7 @@ from ismk.logging import logger
 from ismk.common import ON_WINDOWS
 from ismk.exceptions import WorkflowError
 from ismk.io import regex_from_filepattern
+from ismk.io.walker import walk_pattern
 
 
 def validate(data, schema, set_default=True):
@@ -304,31 +304,21 @@ def listfiles(pattern, restriction=None, omit_value=None):
         tuple: The next file matching the pattern, and the corresponding wildcards object
     """
     pattern = os.path.normpath(pattern)
-    first_wildcard = re.search("{[^{]", pattern)
-    if first_wildcard:
-        dirname = os.path.dirname(pattern[: first_wildcard.start()])
-        if not dirname:
-            dirname = "."
-    else:
-        dirname = os.path.dirname(pattern)
-    pattern = re.compile(regex_from_filepattern(pattern))
-
-    for dirpath, dirnames, filenames in os.walk(dirname):
-        for f in chain(filenames, dirnames):
-            if dirpath != ".":
-                f = os.path.normpath(os.path.join(dirpath, f))
-            match = re.match(pattern, f)
-            if match:
-                wildcards = Namedlist(fromdict=match.groupdict())
-                if restriction is not None:
-                    invalid = any(
-                        omit_value not in v and v != wildcards[k]
-                        for k, v in restriction.items()
-                    )
-                    if not invalid:
-                        yield f, wildcards
-                else:
+    regex = re.compile(regex_from_filepattern(pattern))
+
+    for f in walk_pattern(pattern):
+        match = regex.match(f)
+        if match:
+            wildcards = Namedlist(fromdict=match.groupdict())
+            if restriction is not None:
+                invalid = any(
+                    omit_value not in v and v != wildcards[k]
+                    for k, v in restriction.items()
+                )
+                if not invalid:
                     yield f, wildcards
+            else:
+                yield f, wildcards
 
 
 def makedirs(dirnames):
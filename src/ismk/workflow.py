@@ -736,6 +736,7 @@ class Workflow(WorkflowExecutorInterface):
         lock_warn_only: bool,
         nolock: bool = False,
         shadow_prefix: str | Path | None = None,
+        fine_grained_locks: bool = False,
     ):
         if self.workflow_settings.cache is not None:
             self.cache_rules.update(
@@ -893,6 +894,7 @@ class Workflow(WorkflowExecutorInterface):
             warn_only=lock_warn_only,
             path=persistence_path,
             metadata_encryption_key=encryption_key,
+            fine_grained_locks=fine_grained_locks,
         )
 
     def generate_unit_tests(self, path: Path):
@@ -940,6 +942,15 @@ class Workflow(WorkflowExecutorInterface):
                 + "\n".join(failed)
             )
 
+    def migrate_metadata(self, backend: str):
+        assert self.dag_settings is not None
+        self._prepare_dag(
+            forceall=self.dag_settings.forceall,
+            ignore_incomplete=True,
+            lock_warn_only=False,
+        )
+        self.persistence.migrate_metadata(backend)
+
     def unlock(self):
         assert self.dag_settings is not None
         self._prepare_dag(
@@ -1216,13 +1227,55 @@ class Workflow(WorkflowExecutorInterface):
             rulegraph = simple_rulegraph()
             logger.info(None, extra=dict(event=LogEvent.RULEGRAPH, rulegraph=rulegraph))
 
-    def _build_dag(self):
+    def _build_dag(self, pipelined=False):
+        if pipelined:
+            # The DAG is expanded by the scheduler (see DAG.advance_expansion).
+            logger.info("Building DAG of jobs while executing ready jobs...")
+            async_run(self.dag.init(pipelined=True))
+            return
         logger.info("Building DAG of jobs...")
         async_run(self.dag.init())
         async_run(self.dag.update_checkpoint_dependencies())
 
         self.log_rulegraph()
 
+    def _can_pipeline_expansion(self, updated_files=None) -> bool:
+        """Return whether jobs may be executed while the DAG is still being
+        built (see --pipelined-expansion)."""
+        assert self.dag_settings is not None
+        if (
+            not self.dag_settings.pipelined_expansion
+            or self.exec_mode != ExecMode.DEFAULT
+            or updated_files is not None
+        ):
+            return False
+        unsupported = [
+            name
+            for name, used in (
+                ("dry-run", self.dryrun),
+                ("--touch", self.touch),
+                (
+                    "--immediate-submit",
+                    self.remote_execution_settings.immediate_submit,
+                ),
+                ("--dag-snapshot", self.dag_settings.dag_snapshot),
+                ("--until", self.dag_settings.until),
+                ("--omit-from", self.dag_settings.omit_from),
+                ("--batch", self.dag_settings.batch is not None),
+                ("--allowed-rules", self.dag_settings.allowed_rules),
+                ("--edit-notebook", self.execution_settings.edit_notebook),
+                ("checkpoints", any(rule.is_checkpoint for rule in self.rules)),
+            )
+            if used
+        ]
+        if unsupported:
+            logger.info(
+                "Pipelined DAG expansion is not supported together with "
+                f"{', '.join(unsupported)}. Building the DAG before execution."
+            )
+            return False
+        return True
+
     def execute(
         self,
         executor_plugin: ExecutorPlugin,
@@ -1270,23 +1323,31 @@ class Workflow(WorkflowExecutorInterface):
             lock_warn_only=self.dryrun,
             nolock=not self.execution_settings.lock,
             shadow_prefix=self.execution_settings.shadow_prefix,
+            fine_grained_locks=self.execution_settings.fine_grained_locks,
         )
 
         if self.exec_mode in [ExecMode.SUBPROCESS, ExecMode.REMOTE]:
             self.persistence.deactivate_cache()
 
-        self._build_dag()
+        pipelined = self._can_pipeline_expansion(updated_files)
+        self._build_dag(pipelined=pipelined)
 
         with self.persistence.lock():
-            async_run(self.dag.postprocess(update_needrun=False, check_initial=True))
-            if not self.dryrun:
-                # deactivate IOCache such that from now on we always get updated
-                # size, existence and mtime information
-                # ATTENTION: this may never be removed without really good reason.
-                # Otherwise weird things may happen.
-                self.iocache.deactivate()
-                # clear and deactivate persistence cache, from now on we want to see updates
-                self.persistence.deactivate_cache()
+            # With a pipelined expansion, the DAG is postprocessed and the caches
+            # are deactivated by the scheduler (see DAG.advance_expansion).
+            if not pipelined:
+                async_run(
+                    self.dag.postprocess(update_needrun=False, check_initial=True)
+                )
+                if not self.dryrun:
+                    # deactivate IOCache such that from now on we always get updated
+                    # size, existence and mtime information, unless it is kept valid
+                    # by watching the file system.
+                    # ATTENTION: this may never be removed without really good reason.
+                    # Otherwise weird things may happen.
+                    self.dag.release_iocache()
+                    # clear and deactivate persistence cache, from now on we want to see updates
+                    self.persistence.deactivate_cache()
 
             if self.remote_execution_settings.immediate_submit and any(
                 self.dag.checkpoint_jobs
@@ -1332,7 +1393,7 @@ class Workflow(WorkflowExecutorInterface):
                 and self.remote_execution_settings.job_deploy_sources
                 and not executor_plugin.common_settings.can_transfer_local_files
                 and not self.dryrun
-                and len(self.dag)
+                and (len(self.dag) or self.dag.is_expanding)
             )
             if should_deploy_sources:
                 # no shared FS, hence we have to upload the sources to the storage
@@ -1346,7 +1407,7 @@ class Workflow(WorkflowExecutorInterface):
             )
 
             if not self.dryrun:
-                if len(self.dag):
+                if len(self.dag) or self.dag.is_expanding:
                     from ismk.shell import shell
 
                     shell_exec = shell.get_executable()
@@ -1402,7 +1463,8 @@ class Workflow(WorkflowExecutorInterface):
                     ):
                         logger.info("Singularity containers: ignored")
 
-                    if self.exec_mode == ExecMode.DEFAULT:
+                    if self.exec_mode == ExecMode.DEFAULT and not self.dag.is_expanding:
+                        # otherwise logged once the DAG is complete
                         stats_msg, stats_dict = self.dag.stats()
                         logger.info(
                             stats_msg,
@@ -1433,6 +1495,13 @@ class Workflow(WorkflowExecutorInterface):
 
             has_checkpoint_jobs = any(self.dag.checkpoint_jobs)
 
+            if (
+                self.execution_settings.metadata_journal
+                and not self.dryrun
+                and self.exec_mode == ExecMode.DEFAULT
+            ):
+                self.persistence.open_journal()
+
             try:
                 success = self.scheduler.schedule()
             except Exception as e:
@@ -1442,6 +1511,12 @@ class Workflow(WorkflowExecutorInterface):
             finally:
                 if should_deploy_sources:
                     self.cleanup_source_archive()
+                # record directories modified by the jobs in the inventory
+                self.persistence.close_iocache()
+                self.persistence.close_journal()
+                if self.iocache.watcher is not None:
+                    # stop watching (see DAG.release_iocache)
+                    self.iocache.deactivate()
 
             if (
                 not self.remote_execution_settings.immediate_submit
@@ -0,0 +1,68 @@
+"""Benchmark the memory usage of the DAG edges.
+
+Usage: python tests/benchmarks/adjacency.py [--samples N]
+
+Adds the edges of a DAG with a diamond shaped pattern (split, three parts,
+merge) per sample to nested defaultdicts of sets, as used before, and to the
+AdjacencyStore, and reports the memory allocated for them. Jobs and files are
+allocated by the DAG anyway, hence they are not counted.
+"""
+
+import argparse
+from collections import defaultdict
+from functools import partial
+import gc
+import tracemalloc
+
+from ismk.adjacency import AdjacencyStore
+
+
+class Job:
+    # jobs are hashed by identity, like ismk.jobs.Job
+    def __init__(self, name):
+        self.name = name
+
+
+def diamonds(n):
+    edges = []
+    for i in range(n):
+        split = Job(f"split{i}")
+        parts = [Job(f"part{i}.{j}") for j in range(3)]
+        merge = Job(f"merge{i}")
+        for j, part in enumerate(parts):
+            edges.append((part, split, [f"split/{i}.{j}"]))
+            edges.append((merge, part, [f"part/{i}.{j}.txt", f"part/{i}.{j}.idx"]))
+    return edges
+
+
+def measure(edges, dependencies, depending):
+    gc.collect()
+    tracemalloc.start()
+    for job, dep, files in edges:
+        for f in files:
+            dependencies[job][dep].add(f)
+            depending[dep][job].add(f)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=20000)
+    args = parser.parse_args()
+
+    edges = diamonds(args.samples)
+    reference = measure(
+        edges,
+        defaultdict(partial(defaultdict, set)),
+        defaultdict(partial(defaultdict, set)),
+    )
+    print(f"{'nested defaultdicts':<24} {reference / 2**20:8.1f} MiB")
+    store = AdjacencyStore()
+    compact = measure(edges, store.forward, store.reverse)
+    print(f"{'adjacency store':<24} {compact / 2**20:8.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Benchmark the throughput of the supported checksum algorithms.
+
+Usage: python tests/benchmarks/checksums.py [--size MB] [--files N] [--dir DIR]
+
+Hashes a large file with each available algorithm (see --checksum-algorithm),
+compared to reading it in 4 KiB blocks as done before, and a number of such
+files concurrently with the ChecksumService. The file should be larger than the
+page cache to measure the throughput of cold reads.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+
+from ismk.io.checksums import CHECKSUM_ALGORITHMS, ChecksumService, hash_file
+
+
+def hash_file_4k(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(4096), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def report(name, nbytes, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<32} {nbytes / elapsed / 1e6:10.1f} MB/s {elapsed:8.3f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=1024, help="file size in MB")
+    parser.add_argument("--files", type=int, default=4, help="concurrently hashed")
+    parser.add_argument("--dir", default=None, help="directory for the test files")
+    args = parser.parse_args()
+
+    size = args.size * 1000 * 1000
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmpdir:
+        paths = [os.path.join(tmpdir, f"{i}.bin") for i in range(args.files)]
+        for path in paths:
+            with open(path, "wb") as f:
+                for _ in range(args.size):
+                    f.write(os.urandom(1000 * 1000))
+
+        report("sha256 (4 KiB blocks)", size, lambda: hash_file_4k(paths[0]))
+        for name, algorithm in CHECKSUM_ALGORITHMS.items():
+            report(name, size, lambda: hash_file(paths[0], algorithm))
+
+        for name, algorithm in CHECKSUM_ALGORITHMS.items():
+            # a new service each time, such that nothing is memoized
+            service = ChecksumService()
+            report(
+                f"{name} ({args.files} files, threads)",
+                size * args.files,
+                lambda: asyncio.run(service.checksums(paths, algorithm)),
+            )
+            service.close()
+
+
+if __name__ == "__main__":
+    main()
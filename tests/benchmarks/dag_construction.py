@@ -0,0 +1,108 @@
+"""Benchmark the time and memory needed to construct the DAG of jobs.
+
+Usage: python tests/benchmarks/dag_construction.py [--samples N] [--chroms M]
+
+Builds the DAG of a workflow that maps N samples against a reference and calls
+variants of each sample on M chromosomes (i.e. N * (M + 1) + 1 jobs), such that
+the reference and the mapped reads are input of many jobs. Reports the elapsed
+time, the peak and remaining memory allocated while building the DAG and the
+number of distinct file objects among all input and output files of the jobs.
+"""
+
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from ismk import api
+from ismk.settings.enums import Quietness
+from ismk.settings import types as settings
+from ismk.io import _IOFile
+
+SNAKEFILE = """
+SAMPLES = [f"s{{i}}" for i in range({samples})]
+CHROMS = [f"chr{{i}}" for i in range({chroms})]
+
+
+rule all:
+    input:
+        expand("calls/{{sample}}.{{chrom}}.vcf", sample=SAMPLES, chrom=CHROMS),
+
+
+rule map:
+    input:
+        ref="ref/genome.fa",
+        reads="reads/{{sample}}.fq",
+    output:
+        "mapped/{{sample}}.bam",
+    shell:
+        "touch {{output}}"
+
+
+rule call:
+    input:
+        ref="ref/genome.fa",
+        bam="mapped/{{sample}}.bam",
+    output:
+        "calls/{{sample}}.{{chrom}}.vcf",
+    log:
+        "logs/call/{{sample}}.{{chrom}}.log",
+    shell:
+        "touch {{output}} {{log}}"
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--chroms", type=int, default=25)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.makedirs(os.path.join(tmpdir, "ref"))
+        os.makedirs(os.path.join(tmpdir, "reads"))
+        Path(tmpdir, "ref", "genome.fa").touch()
+        for i in range(args.samples):
+            Path(tmpdir, "reads", f"s{i}.fq").touch()
+        snakefile = Path(tmpdir, "Snakefile")
+        snakefile.write_text(SNAKEFILE.format(samples=args.samples, chroms=args.chroms))
+
+        with api.SMKApi(settings.OutputSettings(quiet={Quietness.ALL})) as ismk_api:
+            workflow_api = ismk_api.workflow(
+                resource_settings=settings.ResourceSettings(cores=1),
+                snakefile=snakefile,
+                workdir=Path(tmpdir),
+            )
+            workflow_api.dag(dag_settings=settings.DAGSettings())
+            workflow = workflow_api._workflow
+            workflow._prepare_dag(
+                forceall=False, ignore_incomplete=True, lock_warn_only=True
+            )
+
+            gc.collect()
+            tracemalloc.start()
+            start = time.perf_counter()
+            workflow._build_dag()
+            elapsed = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            files = [
+                f
+                for job in workflow.dag.jobs
+                for f in (*job.input, *job.output, *job.log)
+                if isinstance(f, _IOFile)
+            ]
+            print(f"jobs:                  {len(workflow.dag.jobs):10}")
+            print(f"time:                  {elapsed:10.3f} s")
+            print(f"peak memory:           {peak / 1e6:10.1f} MB")
+            print(f"memory after building: {current / 1e6:10.1f} MB")
+            print(f"files of jobs:         {len(files):10}")
+            print(f"distinct file objects: {len(set(map(id, files))):10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Benchmark glob_wildcards on a directory tree with many unrelated files.
+
+Usage: python tests/benchmarks/glob_wildcards.py [--samples N] [--files M]
+       [--dir DIR] [--latency MS]
+
+Creates data/{sample}/reads/{lane}.fq.gz for N samples with 4 lanes each, next
+to M unrelated files per sample in data/{sample}/aligned/, and globs the
+pattern by walking the whole tree with os.walk (as done before), and with
+glob_wildcards, with and without constraints that allow to prune the tree and
+with cached listings. The tree should be on the file system of interest, e.g. a
+network file system, where listing directories has a high latency, or such a
+latency can be simulated with --latency.
+"""
+
+import argparse
+import os
+import re
+import tempfile
+import time
+
+from ismk.io import glob_wildcards, regex_from_filepattern
+
+PATTERN = "data/{sample}/reads/{lane}.fq.gz"
+
+
+def glob_os_walk(pattern):
+    regex = re.compile(regex_from_filepattern(pattern))
+    return [
+        f
+        for dirpath, dirnames, filenames in os.walk("data")
+        for f in filenames + dirnames
+        if regex.match(os.path.normpath(os.path.join(dirpath, f)))
+    ]
+
+
+def report(name, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<32} {elapsed:8.3f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=1000)
+    parser.add_argument("--files", type=int, default=200, help="unrelated files")
+    parser.add_argument("--dir", default=None, help="directory for the test tree")
+    parser.add_argument(
+        "--latency", type=float, default=0, help="simulated latency of listings in ms"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmpdir:
+        os.chdir(tmpdir)
+        for i in range(args.samples):
+            os.makedirs(f"data/s{i}/reads")
+            os.makedirs(f"data/s{i}/aligned/tmp")
+            for lane in range(4):
+                open(f"data/s{i}/reads/{lane}.fq.gz", "w").close()
+            for j in range(args.files):
+                open(f"data/s{i}/aligned/{j}.bam", "w").close()
+        # listings are only cached if they are not too recent
+        time.sleep(1)
+
+        if args.latency:
+            scandir = os.scandir
+
+            def slow_scandir(path):
+                time.sleep(args.latency / 1000)
+                return scandir(path)
+
+            os.scandir = slow_scandir
+
+        constrained = PATTERN.replace("{sample}", "{sample,[^/]+}").replace(
+            "{lane}", "{lane,[^/]+}"
+        )
+        report("os.walk", lambda: glob_os_walk(PATTERN))
+        report("unconstrained wildcards", lambda: glob_wildcards(PATTERN))
+        report("pruned", lambda: glob_wildcards(constrained))
+        report("pruned (cold cache)", lambda: glob_wildcards(constrained, cache=True))
+        report("pruned (warm cache)", lambda: glob_wildcards(constrained, cache=True))
+        os.chdir("/")
+
+
+if __name__ == "__main__":
+    main()
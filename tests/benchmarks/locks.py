@@ -0,0 +1,105 @@
+"""Benchmark taking and checking the locks of the working directory.
+
+Usage: python tests/benchmarks/locks.py [--files N] [--dir DIR]
+
+Writes a lock of N paths as a plain list (as done before) and as a manifest of
+path hashes (see persistence_locks), and checks another process' N paths (none
+of them locked, which is the common case) and 100 paths against it. Finally,
+it takes and releases the fine-grained locks (see --fine-grained-locks) of N
+jobs with one input and output each, 100 of which run at a time, and checks N
+paths against them from another process with classic locks. The directory
+should be on the file system of interest, e.g. a network file system.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from ismk.persistence_locks import (
+    FileLocks,
+    fine_grained_locked,
+    intersects,
+    path_hashes,
+    write_manifest,
+)
+
+
+def report(name, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<32} {elapsed:8.3f} s")
+    return result
+
+
+def write_list(path, files):
+    with open(path, "w") as lock:
+        print(*files, sep="\n", file=lock)
+
+
+def check_list(path, files):
+    files = set(files)
+    with open(path) as lock:
+        for f in lock:
+            if f.strip() in files:
+                return True
+    return False
+
+
+def write_hashes(path, files):
+    with open(path, "wb") as lock:
+        write_manifest(lock, path_hashes(files))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=1000000)
+    parser.add_argument("--dir", default=None, help="directory for the locks")
+    args = parser.parse_args()
+
+    locked = [f"results/sample{i}/calls/chr{i % 25}.vcf.gz" for i in range(args.files)]
+    files = [f"results/sample{i}/mapped.bam" for i in range(args.files)]
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmpdir:
+        path = os.path.join(tmpdir, "0.output.lock")
+        for name, write, check in [
+            ("list", write_list, check_list),
+            ("manifest", write_hashes, lambda path, files: intersects(path, files)),
+        ]:
+            report(f"{name}: write", lambda: write(path, locked))
+            print(f"{name}: size {os.path.getsize(path) / 1e6:21.1f} MB")
+            if name == "manifest":
+                # the own files are hashed once for all locks
+                many = report(f"{name}: hash files", lambda: path_hashes(files))
+                few = path_hashes(files[:100])
+            else:
+                many, few = files, files[:100]
+            assert not report(
+                f"{name}: check {args.files} files", lambda: check(path, many)
+            )
+            assert not report(f"{name}: check 100 files", lambda: check(path, few))
+
+        locks = FileLocks(os.path.join(tmpdir, "filelocks"))
+        locks.announce()
+        jobs = [
+            (path_hashes([f]), path_hashes([output]))
+            for f, output in zip(files, locked)
+        ]
+
+        def run_jobs():
+            for i, job in enumerate(jobs):
+                assert locks.acquire(*job)
+                if i >= 100:
+                    locks.release(*jobs[i - 100])
+
+        report(f"file locks: lock {args.files} jobs", run_jobs)
+        # another process reading the same inputs
+        assert not report(
+            f"file locks: check {args.files} files",
+            lambda: fine_grained_locked(locks.path, many, set()),
+        )
+        locks.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Benchmark the metadata backends (see --metadata-backend).
+
+Usage: python tests/benchmarks/metadata.py [--records N] [--dir DIR]
+       [--latency MS]
+
+Writes N metadata records of typical size with each backend, reads them one by
+one (as done before checking which jobs need to run), all at once (see
+Persistence.preload_metadata), and lists the incomplete markers (as done when
+starting a workflow). Finally, it finishes N jobs by writing their records and
+deleting their incomplete markers, directly and with the metadata journal (see
+--metadata-journal), whose entries are applied in the background. The
+directory should be on the file system of interest, e.g. a network file
+system, where creating and opening many small files is slow, or such a latency
+of opening a record file can be simulated with --latency.
+"""
+
+import argparse
+import json
+import tempfile
+import time
+
+from ismk.persistence_backends import (
+    INCOMPLETE,
+    METADATA,
+    METADATA_BACKENDS,
+    FileBackend,
+    MetadataJournal,
+    create_metadata_backend,
+)
+
+
+def record(i):
+    return json.dumps(
+        {
+            "version": None,
+            "code": "cp {input} {output}",
+            "rule": "map",
+            "input": [f"reads/s{i}.fq", "ref/genome.fa"],
+            "log": [f"logs/map/s{i}.log"],
+            "params": [],
+            "shellcmd": f"cp reads/s{i}.fq mapped/s{i}.bam",
+            "incomplete": False,
+            "starttime": 1700000000.0,
+            "endtime": 1700000001.0,
+            "job_hash": 1234567890,
+            "conda_env": None,
+            "software_stack_hash": "d41d8cd98f00b204e9800998ecf8427e",
+            "container_img_url": None,
+            "input_checksums": {},
+        }
+    )
+
+
+def report(name, n, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<32} {n / elapsed:10.0f} records/s {elapsed:8.3f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--dir", default=None, help="directory for the records")
+    parser.add_argument(
+        "--latency", type=float, default=0, help="simulated latency of reads in ms"
+    )
+    args = parser.parse_args()
+
+    if args.latency:
+        read = FileBackend.read
+
+        def slow_read(self, subject, key):
+            time.sleep(args.latency / 1000)
+            return read(self, subject, key)
+
+        FileBackend.read = slow_read
+
+    keys = [f"mapped/s{i}.bam" for i in range(args.records)]
+    records = [(key, record(i), None) for i, key in enumerate(keys)]
+    for name in METADATA_BACKENDS:
+        with tempfile.TemporaryDirectory(dir=args.dir) as tmpdir:
+            backend = create_metadata_backend(tmpdir, name)
+            n = args.records
+            report(
+                f"{name}: write",
+                n,
+                lambda: backend.write_many(METADATA, records),
+            )
+            report(
+                f"{name}: read one by one",
+                n,
+                lambda: [backend.read(METADATA, key) for key in keys],
+            )
+            report(f"{name}: read all", n, lambda: backend.read_many(METADATA, keys))
+            report(
+                f"{name}: read all (8 threads)",
+                n,
+                lambda: backend.read_many(METADATA, keys, n_threads=8),
+            )
+            for key in keys[: n // 100]:
+                backend.write(INCOMPLETE, key, "{}")
+            report(
+                f"{name}: list incomplete",
+                n // 100,
+                lambda: list(backend.keys(INCOMPLETE)),
+            )
+
+            # finishing jobs: store the record, then delete the incomplete marker
+            def finish():
+                for key, value, _ in records:
+                    backend.write(METADATA, key, value)
+                    backend.delete(INCOMPLETE, key)
+
+            backend.write_many(INCOMPLETE, [(key, "{}", None) for key in keys])
+            report(f"{name}: finish", n, finish)
+
+            def finish_journal():
+                for key, value, _ in records:
+                    journal.append([(key, value)], [key])
+
+            backend.write_many(INCOMPLETE, [(key, "{}", None) for key in keys])
+            journal = MetadataJournal(backend, tmpdir)
+            report(f"{name}: finish (journal)", n, finish_journal)
+            report(f"{name}: apply journal", n, journal.close)
+            backend.close()
+
+
+if __name__ == "__main__":
+    main()
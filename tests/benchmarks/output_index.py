@@ -0,0 +1,94 @@
+"""Benchmark finding the producers of a file among the rules of a workflow.
+
+Usage: python tests/benchmarks/output_index.py [--rules N] [--samples N]
+
+Compares the combined matcher of the OutputIndex with the previous approach
+of looking up candidate rules by the constant prefix of their outputs,
+filtering them by suffix and checking each candidate via Rule.is_producer and
+Rule.get_wildcards. There are N rules whose outputs only differ in their
+suffix, and N rules that match the outputs of all others.
+"""
+
+import argparse
+import time
+
+from ismk.common.prefix_lookup import PrefixLookup
+from ismk.io import IOFile, OutputFiles
+from ismk.output_index import OutputIndex
+from ismk.rules import Rule
+
+
+def make_rule(name, *patterns):
+    rule = Rule(name, None, lineno=1, snakefile="Snakefile")
+    rule._output = OutputFiles(map(IOFile, patterns))
+    for item in rule.output:
+        rule.register_wildcards(item)
+    return rule
+
+
+def report(name, n, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<24} {n / elapsed:10.0f} files/s {elapsed:8.3f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rules", type=int, default=50)
+    parser.add_argument("--samples", type=int, default=20)
+    args = parser.parse_args()
+
+    rules = [
+        make_rule(
+            f"step{i}",
+            f"results/{{sample}}/{{unit}}.step{i}.txt",
+            f"results/{{sample}}/{{unit}}.step{i}.idx",
+        )
+        for i in range(args.rules)
+    ] + [
+        make_rule(f"any{i}", f"results/{{sample}}/{{name}}.{i}.txt")
+        for i in range(args.rules)
+    ]
+    targets = [
+        f"results/sample{j}/unit{j % 3}.step{i}.txt"
+        for i in range(args.rules)
+        for j in range(args.samples)
+    ]
+
+    lookup = PrefixLookup(
+        entries=[
+            (str(product.constant_prefix()), (rule, str(product.constant_suffix())))
+            for rule in rules
+            for product in rule.products()
+        ]
+    )
+
+    def per_rule(target):
+        candidates = {
+            rule
+            for _, (rule, suffix) in lookup.match_iter(target)
+            if target.endswith(suffix)
+        }
+        return {
+            rule: rule.get_wildcards(target)
+            for rule in candidates
+            if rule.is_producer(target)
+        }
+
+    output_index = OutputIndex(rules)
+    report(
+        "per rule matching",
+        len(targets),
+        lambda: [per_rule(target) for target in targets],
+    )
+    # unmemoized, as for files that are requested once
+    report(
+        "combined matching",
+        len(targets),
+        lambda: [output_index._match_wildcards(target) for target in targets],
+    )
+
+
+if __name__ == "__main__":
+    main()
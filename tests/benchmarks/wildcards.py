@@ -0,0 +1,102 @@
+"""Benchmark applying wildcards to file patterns and expand().
+
+Usage: python tests/benchmarks/wildcards.py [--n N]
+
+Compares applying wildcards with a regular expression substitution per call,
+as done before, to the precompiled WildcardTemplate, and expand() with
+string.Formatter, as done before, to expand() with precompiled patterns. For
+expand(..., lazy=True), reports the memory of the result and membership checks.
+"""
+
+import argparse
+import string
+import time
+import tracemalloc
+from itertools import product
+
+from ismk.io import WILDCARD_REGEX, WildcardTemplate, expand
+
+PATTERN = "results/{sample}/{unit,[^/]+}/calls.{chrom}.vcf"
+
+
+def apply_wildcards_regex(pattern, wildcards):
+    def format_match(match):
+        return str(wildcards[match.group("name")])
+
+    return WILDCARD_REGEX.sub(format_match, pattern)
+
+
+def expand_formatter(pattern, **wildcards):
+    formatter = string.Formatter()
+    return [
+        formatter.vformat(pattern, (), dict(comb))
+        for comb in product(
+            *(
+                [(wildcard, value) for value in values]
+                for wildcard, values in wildcards.items()
+            )
+        )
+    ]
+
+
+def report(name, n, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<32} {n / elapsed / 1e6:8.2f} M paths/s {elapsed:8.3f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n", type=int, default=1000000, help="number of paths")
+    args = parser.parse_args()
+
+    wildcards = [
+        dict(sample=f"sample{i}", unit=f"lane{i % 4}", chrom=f"chr{i % 25}")
+        for i in range(args.n)
+    ]
+    report(
+        "apply_wildcards (regex)",
+        args.n,
+        lambda: [apply_wildcards_regex(PATTERN, w) for w in wildcards],
+    )
+    template = WildcardTemplate(PATTERN)
+    report(
+        "apply_wildcards (template)",
+        args.n,
+        lambda: list(map(template.apply, wildcards)),
+    )
+
+    pattern = "results/{sample}/{unit}/calls.{chrom}.vcf"
+    samples = [f"sample{i}" for i in range(args.n // 100)]
+    units = [f"lane{i}" for i in range(4)]
+    chroms = [f"chr{i}" for i in range(25)]
+    report(
+        "expand (string.Formatter)",
+        args.n,
+        lambda: expand_formatter(pattern, sample=samples, unit=units, chrom=chroms),
+    )
+    report(
+        "expand",
+        args.n,
+        lambda: expand(pattern, sample=samples, unit=units, chrom=chroms),
+    )
+
+    for lazy in (False, True):
+        tracemalloc.start()
+        paths = expand(pattern, sample=samples, unit=units, chrom=chroms, lazy=lazy)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"expand (lazy={lazy}) memory {memory / 1e6:20.1f} MB")
+    queries = [
+        f"results/sample{i}/lane{i % 4}/calls.chr{i % 25}.vcf" for i in range(10000)
+    ]
+    report(
+        "expand (lazy=True) membership",
+        len(queries),
+        lambda: [query in paths for query in queries],
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -185,6 +185,12 @@ def run(
     omit_from=frozenset(),
     forcerun=frozenset(),
     trust_io_cache=False,
+    watch_io_cache=False,
+    max_expansion_concurrency=1,
+    dag_snapshot=False,
+    pipelined_expansion=False,
+    checksum_algorithm="sha256",
+    metadata_backend=None,
     conda_list_envs=False,
     conda_create_envs=False,
     conda_prefix=None,
@@ -216,6 +222,9 @@ def run(
     forceall=False,
     all_temp=False,
     cleanup_metadata=None,
+    migrate_metadata=None,
+    metadata_journal=False,
+    fine_grained_locks=False,
     rerun_triggers=settings.RerunTrigger.all(),
     storage_provider_settings=None,
     shared_fs_usage=None,
@@ -382,6 +391,12 @@ def run(
                         forceall=forceall,
                         rerun_triggers=rerun_triggers,
                         trust_io_cache=trust_io_cache,
+                        watch_io_cache=watch_io_cache,
+                        max_expansion_concurrency=max_expansion_concurrency,
+                        dag_snapshot=dag_snapshot,
+                        checksum_algorithm=checksum_algorithm,
+                        metadata_backend=metadata_backend,
+                        pipelined_expansion=pipelined_expansion,
                     ),
                 )
 
@@ -413,6 +428,8 @@ def run(
                     dag_api.containerize()
                 elif cleanup_metadata:
                     dag_api.cleanup_metadata(cleanup_metadata)
+                elif migrate_metadata:
+                    dag_api.migrate_metadata(migrate_metadata)
                 else:
                     dag_api.execute_workflow(
                         executor=executor,
@@ -421,6 +438,8 @@ def run(
                             shadow_prefix=shadow_prefix,
                             retries=retries,
                             edit_notebook=edit_notebook,
+                            metadata_journal=metadata_journal,
+                            fine_grained_locks=fine_grained_locks,
                         ),
                         remote_execution_settings=settings.RemoteExecutionSettings(
                             container_image=container_image,
@@ -0,0 +1,179 @@
+from collections import defaultdict
+from functools import partial
+
+import pytest
+
+from ismk.adjacency import AdjacencyStore
+
+
+class Job:
+    # jobs are hashed by identity, like ismk.jobs.Job
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+
+def add_edge(dependencies, depending, job, dep, files):
+    for f in files:
+        dependencies[job][dep].add(f)
+        depending[dep][job].add(f)
+
+
+def test_defaultdict_semantics():
+    store = AdjacencyStore()
+    dependencies, depending = store.forward, store.reverse
+    a, b, c = Job("a"), Job("b"), Job("c")
+
+    assert a not in dependencies
+    dependencies[a]
+    assert a in dependencies
+    assert a not in depending
+    assert dependencies.get(b) is None
+    assert b not in dependencies
+
+    add_edge(dependencies, depending, a, b, ["x", "y"])
+    add_edge(dependencies, depending, a, c, ["z"])
+    assert list(dependencies) == [a]
+    assert list(dependencies[a]) == [b, c]
+    assert dict(dependencies[a].items()) == {b: {"x", "y"}, c: {"z"}}
+    assert set(depending[b][a]) == {"x", "y"}
+    assert "x" in dependencies[a][b]
+    assert not dependencies[a][b].isdisjoint({"y", "w"})
+    assert len(dependencies) == 1
+    assert len(depending) == 2
+
+    dependencies[a][b].add("x")
+    assert len(dependencies[a][b]) == 2
+    dependencies[a][b].discard("x")
+    assert set(dependencies[a][b]) == {"y"}
+    assert set(depending[b][a]) == {"x", "y"}
+
+
+def test_delete():
+    store = AdjacencyStore()
+    dependencies, depending = store.forward, store.reverse
+    a, b = Job("a"), Job("b")
+    add_edge(dependencies, depending, a, b, ["x"])
+
+    del depending[b][a]
+    del depending[b]
+    assert b not in depending
+    assert list(dependencies[a]) == [b]
+    with pytest.raises(KeyError):
+        del depending[b]
+
+    del dependencies[a]
+    assert len(dependencies) == 0
+    assert not store._ids
+
+    # re-inserted jobs are appended
+    dependencies[b]
+    dependencies[a]
+    assert list(dependencies) == [b, a]
+
+
+def test_reuse_ids():
+    store = AdjacencyStore()
+    dependencies, depending = store.forward, store.reverse
+    a = Job("a")
+    dependencies[a]
+    for i in range(100):
+        # e.g. jobs replaced after a checkpoint has been executed
+        b = Job(f"b{i}")
+        add_edge(dependencies, depending, a, b, ["x"])
+        del dependencies[a][b]
+        del depending[b]
+    assert len(store._jobs) == 2
+
+    c = Job("c")
+    add_edge(dependencies, depending, c, a, ["y"])
+    assert list(dependencies) == [a, c]
+    assert list(depending) == [a]
+
+
+def test_shared_edge_files():
+    store = AdjacencyStore()
+    dependencies, depending = store.forward, store.reverse
+    a, b = Job("a"), Job("b")
+    add_edge(dependencies, depending, a, b, ["x", "y", "z"])
+    ida, idb = store._ids[a], store._ids[b]
+    assert dependencies._adjacency[ida][idb] is depending._adjacency[idb][ida]
+
+
+def test_large_edge():
+    """Scatter/gather steps carry thousands of files on a single edge, which
+    are held in a set instead of a tuple that is copied for each file."""
+    store = AdjacencyStore()
+    dependencies, depending = store.forward, store.reverse
+    a, b, c = Job("a"), Job("b"), Job("c")
+    files = [f"chunk/{i}.txt" for i in range(5000)]
+
+    add_edge(dependencies, depending, a, b, files)
+    ida, idb = store._ids[a], store._ids[b]
+    assert type(dependencies._adjacency[ida][idb]) is set
+    assert set(dependencies[a][b]) == set(files)
+    assert len(depending[b][a]) == len(files)
+
+    dependencies[c][b].update(files)
+    depending[b][c].update(files)
+    idc = store._ids[c]
+    assert type(dependencies._adjacency[idc][idb]) is frozenset
+    assert dependencies._adjacency[idc][idb] is depending._adjacency[idb][idc]
+    assert set(depending[b][c]) == set(files)
+
+    dependencies[c][b].discard(files[0])
+    dependencies[c][b].add("extra.txt")
+    assert len(dependencies[c][b]) == len(files)
+    assert files[0] not in dependencies[c][b]
+    assert files[0] in depending[b][c]
+
+
+def test_version():
+    store = AdjacencyStore()
+    dependencies, depending = store.forward, store.reverse
+    a, b = Job("a"), Job("b")
+
+    version = store.version
+    add_edge(dependencies, depending, a, b, ["x"])
+    assert store.version > version
+
+    # adding files to existing edges does not change the topology
+    version = store.version
+    add_edge(dependencies, depending, a, b, ["y"])
+    dependencies[a]
+    assert store.version == version
+
+    del dependencies[a][b]
+    assert store.version > version
+
+
+def test_diamonds():
+    """The store holds the same edges as nested defaultdicts of sets on a DAG
+    with a diamond shaped pattern per sample (see benchmarks/adjacency.py for
+    their memory usage)."""
+    reference = (
+        defaultdict(partial(defaultdict, set)),
+        defaultdict(partial(defaultdict, set)),
+    )
+    store = AdjacencyStore()
+    for i in range(10):
+        split = Job(f"split{i}")
+        parts = [Job(f"part{i}.{j}") for j in range(3)]
+        merge = Job(f"merge{i}")
+        for j, part in enumerate(parts):
+            for dependencies, depending in (reference, (store.forward, store.reverse)):
+                add_edge(dependencies, depending, part, split, [f"split/{i}.{j}"])
+                add_edge(
+                    dependencies,
+                    depending,
+                    merge,
+                    part,
+                    [f"part/{i}.{j}.txt", f"part/{i}.{j}.idx"],
+                )
+
+    for expected, adjacency in zip(reference, (store.forward, store.reverse)):
+        assert set(adjacency) == set(expected)
+        for job, edges in expected.items():
+            assert {dep: set(files) for dep, files in adjacency[job].items()} == edges
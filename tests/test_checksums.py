@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+import ismk.io.checksums
+from ismk.exceptions import WorkflowError
+from ismk.io.checksums import (
+    CHECKSUM_ALGORITHMS,
+    ChecksumService,
+    ChecksumStore,
+    get_checksum_algorithm,
+    hash_file,
+)
+
+
+@pytest.fixture
+def data(tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_bytes(b"0123456789" * 1000)
+    # not modified recently, hence checksums may be memoized
+    os.utime(path, (1, 1))
+    return str(path)
+
+
+def counting(monkeypatch):
+    calls = []
+
+    def hash_file_(path, *args):
+        calls.append(path)
+        return hash_file(path, *args)
+
+    monkeypatch.setattr(ismk.io.checksums, "hash_file", hash_file_)
+    return calls
+
+
+def test_hash_file(data):
+    expected = hashlib.sha256(b"0123456789" * 1000).hexdigest()
+    assert hash_file(data, chunksize=7) == expected
+    assert (
+        hash_file(data, algorithm=hashlib.md5)
+        == hashlib.md5(b"0123456789" * 1000).hexdigest()
+    )
+
+
+def test_memoized(data, monkeypatch):
+    calls = counting(monkeypatch)
+    service = ChecksumService(n_threads=2)
+    checksums = asyncio.run(service.checksums([data] * 3))
+    assert len(set(checksums)) == 1
+    asyncio.run(service.checksum(data))
+    assert 1 <= len(calls) <= 3
+
+    # modification invalidates the memoized checksum
+    with open(data, "ab") as f:
+        f.write(b"x")
+    os.utime(data, (2, 2))
+    n = len(calls)
+    assert asyncio.run(service.checksum(data)) != checksums[0]
+    assert len(calls) == n + 1
+    service.close()
+
+
+def test_recently_modified_not_memoized(data, monkeypatch):
+    calls = counting(monkeypatch)
+    os.utime(data)
+    service = ChecksumService()
+    asyncio.run(service.checksum(data))
+    asyncio.run(service.checksum(data))
+    assert len(calls) == 2
+    service.close()
+
+
+def test_persistent(data, tmp_path, monkeypatch):
+    store_path = str(tmp_path / "checksums.sqlite")
+    service = ChecksumService(store=ChecksumStore(store_path))
+    checksum = asyncio.run(service.checksum(data))
+    service.close()
+
+    calls = counting(monkeypatch)
+    service = ChecksumService(store=ChecksumStore(store_path))
+    assert asyncio.run(service.checksum(data)) == checksum
+    # other algorithms are not mixed up
+    assert asyncio.run(service.checksum(data, algorithm=hashlib.md5)) != checksum
+    assert calls == [data]
+    service.close()
+
+
+def test_empty(tmp_path):
+    path = tmp_path / "empty.txt"
+    path.touch()
+    service = ChecksumService()
+    assert asyncio.run(service.checksum(str(path))) == hashlib.sha256().hexdigest()
+
+
+def test_checksum_algorithms(data):
+    for name in CHECKSUM_ALGORITHMS:
+        assert hash_file(data, get_checksum_algorithm(name))
+    with pytest.raises(WorkflowError):
+        get_checksum_algorithm("md4")
+
+
+def test_cache_hash_prefix(data):
+    from ismk.caching.hash import hash_file as cache_hash_file
+
+    assert cache_hash_file(data) == hash_file(data)
+    assert cache_hash_file(data, "blake2b") == "blake2b:" + hash_file(
+        data, hashlib.blake2b
+    )
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from ismk.dag_expansion import ExpansionStack, FrameReturn
+
+
+async def fib(n, calls):
+    calls.append(n)
+    if n < 2:
+        yield FrameReturn(n)
+        return
+    a = yield fib(n - 1, calls)
+    b = yield fib(n - 2, calls)
+    yield FrameReturn(a + b)
+
+
+async def fail(n):
+    if n == 0:
+        raise ValueError("bottom")
+    try:
+        yield fail(n - 1)
+    except ValueError as e:
+        raise ValueError(f"{e} < {n}")
+
+
+def test_advance():
+    calls = []
+    stack = ExpansionStack(fib(10, calls))
+    asyncio.run(stack.advance())
+    assert stack.done
+    assert stack.result() == 55
+    assert len(calls) == 177
+
+
+def test_advance_with_pause():
+    calls = []
+    stack = ExpansionStack(fib(10, calls))
+    steps = 0
+    with asyncio.Runner() as runner:
+        while not stack.done:
+            n = len(calls)
+            # pause after every step
+            runner.run(stack.advance(pause=lambda: True))
+            assert len(calls) <= n + 1
+            steps += 1
+    assert stack.result() == 55
+    assert len(calls) == 177
+    assert steps > 177
+
+
+def test_error():
+    stack = ExpansionStack(fail(3))
+    asyncio.run(stack.advance())
+    with pytest.raises(ValueError, match="bottom < 1 < 2 < 3"):
+        stack.result()
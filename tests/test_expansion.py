@@ -0,0 +1,66 @@
+import pytest
+
+import ismk.io.expansion
+from ismk.exceptions import WildcardError
+from ismk.io import expand
+from ismk.io.expansion import Expansion
+
+CASES = [
+    (("{sample}/{unit}.txt",), dict(sample=["a", "b", "c"], unit=[1, 2])),
+    # wildcards repeated and in another order than given
+    (("{unit}/{sample}.{unit}",), dict(sample=["a", "b"], unit=[1, 2])),
+    (("{sample}/{unit}.txt", zip), dict(sample=["a", "b", "c"], unit=[1, 2, 3])),
+    # ambiguous splits and empty values
+    ((["{x}{y}", "y{y}"],), dict(x=["1", "11"], y=["1", "", "2"])),
+    (("{x}{y}", zip), dict(x=["1", "11"], y=["11", "1"])),
+    (("100%/{x}/{{y}}",), dict(x=["a", "b"])),
+    (("{x}/{y}",), dict(x=["a", "b"], allow_missing=True)),
+    (("plain.txt",), dict()),
+    # not supported by ExpandedPattern, expanded eagerly
+    (("{x:>3}/{x!r}",), dict(x=["a", "b"])),
+]
+
+
+@pytest.mark.parametrize("args,wildcards", CASES)
+def test_lazy(args, wildcards):
+    paths = expand(*args, **wildcards)
+    lazy = expand(*args, lazy=True, **wildcards)
+    assert isinstance(lazy, Expansion)
+    assert list(lazy) == paths
+    assert len(lazy) == len(paths)
+    assert [lazy[i] for i in range(-len(paths), len(paths))] == paths + paths
+    assert lazy[1:] == paths[1:]
+    for path in paths:
+        assert path in lazy
+    with pytest.raises(IndexError):
+        lazy[len(paths)]
+
+
+def test_contains():
+    lazy = expand("{x}{y}", zip, x=["1", "11"], y=["11", "1"], lazy=True)
+    assert "111" in lazy
+    assert "1111" not in lazy
+    assert "11" not in lazy
+    lazy = expand("{x}/{y}.{x}", x=["a", "b"], y=["c"], lazy=True)
+    assert "a/c.a" in lazy
+    assert "a/c.b" not in lazy
+    assert "a/d.a" not in lazy
+
+
+def test_missing():
+    with pytest.raises(WildcardError):
+        expand("{x}/{y}", x=["a"], lazy=True)
+    assert len(expand("{x}/{y}", x=[], lazy=True)) == 0
+
+
+def test_lazy_wildcard():
+    assert expand("{lazy}.txt", lazy=True) == ["True.txt"]
+
+
+@pytest.mark.parametrize("args,wildcards", CASES[:5])
+def test_numpy(args, wildcards, monkeypatch):
+    pytest.importorskip("numpy")
+    paths = expand(*args, **wildcards)
+    monkeypatch.setattr(ismk.io.expansion, "NUMPY_THRESHOLD", 1)
+    monkeypatch.setattr(ismk.io.expansion, "NUMPY_CHUNKSIZE", 4)
+    assert expand(*args, **wildcards) == paths
@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+from ismk.common import ON_WINDOWS
+from ismk.interfaces.storage_plugins.io import Mtime
+from ismk.io import IOCache
+import ismk.io.inventory
+from ismk.io.inventory import InventoryStore
+from ismk.io.stat_engine import local_mtime
+
+
+@pytest.fixture(autouse=True)
+def no_racy_interval(monkeypatch):
+    # files are modified right before they are recorded in these tests
+    monkeypatch.setattr(ismk.io.inventory, "RACY_INTERVAL", -1)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data")
+    for name in ["a.txt", "b.txt"]:
+        with open(os.path.join("data", name), "w") as f:
+            f.write(name)
+    return tmp_path
+
+
+def inventory_cache():
+    cache = IOCache(max_wait_time=10)
+    for path in ["data/a.txt", "data/b.txt"]:
+        cache.exists_local[path] = True
+        cache.mtime[path] = Mtime(local=local_mtime(path)[0])
+        cache.size[path] = os.path.getsize(path)
+    cache.exists_local["data/missing.txt"] = False
+    return cache
+
+
+def load(trust_mtime=False):
+    cache = IOCache(max_wait_time=10)
+    store = InventoryStore(".ismk-inventory.sqlite")
+    n = store.load(cache, trust_mtime=trust_mtime)
+    store.close()
+    return n, cache
+
+
+def test_record_and_load(workdir):
+    store = InventoryStore(".ismk-inventory.sqlite")
+    store.record(inventory_cache())
+    store.close()
+
+    n, cache = load()
+    assert n == 3
+    assert cache.exists_local["data/a.txt"]
+    assert not cache.exists_local["data/missing.txt"]
+    # mtimes are only reused if trusted
+    assert not cache.mtime
+
+    _, cache = load(trust_mtime=True)
+    assert cache.mtime["data/a.txt"].local() == local_mtime("data/a.txt")[0]
+    assert cache.size["data/b.txt"] == 5
+
+
+def test_modified_directory(workdir):
+    store = InventoryStore(".ismk-inventory.sqlite")
+    store.record(inventory_cache())
+    store.close()
+
+    with open("data/missing.txt", "w") as f:
+        f.write("created")
+    # ensure that the mtime of the directory differs
+    os.utime("data", ns=(0, 0))
+    n, cache = load()
+    assert n == 0
+    assert "data/missing.txt" not in cache.exists_local
+
+
+@pytest.mark.skipif(ON_WINDOWS, reason="symlinks")
+def test_symlinks_not_recorded(workdir):
+    os.symlink("a.txt", "data/link.txt")
+    cache = inventory_cache()
+    cache.exists_local["data/link.txt"] = True
+    store = InventoryStore(".ismk-inventory.sqlite")
+    store.record(cache)
+    store.close()
+
+    n, cache = load()
+    assert n == 3
+    assert "data/link.txt" not in cache.exists_local
+
+
+def test_update_and_flush(workdir):
+    store = InventoryStore(".ismk-inventory.sqlite")
+    store.record(inventory_cache())
+
+    # a job creates missing.txt
+    with open("data/missing.txt", "w") as f:
+        f.write("created")
+    os.utime("data", ns=(0, 0))
+    store.update(["data/missing.txt"])
+    # the update is only written by the flush
+    row = store._connect().execute(
+        "SELECT present FROM files WHERE path = 'data/missing.txt'"
+    )
+    assert row.fetchone() == (0,)
+    store.flush()
+    store.close()
+
+    n, cache = load(trust_mtime=True)
+    assert n == 3
+    assert cache.exists_local["data/missing.txt"]
+    assert cache.mtime["data/missing.txt"].local() == local_mtime("data/missing.txt")[0]
+    assert cache.size["data/missing.txt"] == 7
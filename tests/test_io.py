@@ -1,6 +1,23 @@
+import asyncio
+import os
+import sys
+import threading
+import time
 from pathlib import PosixPath
-
-from ismk.io import WILDCARD_REGEX, expand
+from types import SimpleNamespace
+
+import pytest
+
+from ismk.io import (
+    WILDCARD_REGEX,
+    IOCache,
+    IOFile,
+    _missing_locally,
+    apply_wildcards,
+    expand,
+    temp,
+    wait_for_files,
+)
 from ismk.exceptions import WildcardError
 
 
@@ -105,3 +122,99 @@ def test_expand():
 
     # expand on pathlib.Path objects
     assert expand(PosixPath() / "{x}" / "{y}", x="Hello", y="world") == ["Hello/world"]
+
+
+def test_apply_wildcards():
+    pattern = "{a}/100%/{b,[0-9]{2}}.{a}.txt"
+    assert apply_wildcards(pattern, dict(a="x", b=10)) == "x/100%/10.x.txt"
+    assert apply_wildcards("100%.txt", dict()) == "100%.txt"
+    with pytest.raises(WildcardError):
+        apply_wildcards(pattern, dict(a="x"))
+
+
+def test_apply_wildcards_interned():
+    rule = SimpleNamespace(pathvars=None, wildcard_names={"sample", "chrom"})
+    ref = IOFile(temp("ref/genome.fa"), rule=rule)
+    bam = IOFile("mapped/{sample}.bam", rule=rule)
+    vcf = IOFile("calls/{sample}.{chrom}.vcf", rule=rule)
+
+    wildcards = [dict(sample="a", chrom="1"), dict(sample="a", chrom="2")]
+    refs = [ref.apply_wildcards(w) for w in wildcards]
+    assert refs[0] is refs[1]
+    assert refs[0].is_temp and refs[0].rule is rule
+    bams = [bam.apply_wildcards(w) for w in wildcards]
+    assert bams[0] is bams[1] and bams[0] == "mapped/a.bam"
+    # files containing all wildcards of the rule are distinct for each job
+    vcfs = [vcf.apply_wildcards(w) for w in wildcards]
+    assert vcfs == ["calls/a.1.vcf", "calls/a.2.vcf"]
+    assert vcf.apply_wildcards(wildcards[0]) is not vcfs[0]
+
+    # e.g. patterns returned by input functions are not interned
+    once = IOFile("ref/genome.fa", rule=rule)
+    first, second = [once.apply_wildcards(w, intern=False) for w in wildcards]
+    assert first == second == "ref/genome.fa" and first is not second
+    assert once._interned is None
+
+
+def test_iocache_exclude():
+    cache = IOCache(max_wait_time=10)
+    committed, other = IOFile("results/a.txt"), IOFile("results/b.txt")
+    for f in (committed, other):
+        cache.exists_local[f] = False
+    cache.exclude([committed])
+    # the committed job may create its output at any time
+    assert not cache.caches(committed)
+    assert committed not in cache.exists_local
+    assert cache.caches(other) and other in cache.exists_local
+    cache.clear()
+    assert not cache.caches(committed)
+    cache.deactivate()
+    cache.active = True
+    assert cache.caches(committed)
+
+
+@pytest.mark.parametrize("notify", [False, True])
+def test_wait_for_files(tmp_path, monkeypatch, notify):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("a")
+    for i in range(5):
+        open(f"a/{i}.txt", "w").close()
+    os.symlink("0.txt", "a/link.txt")
+    os.symlink("missing.txt", "a/dangling.txt")
+    paths = [f"a/{i}.txt" for i in range(5)] + ["a/link.txt", "a", "./a/"]
+    assert _missing_locally(paths + ["a/dangling.txt", "b/0.txt"]) == [
+        "a/dangling.txt",
+        "b/0.txt",
+    ]
+
+    async def wait():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        start = time.monotonic()
+        await wait_for_files(paths + ["b/c/0.txt"], latency_wait=10, notify=notify)
+        ticker.cancel()
+        return time.monotonic() - start, ticks
+
+    def create():
+        time.sleep(0.2)
+        os.makedirs("b/c")
+        open("b/c/0.txt", "w").close()
+
+    creator = threading.Thread(target=create)
+    creator.start()
+    elapsed, ticks = asyncio.run(wait())
+    creator.join()
+    # the event loop has not been blocked while waiting
+    assert ticks >= 10
+    if notify and sys.platform.startswith("linux"):
+        assert elapsed < 0.9
+
+    with pytest.raises(IOError, match="b/1.txt"):
+        asyncio.run(wait_for_files(paths + ["b/1.txt"], latency_wait=0))
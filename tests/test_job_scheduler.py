@@ -0,0 +1,46 @@
+import sys
+import threading
+from types import SimpleNamespace
+
+from ismk.scheduling.job_scheduler import JobScheduler
+
+
+def make_scheduler(cores):
+    scheduler = JobScheduler.__new__(JobScheduler)
+    scheduler.global_resources = {"_cores": cores, "_job_count": sys.maxsize}
+    scheduler.resources = dict(scheduler.global_resources)
+    scheduler.job_rate_limiter = None
+    scheduler._lock = threading.Lock()
+    scheduler._input_sizes = {}
+    scheduler._validated_jobs = set()
+    scheduler.running = set()
+    scheduler.workflow = SimpleNamespace(
+        dag=SimpleNamespace(needrun_jobs=lambda: [], finished=lambda job: False)
+    )
+    # select every job, the resources are accounted by the scheduler
+    scheduler.job_selector_greedy = lambda jobs, *args: list(jobs)
+    scheduler._job_selector = scheduler.job_selector_greedy
+    return scheduler
+
+
+class Job:
+    # jobs are hashed by identity, like ismk.jobs.Job
+    def __init__(self, threads):
+        self.input = []
+        self.scheduler_resources = {"_cores": threads, "_job_count": 1}
+
+
+def test_single_job_resources():
+    scheduler = make_scheduler(cores=4)
+    # jobs becoming ready one after another
+    assert len(scheduler.job_selector([Job(3)])) == 1
+    assert scheduler.resources["_cores"] == 1
+    scheduler.job_selector([Job(1)])
+    assert scheduler.resources["_cores"] == 0
+    assert scheduler.job_selector([Job(1)]) == []
+
+
+def test_multiple_jobs_resources():
+    scheduler = make_scheduler(cores=4)
+    scheduler.job_selector([Job(1), Job(2)])
+    assert scheduler.resources["_cores"] == 1
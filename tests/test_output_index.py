@@ -2,7 +2,10 @@ from unittest.mock import Mock
 
 import pytest
 
+from ismk.common.prefix_lookup import PrefixLookup
+from ismk.io import IOFile, Log, OutputFiles
 from ismk.output_index import OutputIndex
+from ismk.rules import Rule
 
 
 @pytest.fixture()
@@ -155,3 +158,117 @@ def test_parametrized_matches(mocker, target, expected_match):
     output_index = OutputIndex([rule])
     matches = output_index.match(target)
     assert (rule in matches) == expected_match
+
+
+def make_rule(name, *patterns, log=()):
+    rule = Rule(name, None, lineno=1, snakefile="Snakefile")
+    rule._output = OutputFiles(map(IOFile, patterns))
+    rule._log = Log(map(IOFile, log))
+    for item in rule.output:
+        rule.register_wildcards(item)
+    return rule
+
+
+@pytest.fixture()
+def real_rules():
+    return [
+        make_rule("plain", "results/{sample}.txt"),
+        make_rule("constrained", "results/{sample,[a-z]+}.txt"),
+        make_rule(
+            "nested",
+            "results/{sample}/{unit}.txt",
+            "results/{sample}/{unit}.csv",
+            log=["logs/{sample}/{unit}.log"],
+        ),
+        make_rule("repeated", "results/{sample}/{sample}.txt"),
+        make_rule("ambiguous", "results/{a}.{b}.txt", "results/{a}.txt.{b}.txt"),
+        make_rule("no_wildcards", "results/all.txt"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "target",
+    [
+        "results/a.txt",
+        "results/a1.txt",
+        "results/a/b.txt",
+        "results/a/a.txt",
+        "results/a/b.csv",
+        "results/x.txt.y.txt",
+        "results/all.txt",
+        "logs/a/b.log",
+        "results/.txt",
+        "other/a.txt",
+    ],
+)
+def test_match_wildcards(real_rules, target):
+    output_index = OutputIndex(real_rules)
+    expected = {
+        rule: rule.get_wildcards(target)
+        for rule in real_rules
+        if rule.is_producer(target)
+    }
+    assert output_index.match_wildcards(target) == expected
+    assert output_index.match_producers(target) == set(expected)
+
+
+def test_match_wildcards_fallback():
+    # group references in constraints cannot be combined into a single pattern
+    ref = make_rule("ref", r"results/{sample,(a)\2}.txt")
+    plain = make_rule("plain", "results/{sample}.txt")
+    output_index = OutputIndex([ref, plain])
+    assert output_index.match_wildcards("results/aa.txt") == {ref: None, plain: None}
+    assert output_index.match_wildcards("results/ab.txt") == {plain: None}
+
+
+def test_match_wildcards_memoized(real_rules):
+    output_index = OutputIndex(real_rules)
+    first = output_index.match_wildcards("results/a/b.txt")
+    assert output_index.match_wildcards(IOFile("results/a/b.txt")) is first
+    assert output_index._resolve.cache_info().hits == 1
+    # unknown files are memoized as well
+    assert output_index.match_wildcards("other/a.txt") == {}
+    assert output_index.match_wildcards("other/a.txt") == {}
+    assert output_index._resolve.cache_info().hits == 2
+
+
+def test_match_per_rule():
+    """The combined matcher finds the same producers as the previous approach
+    of looking up candidates by prefix, filtering them by suffix and checking
+    each candidate rule via Rule.is_producer and Rule.get_wildcards (see
+    benchmarks/output_index.py for their speed)."""
+    rules = [
+        make_rule(
+            f"step{i}",
+            f"results/{{sample}}/{{unit}}.step{i}.txt",
+            f"results/{{sample}}/{{unit}}.step{i}.idx",
+        )
+        for i in range(5)
+    ] + [make_rule(f"any{i}", f"results/{{sample}}/{{name}}.{i}.txt") for i in range(5)]
+    targets = [
+        f"results/sample{j}/unit{j % 3}.step{i}.txt" for i in range(5) for j in range(3)
+    ]
+
+    lookup = PrefixLookup(
+        entries=[
+            (str(product.constant_prefix()), (rule, str(product.constant_suffix())))
+            for rule in rules
+            for product in rule.products()
+        ]
+    )
+
+    def reference(target):
+        candidates = {
+            rule
+            for _, (rule, suffix) in lookup.match_iter(target)
+            if target.endswith(suffix)
+        }
+        return {
+            rule: rule.get_wildcards(target)
+            for rule in candidates
+            if rule.is_producer(target)
+        }
+
+    output_index = OutputIndex(rules)
+    for target in targets:
+        assert output_index.match_wildcards(target) == reference(target)
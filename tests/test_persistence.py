@@ -1,8 +1,13 @@
 import tempfile
 from pathlib import Path
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
+import pytest
+
+from ismk.common import ON_WINDOWS
+from ismk.io import IOFile
 from ismk.persistence import Persistence
+from ismk.persistence_backends import METADATA
 
 
 class TestCleanupContainers:
@@ -50,3 +55,85 @@ rule foo:
 
             assert required_img_path.exists()
             assert not unrequired_img_path.exists()
+
+
+@pytest.fixture
+def persistence(tmp_path):
+    dag = MagicMock()
+    dag.workflow.dag_settings.max_checksum_file_size = 1000
+    dag.workflow.dag_settings.metadata_backend = None
+    return Persistence(dag=dag, path=tmp_path / ".ismk")
+
+
+def record_outputs(persistence, n):
+    files = [IOFile(f"results/{i}.txt") for i in range(n)]
+    for i, f in enumerate(files):
+        persistence._record(
+            METADATA,
+            {"rule": "step", "code": "shell('cat {input} > {output}')", "job": i},
+            f,
+        )
+    return files
+
+
+def test_preload_metadata(persistence):
+    files = record_outputs(persistence, 3)
+    missing = IOFile("results/missing.txt")
+
+    persistence.preload_metadata(files + [missing])
+    with patch.object(persistence._backend, "read", side_effect=AssertionError):
+        records = [persistence.metadata(f) for f in files]
+        assert persistence.metadata(missing) == {}
+    assert [record["job"] for record in records] == [0, 1, 2]
+    assert records[0]["rule"] == "step"
+    # equal values of decoded records are shared
+    assert records[0]["code"] is records[2]["code"]
+
+
+def test_preload_metadata_modified(persistence):
+    files = record_outputs(persistence, 2)
+    persistence.preload_metadata(files)
+    persistence._record(METADATA, {"rule": "other"}, files[0])
+    assert persistence._key(files[0]) not in persistence._preloaded
+    assert persistence._read_record_uncached(METADATA, files[0]) == {"rule": "other"}
+    assert persistence._read_record_uncached(METADATA, files[1])["job"] == 1
+
+
+def test_exclude_from_cache(persistence):
+    files = record_outputs(persistence, 2)
+    assert persistence.metadata(files[0])["job"] == 0
+    assert persistence.metadata(files[1])["job"] == 1
+    persistence.exclude_from_cache(files[:1])
+    persistence._record(METADATA, {"rule": "other"}, files[0])
+    persistence._record(METADATA, {"rule": "other"}, files[1])
+    assert persistence.metadata(files[0]) == {"rule": "other"}
+    # records of other files are still cached
+    assert persistence.metadata(files[1])["job"] == 1
+    persistence.preload_metadata(files)
+    assert persistence._key(files[0]) not in persistence._preloaded
+
+
+def test_preload_metadata_uncached(persistence):
+    files = record_outputs(persistence, 2)
+    persistence.deactivate_cache()
+    persistence.preload_metadata(files)
+    assert not persistence._preloaded
+    assert persistence.metadata(files[1])["job"] == 1
+
+
+@pytest.mark.skipif(ON_WINDOWS, reason="no journal on Windows")
+def test_close_journal_failure(persistence):
+    f = IOFile("results/a.txt")
+    persistence.open_journal()
+    record = persistence._encode_record({"rule": "step"})
+    with patch.object(
+        persistence._backend, "write_many", side_effect=OSError("disk full")
+    ):
+        persistence._journal.append([(persistence._key(f), record)], [])
+        # the error is logged instead of replacing the one of the scheduler
+        persistence.close_journal()
+    assert persistence._journal is None
+
+    # the journal is replayed by the next run
+    persistence = Persistence(dag=persistence.dag, path=persistence.path)
+    assert persistence.metadata(f) == {"rule": "step"}
@@ -0,0 +1,209 @@
+import json
+import os
+
+import pytest
+
+from ismk.common import ON_WINDOWS
+from ismk.exceptions import WorkflowError
+import ismk.persistence_backends
+from ismk.persistence_backends import (
+    INCOMPLETE,
+    JOURNAL_FILENAME,
+    METADATA,
+    SQLITE_FILENAME,
+    FileBackend,
+    MetadataJournal,
+    SqliteBackend,
+    create_metadata_backend,
+    migrate_metadata,
+    replay_journal,
+)
+
+KEYS = ["a.txt", "results/b.txt", "s3://bucket/c.txt", "long/" + "x" * 600]
+
+
+@pytest.fixture(params=["files", "sqlite"])
+def backend(request, tmp_path):
+    backend = create_metadata_backend(str(tmp_path), request.param)
+    yield backend
+    backend.close()
+
+
+def test_records(backend):
+    for i, key in enumerate(KEYS):
+        backend.write(METADATA, key, f'{{"i": {i}}}')
+    backend.write(INCOMPLETE, "a.txt", "{}", mtime=1000.0)
+
+    assert backend.read(METADATA, "results/b.txt") == '{"i": 1}'
+    assert backend.read(METADATA, "missing.txt") is None
+    assert backend.read_many(METADATA, KEYS + ["missing.txt"]) == {
+        key: f'{{"i": {i}}}' for i, key in enumerate(KEYS)
+    }
+    assert backend.read_many(METADATA, KEYS, n_threads=4) == {
+        key: f'{{"i": {i}}}' for i, key in enumerate(KEYS)
+    }
+    assert sorted(backend.keys(METADATA)) == sorted(KEYS)
+    assert list(backend.keys(INCOMPLETE)) == ["a.txt"]
+    assert backend.mtime(INCOMPLETE, "a.txt") == 1000.0
+    assert backend.mtime(INCOMPLETE, "results/b.txt") is None
+
+    backend.write(METADATA, "a.txt", '{"i": 4}')
+    assert backend.read(METADATA, "a.txt") == '{"i": 4}'
+    assert backend.delete(METADATA, KEYS[-1])
+    assert not backend.delete(METADATA, KEYS[-1])
+    assert not backend.exists(METADATA, KEYS[-1])
+    assert backend.exists(INCOMPLETE, "a.txt")
+
+    backend.clear()
+    assert list(backend.keys(METADATA)) == []
+
+
+def test_file_layout(tmp_path):
+    backend = FileBackend(str(tmp_path))
+    backend.write(METADATA, KEYS[-1], "{}")
+    # names that are too long are split into directories
+    path = backend.record_path(METADATA, KEYS[-1])
+    assert os.path.basename(os.path.dirname(path)).startswith("@")
+    assert os.path.exists(path)
+    # other files are not mistaken for records
+    (tmp_path / INCOMPLETE / "migration_underway").touch()
+    assert list(backend.keys(INCOMPLETE)) == []
+
+
+def test_migrate(tmp_path):
+    path = str(tmp_path)
+    backend = create_metadata_backend(path)
+    assert isinstance(backend, FileBackend)
+    for key in KEYS:
+        backend.write(METADATA, key, f'"{key}"')
+    backend.write(INCOMPLETE, "a.txt", "{}", mtime=1000.0)
+
+    backend, n = migrate_metadata(backend, path, "sqlite")
+    assert n == len(KEYS) + 1
+    assert isinstance(backend, SqliteBackend)
+    assert list(FileBackend(path).keys(METADATA)) == []
+    # the database is used from now on
+    backend.close()
+    backend = create_metadata_backend(path)
+    assert isinstance(backend, SqliteBackend)
+    assert backend.read_many(METADATA, KEYS) == {key: f'"{key}"' for key in KEYS}
+    assert backend.mtime(INCOMPLETE, "a.txt") == 1000.0
+
+    backend, n = migrate_metadata(backend, path, "files")
+    assert n == len(KEYS) + 1
+    assert not os.path.exists(os.path.join(path, SQLITE_FILENAME))
+    assert isinstance(create_metadata_backend(path), FileBackend)
+    assert backend.read(METADATA, KEYS[-1]) == f'"{KEYS[-1]}"'
+    assert backend.mtime(INCOMPLETE, "a.txt") == 1000.0
+
+
+def test_unknown_backend(tmp_path):
+    with pytest.raises(WorkflowError):
+        create_metadata_backend(str(tmp_path), "unknown")
+
+
+def test_durable_files(tmp_path, monkeypatch):
+    backend = FileBackend(str(tmp_path))
+    synced = []
+    monkeypatch.setattr(ismk.persistence_backends, "_fsync", synced.append)
+    items = [(key, "{}", None) for key in KEYS]
+    backend.write_many(METADATA, items)
+    assert not synced
+
+    backend.write_many(METADATA, items, durable=True)
+    paths = [backend.record_path(METADATA, key) for key in KEYS]
+    assert set(paths) <= set(synced)
+    # the new entries of the directories, including those of long names
+    assert str(tmp_path / METADATA) in synced
+    assert os.path.dirname(paths[-1]) in synced
+
+    synced.clear()
+    backend.delete_many(METADATA, KEYS, durable=True)
+    assert str(tmp_path / METADATA) in synced
+
+
+def test_durable_sqlite(tmp_path):
+    backend = SqliteBackend(str(tmp_path / SQLITE_FILENAME))
+    pragmas = []
+    backend._conn.set_trace_callback(
+        lambda statement: statement.startswith("PRAGMA") and pragmas.append(statement)
+    )
+    backend.write_many(METADATA, [("a.txt", "{}", None)])
+    assert pragmas == []
+    backend.write_many(METADATA, [("a.txt", "{}", None)], durable=True)
+    backend.delete_many(METADATA, ["a.txt"], durable=True)
+    assert pragmas == ["PRAGMA synchronous = FULL", "PRAGMA synchronous = NORMAL"] * 2
+    backend.close()
+
+
+@pytest.mark.skipif(ON_WINDOWS, reason="no journal on Windows")
+def test_journal_durable(backend, tmp_path, monkeypatch):
+    events = []
+
+    def traced(method):
+        orig = getattr(backend, method)
+
+        def wrapper(subject, keys, durable=False):
+            events.append((method, durable))
+            orig(subject, keys, durable=durable)
+
+        return wrapper
+
+    for method in ["write_many", "delete_many"]:
+        monkeypatch.setattr(backend, method, traced(method))
+    truncate = MetadataJournal._truncate
+    monkeypatch.setattr(
+        MetadataJournal,
+        "_truncate",
+        lambda self: events.append("truncate") or truncate(self),
+    )
+    journal = MetadataJournal(backend, str(tmp_path))
+    events.clear()
+    journal.append([("a.txt", '"a"')], ["a.txt"])
+    journal.flush()
+    # the journal is truncated once the changes are on disk
+    assert events == [("write_many", True), ("delete_many", True), "truncate"]
+    journal.close()
+
+
+@pytest.mark.skipif(ON_WINDOWS, reason="no journal on Windows")
+def test_journal(backend, tmp_path):
+    for key in KEYS:
+        backend.write(INCOMPLETE, key, "{}")
+    journal = MetadataJournal(backend, str(tmp_path))
+    for key in KEYS:
+        journal.append([(key, f'"{key}"')], [key])
+        # visible before being applied
+        assert journal.record(key) == f'"{key}"'
+        assert journal.is_done(key)
+    journal.flush()
+    assert not journal.is_pending(KEYS[0])
+    assert backend.read_many(METADATA, KEYS) == {key: f'"{key}"' for key in KEYS}
+    assert list(backend.keys(INCOMPLETE)) == []
+
+    # another process cannot use or replay the journal meanwhile
+    with pytest.raises(BlockingIOError):
+        MetadataJournal(backend, str(tmp_path))
+    assert replay_journal(backend, str(tmp_path)) == 0
+
+    journal.append([("a.txt", '"b"')], ["a.txt"])
+    journal.close()
+    assert backend.read(METADATA, "a.txt") == '"b"'
+    assert not os.path.exists(tmp_path / JOURNAL_FILENAME)
+
+
+@pytest.mark.skipif(ON_WINDOWS, reason="no journal on Windows")
+def test_journal_replay(backend, tmp_path):
+    for key in KEYS:
+        backend.write(INCOMPLETE, key, "{}")
+    # journal of a killed process, whose last entry has not been synced
+    with open(tmp_path / JOURNAL_FILENAME, "w") as f:
+        for key in KEYS[:2]:
+            print(json.dumps({"metadata": [[key, f'"{key}"']], "done": [key]}), file=f)
+        f.write('{"metadata": [["')
+
+    assert replay_journal(backend, str(tmp_path)) == 2
+    assert backend.read_many(METADATA, KEYS) == {key: f'"{key}"' for key in KEYS[:2]}
+    assert sorted(backend.keys(INCOMPLETE)) == sorted(KEYS[2:])
+    assert not os.path.exists(tmp_path / JOURNAL_FILENAME)
+    assert replay_journal(backend, str(tmp_path)) == 0
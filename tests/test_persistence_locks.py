@@ -0,0 +1,106 @@
+import pytest
+
+from ismk.exceptions import WorkflowError
+import ismk.persistence_locks
+from ismk.persistence_locks import (
+    _OFD,
+    BLOOM_MIN,
+    FileLocks,
+    fine_grained_locked,
+    intersects,
+    path_hash,
+    path_hashes,
+    write_manifest,
+    write_segment,
+)
+
+PATHS = [f"results/{i}.txt" for i in range(2 * BLOOM_MIN)]
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    path = tmp_path / "0.output.lock"
+    with open(path, "wb") as f:
+        # with Bloom filter
+        write_manifest(f, path_hashes(PATHS[:BLOOM_MIN]))
+    with open(path, "ab") as f:
+        # without Bloom filter, as appended when extending a lock
+        write_segment(f, path_hashes(PATHS[BLOOM_MIN : BLOOM_MIN + 10]))
+    return str(path)
+
+
+@pytest.mark.parametrize(
+    "paths,expected",
+    [
+        # few hashes are looked up in the Bloom filter
+        (["a.txt", PATHS[0]], True),
+        (["a.txt", PATHS[BLOOM_MIN - 1]], True),
+        (["a.txt", PATHS[BLOOM_MIN]], True),
+        (["a.txt", "b.txt"], False),
+        ([], False),
+        # many hashes are intersected with the whole segment
+        (PATHS[BLOOM_MIN + 5 :], True),
+        (PATHS[BLOOM_MIN + 10 :], False),
+        ([f"other/{i}.txt" for i in range(BLOOM_MIN)] + [PATHS[7]], True),
+    ],
+)
+def test_intersects(manifest, paths, expected):
+    assert intersects(manifest, path_hashes(paths)) == expected
+
+
+def test_incomplete_manifest(manifest, tmp_path):
+    # manifests are read while being written by another process
+    with open(manifest, "rb") as f:
+        data = f.read()
+    path = tmp_path / "1.output.lock"
+    for size in (0, 5, 20, 100, len(data) - 3):
+        path.write_bytes(data[:size])
+        assert not intersects(str(path), {path_hash(PATHS[-1])})
+
+
+def test_legacy_lock(tmp_path):
+    # lock files of older versions list one path per line
+    path = tmp_path / "0.input.lock"
+    path.write_text("a.txt\nresults/b.txt\n")
+    assert intersects(str(path), path_hashes(["results/b.txt"]))
+    assert not intersects(str(path), path_hashes(["b.txt"]))
+
+
+@pytest.mark.skipif(not _OFD, reason="no open file description locks")
+def test_file_locks(tmp_path):
+    path = str(tmp_path)
+    inputs = path_hashes(["a.txt", "b.txt"])
+    outputs = path_hashes(["c.txt"])
+    locks = FileLocks(path)
+    other = FileLocks(path)
+    # two jobs reading the same input
+    assert locks.acquire(inputs, outputs)
+    assert locks.acquire(path_hashes(["a.txt"]), path_hashes(["d.txt"]))
+    assert not other.acquire(set(), path_hashes(["a.txt"]))
+    assert not other.acquire(outputs, set())
+    # nothing is locked if any file is locked by another process
+    assert not other.acquire(path_hashes(["e.txt"]), path_hashes(["b.txt"]))
+    assert locks.acquire(set(), path_hashes(["e.txt"]))
+    locks.release(set(), path_hashes(["e.txt"]))
+    assert not fine_grained_locked(path, set(), path_hashes(["a.txt"]))
+    locks.announce()
+    assert fine_grained_locked(path, set(), path_hashes(["a.txt"]))
+    assert not fine_grained_locked(path, path_hashes(["a.txt", "f.txt"]), set())
+    # checking does not release the locks of other instances, or the own ones
+    assert not other.acquire(set(), path_hashes(["a.txt"]))
+    assert not locks.others_active()
+    assert other.others_active()
+
+    locks.release(inputs, outputs)
+    assert not other.acquire(set(), path_hashes(["a.txt"]))
+    assert other.acquire(set(), outputs | path_hashes(["b.txt"]))
+    locks.close()
+    assert other.acquire(set(), path_hashes(["a.txt", "d.txt"]))
+    other.close()
+
+
+def test_file_locks_unsupported(tmp_path, monkeypatch):
+    monkeypatch.setattr(ismk.persistence_locks, "_OFD", False)
+    with pytest.raises(WorkflowError):
+        FileLocks(str(tmp_path))
+    assert not fine_grained_locked(str(tmp_path), set(), path_hashes(["a.txt"]))
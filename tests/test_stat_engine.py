@@ -0,0 +1,70 @@
+import asyncio
+import os
+
+import pytest
+
+from ismk.common import ON_WINDOWS
+from ismk.io.stat_engine import StatEngine, local_mtime
+
+
+@pytest.fixture
+def tree(tmp_path):
+    many = tmp_path / "many"
+    many.mkdir()
+    for i in range(20):
+        (many / f"{i}.txt").write_text(str(i))
+    (tmp_path / "single.txt").write_text("single")
+    timestamped = tmp_path / "timestamped"
+    timestamped.mkdir()
+    (timestamped / ".ismk_timestamp").touch()
+    os.utime(timestamped / ".ismk_timestamp", (1, 1))
+    if not ON_WINDOWS:
+        (tmp_path / "link.txt").symlink_to(tmp_path / "single.txt")
+        (tmp_path / "broken.txt").symlink_to(tmp_path / "nonexistent.txt")
+    (tmp_path / "file").write_text("not a directory")
+    return tmp_path
+
+
+def test_local_mtime(tree):
+    mtime = os.stat(tree / "single.txt").st_mtime
+    assert local_mtime(str(tree / "single.txt")) == (mtime, None)
+    assert local_mtime(str(tree / "timestamped")) == (1, None)
+    with pytest.raises(FileNotFoundError):
+        local_mtime(str(tree / "nonexistent.txt"))
+    if not ON_WINDOWS:
+        link_mtime = os.lstat(tree / "link.txt").st_mtime
+        assert local_mtime(str(tree / "link.txt")) == (link_mtime, mtime)
+        with pytest.raises(FileNotFoundError):
+            local_mtime(str(tree / "broken.txt"))
+
+
+@pytest.mark.parametrize("min_scandir_files", [1, 8, 1000])
+def test_collect(tree, min_scandir_files):
+    paths = [str(tree / "many" / f"{i}.txt") for i in range(30)]
+    paths += [
+        str(tree / name)
+        for name in [
+            "single.txt",
+            "timestamped",
+            "nonexistent.txt",
+            "missing/a.txt",
+            "file/a.txt",
+            "link.txt",
+            "broken.txt",
+        ]
+    ]
+    engine = StatEngine(n_threads=4, min_scandir_files=min_scandir_files, chunksize=3)
+    mtimes = asyncio.run(engine.collect(paths))
+
+    assert set(mtimes) == set(paths)
+    for path, mtime in mtimes.items():
+        if os.path.exists(path):
+            assert mtime == local_mtime(path)
+        else:
+            assert mtime is None
+
+
+def test_collect_existing(tree):
+    path = str(tree / "single.txt")
+    mtimes = asyncio.run(StatEngine().collect([], existing=[path]))
+    assert mtimes == {path: local_mtime(path)}
@@ -0,0 +1,131 @@
+import os
+import re
+import time
+
+import pytest
+
+import ismk.io.walker
+from ismk.io import glob_wildcards, regex_from_filepattern
+from ismk.io.walker import ListingCache, can_match_slash, walk, walk_pattern
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for path in [
+        "data/a/reads/1.fq.gz",
+        "data/a/reads/2.fq.gz",
+        "data/a/other/1.fq.gz",
+        "data/b/reads/1.fq.gz",
+        "data/b/reads/deep/3.fq.gz",
+        "data/b/x.txt",
+        "unrelated/c/reads/1.fq.gz",
+        "top.txt",
+    ]:
+        path = tmp_path / path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+    (tmp_path / "data" / "c").symlink_to(tmp_path / "unrelated" / "c")
+    return tmp_path
+
+
+@pytest.mark.parametrize("followlinks", [False, True])
+@pytest.mark.parametrize("n_threads", [1, 4])
+def test_walk(tree, followlinks, n_threads):
+    expected = list(os.walk(tree, followlinks=followlinks))
+    assert (
+        list(walk(str(tree), followlinks=followlinks, n_threads=n_threads)) == expected
+    )
+    assert list(walk(str(tree / "missing"))) == []
+
+
+def test_walk_aborted(tree):
+    walked = walk(str(tree), n_threads=4)
+    next(walked)
+    walked.close()
+
+
+@pytest.mark.parametrize(
+    "constraint,expected",
+    [
+        (None, True),
+        (".*", True),
+        ("[^/]+", False),
+        (r"\w+", False),
+        (r"\d+|[a-z]+", False),
+        ("[a-z/]+", True),
+        ("(a|b/c)", True),
+        (r"\W", True),
+        ("[^a]", True),
+    ],
+)
+def test_can_match_slash(constraint, expected):
+    assert can_match_slash(constraint) == expected
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    [
+        "data/{sample}/reads/{lane}.fq.gz",
+        "data/{sample,[^/]+}/reads/{lane,[^/]+}.fq.gz",
+        "data/{sample}.txt",
+        "{sample,[a-z]+}/{name}",
+        "{name,[^/]+}.txt",
+        "data/{sample}/{sample}/{lane}",
+        "data/b/x.txt",
+    ],
+)
+@pytest.mark.parametrize("followlinks", [False, True])
+def test_walk_pattern(tree, monkeypatch, pattern, followlinks):
+    monkeypatch.chdir(tree)
+    regex = re.compile(regex_from_filepattern(pattern))
+    expected = [
+        os.path.normpath(os.path.join(dirpath, f))
+        for dirpath, dirnames, filenames in os.walk(".", followlinks=followlinks)
+        for f in filenames + dirnames
+    ]
+    paths = list(walk_pattern(pattern, followlinks=followlinks, n_threads=4))
+    assert set(paths) <= set(expected)
+    assert [p for p in paths if regex.match(p)] == [
+        p for p in expected if regex.match(p)
+    ]
+
+
+def test_pruning(tree, monkeypatch):
+    monkeypatch.chdir(tree)
+    paths = list(walk_pattern("data/{sample,[^/]+}/reads/{lane,[^/]+}.fq.gz"))
+    assert "data/a/other/1.fq.gz" not in paths
+    assert "data/b/reads/deep/3.fq.gz" not in paths
+    assert not any(path.startswith("unrelated") for path in paths)
+
+
+def test_cache(tree, tmp_path_factory, monkeypatch):
+    # listings with symlinks are not cached
+    (tree / "data" / "c").unlink()
+    monkeypatch.setattr(ismk.io.walker, "RACY_INTERVAL", 0)
+    path = str(tmp_path_factory.mktemp("cache") / "listings.sqlite")
+    expected = list(os.walk(tree))
+    assert list(walk(str(tree), cache=ListingCache(path))) == expected
+
+    # listings are reused without listing the directories again
+    def scandir(path):
+        raise AssertionError(f"{path} listed again")
+
+    monkeypatch.setattr(os, "scandir", scandir)
+    cache = ListingCache(path)
+    assert list(walk(str(tree), cache=cache)) == expected
+    monkeypatch.undo()
+
+    # modified directories are listed again
+    monkeypatch.setattr(ismk.io.walker, "RACY_INTERVAL", 0)
+    time.sleep(0.01)
+    (tree / "data" / "b" / "reads" / "deep" / "4.fq.gz").touch()
+    assert list(walk(str(tree), cache=cache)) == list(os.walk(tree))
+
+
+def test_glob_wildcards_cache(tree, monkeypatch):
+    monkeypatch.chdir(tree)
+    pattern = "data/{sample}/reads/{lane}.fq.gz"
+    expected = glob_wildcards(pattern)
+    assert glob_wildcards(pattern, cache=True) == expected
+    assert os.path.exists(ismk.io.walker.DEFAULT_CACHE_PATH)
+    assert glob_wildcards(pattern, cache=True) == expected
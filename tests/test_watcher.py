@@ -0,0 +1,92 @@
+import os
+import sys
+
+import pytest
+
+from ismk.io import IOCache
+from ismk.io.watcher import InotifyWatcher, PollingWatcher
+
+WATCHERS = [PollingWatcher]
+if sys.platform.startswith("linux"):
+    WATCHERS.append(InotifyWatcher)
+
+
+@pytest.fixture(params=WATCHERS)
+def cache(request, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data")
+    with open("data/a.txt", "w") as f:
+        f.write("a")
+    cache = IOCache(max_wait_time=10)
+    watcher = request.param(cache)
+    if isinstance(watcher, PollingWatcher):
+        # poll explicitly in the tests
+        watcher._stop.set()
+    cache.watch(watcher)
+    yield cache
+    cache.deactivate()
+
+
+def cached(cache, path, exists):
+    cache.track(path)
+    cache.exists_local[path] = exists
+
+
+def sync(cache):
+    if isinstance(cache.watcher, PollingWatcher):
+        cache.watcher.poll()
+    cache.sync()
+
+
+def test_created_and_deleted(cache):
+    cached(cache, "data/a.txt", True)
+    cached(cache, "data/b.txt", False)
+    cached(cache, "data/c.txt", False)
+    sync(cache)
+    assert "data/b.txt" in cache.exists_local
+
+    with open("data/b.txt", "w") as f:
+        f.write("b")
+    os.remove("data/a.txt")
+    sync(cache)
+    assert "data/a.txt" not in cache.exists_local
+    assert "data/b.txt" not in cache.exists_local
+    assert "data/c.txt" in cache.exists_local
+
+
+def test_modified(cache):
+    if isinstance(cache.watcher, PollingWatcher):
+        pytest.skip("in place modifications are not noticed by polling")
+    cached(cache, "data/a.txt", True)
+    with open("data/a.txt", "a") as f:
+        f.write("a")
+    sync(cache)
+    assert "data/a.txt" not in cache.exists_local
+
+
+def test_missing_directory(cache):
+    cached(cache, "results/sample/x.txt", False)
+    os.makedirs("results/sample")
+    sync(cache)
+    assert "results/sample/x.txt" not in cache.exists_local
+
+
+def test_listed_directory(cache):
+    cache.track("data", directory=True)
+    cache.exists_local["data/a.txt"] = True
+    cache.exists_local.has_inventory.add("data")
+    sync(cache)
+    assert "data" in cache.exists_local.has_inventory
+
+    with open("data/b.txt", "w") as f:
+        f.write("b")
+    sync(cache)
+    assert "data" not in cache.exists_local.has_inventory
+
+
+def test_moved_directory(cache):
+    cached(cache, "data/a.txt", True)
+    os.rename("data", "moved")
+    sync(cache)
+    assert "data/a.txt" not in cache.exists_local
+    assert cache.active
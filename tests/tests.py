@@ -9,10 +9,13 @@ import sys
 import subprocess as sp
 from pathlib import Path
 import tempfile
+import threading
+import time
 from unittest.mock import AsyncMock, patch
 
 import pytest
 from ismk.persistence import Persistence
+from ismk.persistence_locks import _OFD, path_hashes, write_manifest
 from ismk.resources import DefaultResources, GroupResources, is_ordinary_string
 from ismk.settings.enums import RerunTrigger
 
@@ -845,6 +848,42 @@ def test_issue612():
     run(dpath("test_issue612"), executor="dryrun")
 
 
+def test_deep_dag_chain():
+    # deeper than the recursion limit, DAG expansion must not recurse
+    run(dpath("test_deep_dag_chain"), executor="dryrun")
+
+
+def test_runaway_expansion(monkeypatch):
+    # fails instead of expanding forever
+    monkeypatch.setattr("ismk.dag.MAX_EXPANSION_DEPTH", 100)
+    run(dpath("test_runaway_expansion"), executor="dryrun", shouldfail=True)
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_expansion_concurrency(monkeypatch, concurrency):
+    exists = os.path.exists
+    lock = threading.Lock()
+    running = 0
+    max_running = 0
+
+    def slow_exists(path):
+        nonlocal running, max_running
+        if not str(path).startswith("data/"):
+            return exists(path)
+        with lock:
+            running += 1
+            max_running = max(max_running, running)
+        time.sleep(0.1)
+        with lock:
+            running -= 1
+        return exists(path)
+
+    monkeypatch.setattr(os.path, "exists", slow_exists)
+    run(dpath("test_expansion_concurrency"), max_expansion_concurrency=concurrency)
+    # the four inputs of rule aggregate that no rule produces are queried at once
+    assert max_running == concurrency
+
+
 def test_bash():
     run(dpath("test_bash"))
 
@@ -1250,6 +1289,10 @@ def test_checkpoints():
     run(dpath("test_checkpoints"))
 
 
+def test_checkpoints_incremental():
+    run(dpath("test_checkpoints_incremental"), cores=1)
+
+
 def test_checkpoints_dir():
     run(dpath("test_checkpoints_dir"))
 
@@ -1334,8 +1377,10 @@ def test_issue1281():
 @pytest.mark.skipif(
     ON_MACOS, reason="graphviz dot needs to be configured"
 )  # Error msg: Perhaps "dot -c" needs to be run (with installer's privileges) to register the plugins?
-def test_filegraph():
-    workdir = dpath("test_filegraph")
+def test_filegraph(tmp_path):
+    # run in a copy, such that no persistence or graphs are left in the fixture
+    workdir = str(tmp_path / "test_filegraph")
+    shutil.copytree(dpath("test_filegraph"), workdir)
     dot_path = os.path.join(workdir, "fg.dot")
     pdf_path = os.path.join(workdir, "fg.pdf")
 
@@ -2376,6 +2421,186 @@ def test_inventory_cache_with_dryrun_first(testdir, kwargs):
     run(dpath(testdir), **kwargs, tmpdir=tmpdir, trust_io_cache=True)
 
 
+@pytest.mark.parametrize(
+    "testdir,kwargs",
+    [
+        ("test02", {}),
+        ("test03", {"targets": ["test.out"]}),
+        ("test06", {"targets": ["test.bla.out"]}),
+        ("test07", {"targets": ["test.out", "test2.out"]}),
+    ],
+)
+def test_dag_snapshot_with_dryrun_first(testdir, kwargs):
+    tmpdir = run(
+        dpath(testdir),
+        executor="dryrun",
+        **kwargs,
+        dag_snapshot=True,
+        cleanup=False,
+        check_results=False,
+    )
+    assert os.path.exists(os.path.join(tmpdir, ".ismk/dag_snapshot/latest.pkl"))
+    run(dpath(testdir), **kwargs, tmpdir=tmpdir, dag_snapshot=True)
+
+
+def test_dag_snapshot_invalidation():
+    path = dpath("test_dag_snapshot")
+    # without the raw data, the snapshot records that from_scratch is selected
+    tmpdir = run(
+        path, executor="dryrun", dag_snapshot=True, cleanup=False, check_results=False
+    )
+    os.makedirs(os.path.join(tmpdir, "data"))
+    with open(os.path.join(tmpdir, "data/sample.raw"), "w") as f:
+        print("raw", file=f)
+    # the snapshot is outdated now, hence from_raw has to be selected
+    run(path, tmpdir=tmpdir, dag_snapshot=True)
+
+
+def test_pipelined_expansion():
+    run(dpath("test_pipelined_expansion"), pipelined_expansion=True)
+
+
+@pytest.mark.parametrize(
+    "testdir,kwargs",
+    [
+        ("test02", {}),
+        ("test03", {"targets": ["test.out"]}),
+        ("test06", {"targets": ["test.bla.out"]}),
+        ("test07", {"targets": ["test.out", "test2.out"]}),
+        ("test_checkpoints", {}),
+    ],
+)
+def test_pipelined_expansion_fallback(testdir, kwargs):
+    run(dpath(testdir), **kwargs, pipelined_expansion=True)
+
+
+def test_pipelined_expansion_missing_input():
+    run(
+        dpath("test_pipelined_expansion_missing_input"),
+        pipelined_expansion=True,
+        shouldfail=True,
+    )
+
+
+def test_checksum_algorithm():
+    path = dpath("test_checksum_algorithm")
+    tmpdir = run(path, checksum_algorithm="blake2b", cleanup=False)
+    mtime = os.path.getmtime(tmpdir / "out.txt")
+    # The input is newer but has the same content. Its checksum is compared with
+    # the algorithm of the record, hence nothing has to be done.
+    os.utime(tmpdir / "in.txt")
+    run(path, tmpdir=tmpdir, checksum_algorithm="sha256", cleanup=False)
+    assert os.path.getmtime(tmpdir / "out.txt") == mtime
+    shutil.rmtree(tmpdir, ignore_errors=ON_WINDOWS)
+
+
+@pytest.mark.parametrize("migrate", [False, True])
+def test_metadata_backend(migrate):
+    path = dpath("test_metadata_backend")
+    metadata_backend = None if migrate else "sqlite"
+    tmpdir = run(path, metadata_backend=metadata_backend, cleanup=False)
+    if migrate:
+        run(
+            path,
+            tmpdir=tmpdir,
+            migrate_metadata="sqlite",
+            check_results=False,
+            cleanup=False,
+        )
+    assert os.path.exists(tmpdir / ".ismk" / "metadata.sqlite")
+    mtime = os.path.getmtime(tmpdir / "out.txt")
+    # The record is found in the database, hence the unchanged input is detected
+    # by its checksum (the backend is detected automatically).
+    os.utime(tmpdir / "in.txt")
+    run(path, tmpdir=tmpdir, cleanup=False)
+    assert os.path.getmtime(tmpdir / "out.txt") == mtime
+    shutil.rmtree(tmpdir, ignore_errors=ON_WINDOWS)
+
+
+@pytest.mark.parametrize("legacy", [False, True])
+def test_lock_conflict(legacy):
+    path = dpath("test_lock_conflict")
+    tmpdir = run(path, cleanup=False)
+    lockfile = tmpdir / ".ismk" / "locks" / "0.input.lock"
+    # another process reads the output of this one
+    if legacy:
+        lockfile.write_text("in.txt\nout.txt\n")
+    else:
+        with open(lockfile, "wb") as f:
+            write_manifest(f, path_hashes(["in.txt", "out.txt"]))
+    run(path, tmpdir=tmpdir, forceall=True, shouldfail=True, cleanup=False)
+    # inputs can be shared
+    lockfile.unlink()
+    with open(tmpdir / ".ismk" / "locks" / "0.input.lock", "wb") as f:
+        write_manifest(f, path_hashes(["in.txt"]))
+    run(path, tmpdir=tmpdir, forceall=True, cleanup=False)
+    shutil.rmtree(tmpdir, ignore_errors=ON_WINDOWS)
+
+
+@pytest.mark.skipif(not _OFD, reason="no open file description locks")
+def test_fine_grained_locks():
+    path = dpath("test_fine_grained_locks")
+    tmpdir = run(path, fine_grained_locks=True, cleanup=False)
+    # another process with fine-grained locks writes the output
+    holder = sp.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import sys\n"
+            "from ismk.persistence_locks import FileLocks, path_hashes\n"
+            "locks = FileLocks(sys.argv[1])\n"
+            "locks.announce()\n"
+            "assert locks.acquire(set(), path_hashes(['out.txt']))\n"
+            "print('locked', flush=True)\n"
+            "sys.stdin.readline()\n",
+            str(tmpdir / ".ismk" / "filelocks"),
+        ],
+        stdin=sp.PIPE,
+        stdout=sp.PIPE,
+        text=True,
+    )
+    try:
+        assert holder.stdout.readline() == "locked\n"
+        # processes with classic locks fail
+        run(path, tmpdir=tmpdir, forceall=True, shouldfail=True, cleanup=False)
+        # processes with fine-grained locks wait for the release
+        released = time.time() + 2
+        threading.Timer(2, holder.stdin.close).start()
+        run(path, tmpdir=tmpdir, forceall=True, fine_grained_locks=True, cleanup=False)
+        assert os.path.getmtime(tmpdir / "out.txt") >= released
+    finally:
+        holder.kill()
+        holder.wait()
+    shutil.rmtree(tmpdir, ignore_errors=ON_WINDOWS)
+
+
+@skip_on_windows
+def test_metadata_journal():
+    path = dpath("test_metadata_journal")
+    tmpdir = run(path, metadata_journal=True, cleanup=False)
+    # all entries have been applied at the end of the run
+    assert not os.path.exists(tmpdir / ".ismk" / "metadata.journal")
+    mtime = os.path.getmtime(tmpdir / "out.txt")
+    os.utime(tmpdir / "in.txt")
+    run(path, tmpdir=tmpdir, cleanup=False)
+    assert os.path.getmtime(tmpdir / "out.txt") == mtime
+    shutil.rmtree(tmpdir, ignore_errors=ON_WINDOWS)
+
+
+@pytest.mark.parametrize(
+    "testdir,kwargs",
+    [
+        ("test01", {}),
+        ("test05", {}),
+        ("test_checkpoints", {}),
+        ("test_checkpoints_incremental", {"cores": 1}),
+        ("test_pipelined_expansion", {"pipelined_expansion": True}),
+    ],
+)
+def test_watch_io_cache(testdir, kwargs):
+    run(dpath(testdir), **kwargs, watch_io_cache=True)
+
+
 @skip_on_windows
 @pytest.mark.parametrize(
     "testdir,kwargs",